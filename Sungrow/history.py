@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""In-memory telemetry history for the agents.
+
+The agent records every heartbeat it builds (before report-by-exception),
+so the last HISTORY_HOURS of SOC, PV, grid and battery mode stay available
+without asking HA's recorder. Storage is a fixed ring of slots of
+HISTORY_RESOLUTION seconds, one array per channel: 48 h at 60 s is 2880
+slots, about 70 kB, allocated once at start. Power channels keep the mean
+of the samples in a slot, SOC and mode the last value. For power channels
+aggregate() also integrates energy: kwh_pos/kwh_neg are PV production, or
+grid import/export.
+
+Internal API: TelemetryHistory.record(), series(), aggregate(), summary().
+With HISTORY_PORT set, serve() answers read-only JSON on that port:
+
+    GET /                                channels, resolution, memory, span
+    GET /aggregates?window=6h            aggregate() of every channel
+    GET /series?channel=soc&window=2h    [[ts, value], ...]
+
+Windows are seconds or a number with s/m/h/d.
+
+Environment: HISTORY_HOURS (default 48), HISTORY_RESOLUTION (s, default
+60), HISTORY_PORT (0 = no endpoint), HISTORY_BIND (default 0.0.0.0).
+"""
+
+import json
+import math
+import os
+import threading
+import time
+import urllib.parse
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HISTORY_HOURS = float(os.environ.get("HISTORY_HOURS", "48"))
+HISTORY_RESOLUTION = int(os.environ.get("HISTORY_RESOLUTION", "60"))
+HISTORY_PORT = int(os.environ.get("HISTORY_PORT", "0") or 0)
+HISTORY_BIND = os.environ.get("HISTORY_BIND", "0.0.0.0")
+
+# heartbeat keys; power channels are averaged per slot
+POWER_CHANNELS = ("pv_power_w", "grid_power_w")
+CHANNELS = ("soc",) + POWER_CHANNELS + ("battery_mode",)
+
+NAN = float("nan")
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_window(value, default: float = 3600) -> float:
+    """'3600', '15m', '6h', '2d' -> seconds."""
+    if value in (None, ""):
+        return default
+    value = str(value).strip().lower()
+    if value[-1] in _UNITS:
+        seconds = float(value[:-1]) * _UNITS[value[-1]]
+    else:
+        seconds = float(value)
+    if not math.isfinite(seconds) or seconds < 0:
+        raise ValueError(f"window must be a finite number of seconds >= 0, not {value!r}")
+    return seconds
+
+
+class TelemetryHistory:
+    def __init__(self, hours: float = HISTORY_HOURS, resolution: int = HISTORY_RESOLUTION):
+        self.resolution = max(1, int(resolution))
+        self.size = max(1, int(hours * 3600 // self.resolution))
+        n = self.size
+        self._slot = array("q", [-1]) * n  # slot number held at each position
+        # samples averaged into each power channel's slot mean; per channel, since a
+        # heartbeat may carry PV without grid power or the other way round
+        self._count = {ch: array("H", [0]) * n for ch in POWER_CHANNELS}
+        self._values = {ch: array("f", [NAN]) * n for ch in CHANNELS[:-1]}
+        self._mode = array("b", [-1]) * n
+        self._lock = threading.Lock()
+        self.last_ts = None
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self._slot, self._mode, *self._count.values(), *self._values.values()]
+        return sum(a.itemsize * len(a) for a in arrays)
+
+    def record(self, heartbeat: dict, ts: float | None = None) -> None:
+        """One heartbeat (client_id, reported_at, soc, battery_mode, pv_power_w, grid_power_w)."""
+        ts = float(ts if ts is not None else heartbeat.get("reported_at") or time.time())
+        slot = int(ts // self.resolution)
+        pos = slot % self.size
+        with self._lock:
+            if self._slot[pos] != slot:
+                self._slot[pos] = slot
+                for c in self._count.values():
+                    c[pos] = 0
+                for a in self._values.values():
+                    a[pos] = NAN
+                self._mode[pos] = -1
+            for ch in POWER_CHANNELS:
+                v = heartbeat.get(ch)
+                if v is None:
+                    continue
+                c = self._count[ch]
+                n = c[pos] = min(c[pos] + 1, 65535)
+                a = self._values[ch]
+                a[pos] = float(v) if n == 1 else a[pos] + (float(v) - a[pos]) / n
+            if heartbeat.get("soc") is not None:
+                self._values["soc"][pos] = float(heartbeat["soc"])
+            mode = heartbeat.get("battery_mode")
+            if mode is not None and -128 <= int(mode) < 128:
+                self._mode[pos] = int(mode)
+            self.last_ts = ts
+
+    def _positions(self, seconds: float, now: float | None) -> list:
+        """[(slot, pos)] of the filled slots in the window, oldest first."""
+        now = time.time() if now is None else now
+        hi = int(now // self.resolution)
+        lo = max(hi - int(math.ceil(seconds / self.resolution)) + 1, hi - self.size + 1)
+        out = []
+        for slot in range(lo, hi + 1):
+            pos = slot % self.size
+            if self._slot[pos] == slot:
+                out.append((slot, pos))
+        return out
+
+    def series(self, channel: str, seconds: float, now: float | None = None) -> list:
+        """[(slot start ts, value)] for one channel; slots without a value are left out."""
+        if channel not in CHANNELS:
+            raise KeyError(channel)
+        with self._lock:
+            positions = self._positions(seconds, now)
+            if channel == "battery_mode":
+                return [(s * self.resolution, self._mode[p]) for s, p in positions if self._mode[p] >= 0]
+            a = self._values[channel]
+            return [(s * self.resolution, round(a[p], 2)) for s, p in positions if not math.isnan(a[p])]
+
+    def aggregate(self, channel: str, seconds: float, now: float | None = None) -> dict:
+        points = self.series(channel, seconds, now)
+        slots = max(1, int(math.ceil(seconds / self.resolution)))
+        out: dict = {"n": len(points), "coverage": round(min(1.0, len(points) / min(slots, self.size)), 3)}
+        if not points:
+            return out
+        if channel == "battery_mode":
+            seconds_in: dict = {}
+            changes = 0
+            for i, (_, m) in enumerate(points):
+                seconds_in[m] = seconds_in.get(m, 0) + self.resolution
+                if i and m != points[i - 1][1]:
+                    changes += 1
+            out.update(last=points[-1][1], changes=changes, seconds=seconds_in)
+            return out
+        values = [v for _, v in points]
+        i_min = min(range(len(values)), key=values.__getitem__)
+        i_max = max(range(len(values)), key=values.__getitem__)
+        (t0, first), (t1, last) = points[0], points[-1]
+        out.update(
+            min=round(values[i_min], 1),
+            min_at=points[i_min][0],
+            max=round(values[i_max], 1),
+            max_at=points[i_max][0],
+            mean=round(sum(values) / len(values), 1),
+            first=round(first, 1),
+            last=round(last, 1),
+            # ramp: change per hour between the first and last filled slot
+            per_hour=round((last - first) * 3600 / (t1 - t0), 1) if t1 > t0 else 0.0,
+        )
+        if channel in POWER_CHANNELS:
+            # slot means times slot length; gaps count as nothing
+            h = self.resolution / 3600 / 1000
+            out["kwh_pos"] = round(sum(v for v in values if v > 0) * h, 3)
+            out["kwh_neg"] = round(-sum(v for v in values if v < 0) * h, 3)
+        return out
+
+    def summary(self, seconds: float, now: float | None = None) -> dict:
+        return {
+            "window_s": seconds,
+            "resolution_s": self.resolution,
+            "channels": {ch: self.aggregate(ch, seconds, now) for ch in CHANNELS},
+        }
+
+    def info(self) -> dict:
+        with self._lock:
+            filled = [s for s in self._slot if s >= 0]
+        return {
+            "channels": list(CHANNELS),
+            "resolution_s": self.resolution,
+            "slots": self.size,
+            "hours": round(self.size * self.resolution / 3600, 2),
+            "bytes": self.nbytes,
+            "filled": len(filled),
+            "oldest": min(filled) * self.resolution if filled else None,
+            "last": self.last_ts,
+        }
+
+
+def make_handler(hist: TelemetryHistory):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send(self, code: int, body) -> None:
+            raw = json.dumps(body, separators=(",", ":")).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            q = dict(urllib.parse.parse_qsl(url.query))
+            try:
+                window = parse_window(q.get("window"))
+                if url.path in ("/", ""):
+                    self._send(200, hist.info())
+                elif url.path == "/aggregates":
+                    self._send(200, hist.summary(window))
+                elif url.path == "/series":
+                    self._send(200, hist.series(q.get("channel", "soc"), window))
+                else:
+                    self._send(404, {"error": "not found"})
+            except (KeyError, ValueError) as e:
+                self._send(400, {"error": f"bad request: {e}"})
+
+    return Handler
+
+
+def serve(hist: TelemetryHistory, port: int = HISTORY_PORT, bind: str = HISTORY_BIND, log=None):
+    """Start the read-only endpoint in a daemon thread; None if port is 0 or taken."""
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((bind, port), make_handler(hist))
+    except OSError as e:
+        if log:
+            log.warn("history", "cannot listen on %s:%s: %s", bind, port, e)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="history-http", daemon=True).start()
+    if log:
+        log.info("history", "telemetry history on http://%s:%s (%s slots of %ss)", bind, port, hist.size, hist.resolution)
+    return server
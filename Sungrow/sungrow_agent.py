@@ -1,11 +1,20 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import footprint  # first: times the imports below when STARTUP_REPORT=1
+
 import os
 import time
-import requests
 import traceback
 
+from agentlog import AgentLog, install_dump_signal
+from lite_http import http_client
+from reporting import ReportByException
+import diag
+import history
+import hotreload
+import mqttpush
+
 # ========================
 # Env configuration
 # ========================
@@ -30,6 +39,18 @@ HA_URL_ENV     = os.environ.get("HA_URL", DEFAULT_HA_URL)
 
 DISABLE_HA = os.environ.get("DISABLE_HA", "false").lower() in ("1", "true", "yes")
 
+# Optional MQTT push of actions (empty MQTT_HOST = HTTP polling only)
+MQTT_HOST          = os.environ.get("MQTT_HOST", "")
+MQTT_PORT          = int(os.environ.get("MQTT_PORT", "1883"))
+MQTT_USERNAME      = os.environ.get("MQTT_USERNAME", "")
+MQTT_PASSWORD      = os.environ.get("MQTT_PASSWORD", "")
+MQTT_TLS           = os.environ.get("MQTT_TLS", "false").lower() in ("1", "true", "yes")
+MQTT_TOPIC         = os.environ.get("MQTT_TOPIC", "metdezon/bms/{client_id}/action")
+# HTTP next_action becomes a slow consistency check while MQTT is connected
+MQTT_POLL_INTERVAL = int(os.environ.get("MQTT_POLL_INTERVAL", "600"))
+# Retained actions older than this (by their issued_at) are ignored
+MQTT_MAX_AGE       = int(os.environ.get("MQTT_MAX_AGE", "900"))
+
 # Entities / scripts from modbus_sungrow.yaml we use to control the inverter
 FORCED_POWER_ENTITY = os.environ.get("FORCED_POWER_ENTITY", "input_number.set_sg_forced_charge_discharge_power")
 EMS_MODE_INPUT      = os.environ.get("EMS_MODE_INPUT", "input_select.set_sg_ems_mode")
@@ -45,8 +66,43 @@ HEADERS_EXT = {"X-API-Key": API_KEY} if API_KEY else {}
 # Helpers
 # ========================
 
-def log(msg: str):
-    print(f"[Sungrow] {msg}", flush=True)
+LOG = AgentLog("Sungrow", debug=DEBUG)
+RBE = ReportByException()  # TEL_RBE / TEL_DEADBANDS / TEL_MAX_SILENCE
+HTTP = http_client()  # lite_http, or requests with HTTP_CLIENT=requests
+DIAG = diag.Diagnostics(LOG)  # span traces + sampling profiler (DIAGNOSTICS / SIGUSR2)
+HISTORY = history.TelemetryHistory()  # last HISTORY_HOURS of heartbeats in memory (HISTORY_PORT)
+
+# Options that take effect without a restart (hotreload.py):
+# option -> (global, or $ENV var, type, run.sh default)
+RELOADABLE = {
+    "api_url":               ("API_URL", str, "https://api.metdezon.nl/bms/api/next_action.php"),
+    "api_key":               ("API_KEY", str, ""),
+    "telemetry_url":         ("TEL_URL", str, ""),
+    "poll_interval":         ("INTERVAL", int, 60),
+    "debug":                 ("DEBUG", hotreload.as_bool, False),
+    "soc_entity":            ("SOC_ENTITY", str, "sensor.battery_level"),
+    "mode_entity":           ("MODE_ENTITY", str, ""),
+    "pv_entity":             ("PV_ENTITY", str, "sensor.total_dc_power"),
+    "grid_entity":           ("GRID_ENTITY", str, "sensor.meter_active_power"),
+    "ha_url":                ("HA_URL_ENV", str, DEFAULT_HA_URL),
+    "ha_token":              ("$HA_TOKEN", str, ""),
+    "client_id":             ("CLIENT_ID", str, ""),
+    "mqtt_host":             ("MQTT_HOST", str, ""),
+    "mqtt_port":             ("MQTT_PORT", int, 1883),
+    "mqtt_username":         ("MQTT_USERNAME", str, ""),
+    "mqtt_password":         ("MQTT_PASSWORD", str, ""),
+    "mqtt_tls":              ("MQTT_TLS", hotreload.as_bool, False),
+    "mqtt_topic":            ("MQTT_TOPIC", str, "metdezon/bms/{client_id}/action"),
+    "mqtt_poll_interval":    ("MQTT_POLL_INTERVAL", int, 600),
+    "report_by_exception":   ("$TEL_RBE", hotreload.as_bool, False),
+    "telemetry_deadbands":   ("$TEL_DEADBANDS", str, ""),
+    "telemetry_max_silence": ("$TEL_MAX_SILENCE", int, 900),
+    "http_client":           ("$HTTP_CLIENT", str, "lite"),
+    "power_watt":            ("POWER", int, 2000),
+}
+
+def log(msg: str, cat: str = "main"):
+    LOG.info(cat, msg)
 
 def ha_base_url() -> str:
     url = HA_URL_ENV.rstrip("/")
@@ -61,52 +117,52 @@ def get_ha_token() -> str | None:
             return v
     return None
 
+@DIAG.traced("ha.get", info_arg=0, ok=lambda r: r is not None)
 def ha_get_state(entity_id: str):
     if DISABLE_HA or not entity_id:
         return None
     token = get_ha_token()
     if not token:
-        log("ERROR: no Home Assistant token in env (SUPERVISOR_TOKEN/HASSIO_TOKEN/HA_TOKEN).")
-        log("If running outside Supervisor, export HA_URL and HA_TOKEN (Long-Lived Access Token).")
+        LOG.warn("ha", "no Home Assistant token in env (SUPERVISOR_TOKEN/HASSIO_TOKEN/HA_TOKEN).")
+        LOG.warn("ha", "If running outside Supervisor, export HA_URL and HA_TOKEN (Long-Lived Access Token).")
         return None
     url = f"{ha_base_url()}/states/{entity_id}"
     headers = {"Authorization": f"Bearer {token}"}
     try:
-        r = requests.get(url, headers=headers, timeout=5)
+        r = HTTP.get(url, headers=headers, timeout=5)
         if r.status_code == 200:
             return r.json()
         else:
-            if DEBUG:
-                log(f"HA GET {entity_id} -> {r.status_code} {r.text[:200]}")
+            if LOG.recording:
+                LOG.debug("ha", "GET %s -> %s %s", entity_id, r.status_code, r.text[:200])
     except Exception as e:
-        if DEBUG:
-            log(f"HA GET {entity_id} error: {e}")
+        LOG.debug("ha", "GET %s error: %s", entity_id, e)
     return None
 
+@DIAG.traced("ha.service", info_arg=1)
 def ha_call_service(domain: str, service: str, data: dict):
     if DISABLE_HA:
-        if DEBUG:
-            log(f"DISABLE_HA=1, not calling {domain}.{service}")
+        LOG.debug("ha", "DISABLE_HA=1, not calling %s.%s", domain, service)
         return
 
     token = get_ha_token()
     if not token:
-        log("ERROR: cannot call HA service; no token present.")
+        LOG.warn("ha", "cannot call HA service; no token present.")
         return
 
     url = f"{ha_base_url()}/services/{domain}/{service}"
     headers = {"Authorization": f"Bearer {token}"}
 
     try:
-        if DEBUG:
-            log(f"HA service {domain}.{service} data={data}")
-        r = requests.post(url, headers=headers, json=data, timeout=10)
-        if DEBUG:
-            log(f"HA service -> {r.status_code} {r.text[:200]}")
+        LOG.debug("ha", "service %s.%s data=%s", domain, service, data)
+        r = HTTP.post(url, headers=headers, json=data, timeout=10)
+        if LOG.recording:
+            LOG.debug("ha", "service -> %s %s", r.status_code, r.text[:200])
         r.raise_for_status()
     except Exception as e:
-        log(f"HA service {domain}.{service} error: {e}")
+        LOG.warn("ha", "service %s.%s error: %s", domain, service, e)
 
+@DIAG.traced("telemetry")
 def read_from_home_assistant():
     out: dict = {}
 
@@ -150,27 +206,27 @@ def read_from_home_assistant():
 
     return out
 
-def upload_telemetry(payload: dict):
+@DIAG.traced("upload", ok=bool)
+def upload_telemetry(payload: dict) -> bool:
     if not TEL_URL:
-        if DEBUG:
-            log("No TELEMETRY_URL configured; skipping telemetry")
-        return
+        LOG.debug("http", "No TELEMETRY_URL configured; skipping telemetry")
+        return False
     try:
-        if DEBUG:
-            log(f"POST {TEL_URL} -> {payload}")
-        r = requests.post(TEL_URL, headers=HEADERS_EXT, json=payload, timeout=10, verify=VERIFY_SSL)
-        if DEBUG:
-            log(f"TEL HTTP {r.status_code} {r.text[:200]}")
+        LOG.debug("http", "POST %s -> %s", TEL_URL, payload)
+        r = HTTP.post(TEL_URL, headers=HEADERS_EXT, json=payload, timeout=10, verify=VERIFY_SSL)
+        if LOG.recording:
+            LOG.debug("http", "TEL HTTP %s %s", r.status_code, r.text[:200])
         r.raise_for_status()
+        return True
     except Exception as e:
-        log(f"Telemetry upload error: {e}")
+        LOG.warn("http", "Telemetry upload error: %s", e)
+        return False
 
+@DIAG.traced("fetch")
 def fetch_next_action() -> tuple[int, int]:
-    if DEBUG:
-        log(f"HTTP GET {API_URL} (verify_ssl={VERIFY_SSL}) …")
-    r = requests.get(API_URL, headers=HEADERS_EXT, timeout=10, verify=VERIFY_SSL)
-    if DEBUG:
-        log(f"HTTP {r.status_code}, len={len(r.content)}")
+    LOG.debug("http", "GET %s (verify_ssl=%s)", API_URL, VERIFY_SSL)
+    r = HTTP.get(API_URL, headers=HEADERS_EXT, timeout=10, verify=VERIFY_SSL)
+    LOG.debug("http", "HTTP %s, len=%s", r.status_code, len(r.content))
     r.raise_for_status()
     data = r.json()
     mode = int(str(data.get("mode", -1)))
@@ -181,6 +237,7 @@ def fetch_next_action() -> tuple[int, int]:
 # Control logic for Sungrow
 # ========================
 
+@DIAG.traced("apply", info_arg=0)
 def apply_server_mode(server_mode: int, server_power: int):
     # Meaning of server_mode is kept consistent with the GoodWe agent:
     #   1 = standby / idle (self-consumption)
@@ -190,14 +247,14 @@ def apply_server_mode(server_mode: int, server_power: int):
 
     # If HA integration is disabled we cannot control the inverter.
     if DISABLE_HA:
-        log("DISABLE_HA=1, skipping inverter control")
+        log("DISABLE_HA=1, skipping inverter control", "control")
         return
 
     effective_power = server_power if server_power > 0 else POWER
 
     if server_mode in (1, 7):
         # self consumption: let Sungrow manage on its own
-        log("Set Sungrow to self-consumption mode")
+        log("Set Sungrow to self-consumption mode", "control")
         if SCRIPT_SELF_CONS:
             ha_call_service("script", "turn_on", {"entity_id": SCRIPT_SELF_CONS})
         else:
@@ -218,9 +275,9 @@ def apply_server_mode(server_mode: int, server_power: int):
     elif server_mode == 3:
         # forced charge
         if effective_power <= 0:
-            log("Charge mode requested but no power_watt > 0 supplied; skipping change.")
+            log("Charge mode requested but no power_watt > 0 supplied; skipping change.", "control")
             return
-        log(f"Set Sungrow to forced charge at {effective_power} W")
+        log(f"Set Sungrow to forced charge at {effective_power} W", "control")
 
         if FORCED_POWER_ENTITY:
             ha_call_service(
@@ -248,9 +305,9 @@ def apply_server_mode(server_mode: int, server_power: int):
     elif server_mode == 4:
         # forced discharge / export
         if effective_power <= 0:
-            log("Discharge mode requested but no power_watt > 0 supplied; skipping change.")
+            log("Discharge mode requested but no power_watt > 0 supplied; skipping change.", "control")
             return
-        log(f"Set Sungrow to forced discharge at {effective_power} W")
+        log(f"Set Sungrow to forced discharge at {effective_power} W", "control")
 
         if FORCED_POWER_ENTITY:
             ha_call_service(
@@ -276,7 +333,69 @@ def apply_server_mode(server_mode: int, server_power: int):
                 )
 
     else:
-        log(f"Unknown server mode {server_mode}; not changing Sungrow mode.")
+        log(f"Unknown server mode {server_mode}; not changing Sungrow mode.", "control")
+
+# ========================
+# MQTT push (optional)
+# ========================
+# The backend publishes the next_action JSON for each client on a retained
+# topic. A pushed action is applied as soon as it arrives; polling keeps going
+# at MQTT_POLL_INTERVAL while the broker is connected, INTERVAL otherwise.
+
+PUSH = mqttpush.ActionPush(LOG, MQTT_MAX_AGE)
+
+def mqtt_start():
+    if not MQTT_HOST:
+        return
+    if not CLIENT_ID:
+        LOG.warn("mqtt", "MQTT_HOST set but no CLIENT_ID for the topic; HTTP polling only")
+        return
+    PUSH.start(
+        MQTT_HOST,
+        MQTT_PORT,
+        MQTT_TOPIC.format(client_id=CLIENT_ID),
+        client_id=f"metdezon-{CLIENT_ID}",
+        username=MQTT_USERNAME,
+        password=MQTT_PASSWORD,
+        tls=MQTT_TLS,
+    )
+
+def poll_interval() -> int:
+    if PUSH.connected:
+        return max(INTERVAL, MQTT_POLL_INTERVAL)
+    return INTERVAL
+
+def wait_for_push(timeout: float) -> tuple[int, int] | None:
+    """Sleep up to timeout; return a pushed action as soon as one arrives."""
+    return PUSH.wait(timeout)
+
+def mqtt_stop():
+    PUSH.stop()
+
+
+def reload_options(watcher: hotreload.OptionsWatcher) -> None:
+    """Apply changed options between cycles; rebuild only what depends on them."""
+    global HEADERS_EXT, RBE, HTTP
+    changes = watcher.changes()
+    if not changes:
+        return
+    applied, restart = hotreload.apply(changes, RELOADABLE, globals())
+    if "API_KEY" in applied:
+        HEADERS_EXT = {"X-API-Key": API_KEY} if API_KEY else {}
+    if "DEBUG" in applied:
+        LOG.set_debug(DEBUG)
+    if {"$TEL_RBE", "$TEL_DEADBANDS", "$TEL_MAX_SILENCE"} & set(applied):
+        RBE = ReportByException()
+    if "$HTTP_CLIENT" in applied:
+        HTTP = http_client(os.environ.get("HTTP_CLIENT"))
+    if any(n.startswith("MQTT_") for n in applied) or "CLIENT_ID" in applied:
+        mqtt_stop()
+        mqtt_start()
+    # option names only: values may be passwords
+    log(f"Options reloaded: {', '.join(k for k in sorted(changes) if k not in restart) or '-'}")
+    if restart:
+        LOG.warn("main", "Changed options that need an add-on restart: %s", ", ".join(restart))
+
 
 # ========================
 # Main loop
@@ -284,31 +403,61 @@ def apply_server_mode(server_mode: int, server_power: int):
 
 def loop():
     token_present = bool(get_ha_token())
+    install_dump_signal()
     log(f"Agent up. verify_ssl={VERIFY_SSL} debug={DEBUG}")
     log(f"HA_URL={ha_base_url()} token_present={token_present} disable_ha={DISABLE_HA}")
 
+    startup_reported = False
+    watcher = None
+    if hotreload.OPTIONS_RELOAD:
+        watcher = hotreload.OptionsWatcher()
+        watcher.install_signal(wake=PUSH.wake)
+    DIAG.install_signal()
+    if diag.DIAGNOSTICS:
+        DIAG.start()
+
+    history.serve(HISTORY, log=LOG)
+    mqtt_start()
+    next_poll = 0.0
+    last_action = None
+
     while True:
+        pushed = wait_for_push(max(0.0, next_poll - time.monotonic()))
+        if watcher is not None:
+            try:
+                reload_options(watcher)
+            except Exception as e:
+                LOG.error("main", "options reload failed: %s", e)
+        if pushed is not None and pushed == last_action:
+            continue
+        DIAG.begin()
         try:
-            # 1) Get next action from EMS
-            server_mode, server_power = fetch_next_action()
-            if DEBUG:
-                log(f"server_mode={server_mode}, server_power={server_power}")
+            if pushed is not None:
+                server_mode, server_power = pushed
+                log(f"MQTT push: mode={server_mode} power={server_power}", "control")
+            else:
+                next_poll = time.monotonic() + poll_interval()
+                # 1) Get next action from EMS
+                server_mode, server_power = fetch_next_action()
+            last_action = (server_mode, server_power)
+            LOG.debug("cycle", "server_mode=%s, server_power=%s", server_mode, server_power)
 
             apply_server_mode(server_mode, server_power)
 
             # 2) Read telemetry from HA and upload heartbeat
             tel = read_from_home_assistant() if not DISABLE_HA else {}
             if tel:
-                if "soc_pct" in tel:
-                    log(f"SOC from HA: {tel['soc_pct']}%")
-                if "mode" in tel:
-                    mode_names = {1: "Auto/Standby", 2: "Charge", 3: "Discharge"}
-                    m = tel["mode"]
-                    log(f"Mode from HA: {m} ({mode_names.get(m, 'Unknown')})")
-                if "pv_power_w" in tel:
-                    log(f"PV power from HA: {tel['pv_power_w']} W")
-                if "grid_power_w" in tel:
-                    log(f"Grid power from HA: {tel['grid_power_w']} W")
+                # one rate-limited line per cycle (LOG_RATE "telemetry")
+                mode_names = {1: "Auto/Standby", 2: "Charge", 3: "Discharge"}
+                LOG.info(
+                    "telemetry",
+                    "From HA: SOC=%s%% mode=%s (%s) PV=%sW grid=%sW",
+                    tel.get("soc_pct"),
+                    tel.get("mode"),
+                    mode_names.get(tel.get("mode"), "Unknown"),
+                    tel.get("pv_power_w"),
+                    tel.get("grid_power_w"),
+                )
 
             heartbeat = {
                 "client_id": CLIENT_ID,
@@ -320,16 +469,29 @@ def loop():
                 "grid_power_w": tel.get("grid_power_w") if tel else None,
             }
 
+            # local history keeps every cycle, also the ones report-by-exception skips
+            HISTORY.record(heartbeat)
+
             # drop None fields except battery_mode (keep it always)
             payload = {k: v for k, v in heartbeat.items() if v is not None or k == "battery_mode"}
-            upload_telemetry(payload)
+            # report-by-exception: only changes beyond the deadbands, plus a keep-alive
+            payload = RBE.filter(payload)
+            if payload is None:
+                LOG.debug("telemetry", "No significant change; heartbeat skipped (%s in a row)", RBE.skipped)
+            elif upload_telemetry(payload):
+                RBE.sent(payload)
 
         except Exception as e:
-            log(f"ERROR: {e}")
+            DIAG.fail(e)
+            LOG.error("cycle", "%s", e)
             if DEBUG:
                 traceback.print_exc()
+        DIAG.end()
 
-        time.sleep(INTERVAL)
+        if not startup_reported:
+            startup_reported = True
+            LOG.info("startup", "%s", footprint.report())
+            footprint.stop()
 
 if __name__ == "__main__":
     loop()
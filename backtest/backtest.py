@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Offline backtest of battery mode policies.
+
+Replays a day-ahead price series (dwars-epex API JSON or CSV) and recorded
+telemetry (PV, grid, optionally load and the server's battery_mode) against
+a simple battery model, for many policy parameter sets at once. Policies
+are expressed in the agents' server mode codes: 7 self-consumption,
+3 forced charge, 4 forced discharge, 1 self-consumption (GoodWe/Sungrow)
+or hold (Enphase, --mode1 hold).
+
+All parameter sets and all days are simulated together as (P, D) numpy
+arrays; only the steps within one day are a Python loop. SOC carry-over
+between days is resolved by re-running that day pass with every day's start
+SOC taken from the previous day's end, until the start SOCs stop changing.
+
+    # demo on synthetic data: a year of quarter-hours, ~700 parameter sets
+    python3 backtest.py --synthetic 365 --policy self,threshold,rank \\
+        --low=-0.05:0.15:0.01 --high 0.15:0.40:0.01
+
+    # recorded data: dwars-epex snapshots and heartbeats (JSON lines)
+    python3 backtest.py --prices epex/*.json --telemetry heartbeats.jsonl \\
+        --policy server,self,threshold --capacity 10 --max-power 5
+
+Telemetry columns (CSV header or JSON keys): timestamp|reported_at,
+pv_power_w, grid_power_w (positive = import, see --grid-export-positive),
+optional load_w and battery_mode. Without load_w the load is taken as
+pv + grid, which is only exact for periods where the battery was idle.
+
+Needs numpy.
+"""
+
+import argparse
+import csv
+import json
+import sys
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+POLICIES = ("idle", "self", "server", "threshold", "rank")
+
+# internal code for "battery does nothing"; not an agent mode
+IDLE = 0
+
+
+def log(msg: str) -> None:
+    print(f"[Backtest] {msg}", file=sys.stderr, flush=True)
+
+
+# ========================
+# Input
+# ========================
+
+
+def to_epoch(value, tz) -> float | None:
+    """Epoch s/ms or ISO string (naive = tz) to epoch seconds."""
+    if isinstance(value, (int, float)):
+        return value / 1000 if value > 1e11 else float(value)
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        return to_epoch(float(value), tz)
+    except ValueError:
+        pass
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00").replace(" ", "T"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=tz)
+    return dt.timestamp()
+
+
+def _price_pairs(doc) -> list:
+    """(timestamp, price) pairs from one dwars-epex response (or a list of them)."""
+    if isinstance(doc, list):
+        return [p for d in doc for p in _price_pairs(d)]
+    if not isinstance(doc, dict):
+        return []
+    if isinstance(doc.get("timestamps"), list) and isinstance(doc.get("prices"), list):
+        return list(zip(doc["timestamps"], doc["prices"]))
+    return [
+        (row.get("timestamp", row.get("time", row.get("start"))), row.get("price"))
+        for row in doc.get("data") or []
+        if isinstance(row, dict)
+    ]
+
+
+def load_prices(paths: list, tz) -> tuple[np.ndarray, np.ndarray]:
+    points = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            if path.endswith(".csv"):
+                pairs = [(r.get("timestamp"), r.get("price")) for r in csv.DictReader(f)]
+            else:
+                pairs = _price_pairs(json.load(f))
+        for raw_ts, raw_price in pairs:
+            ts = to_epoch(raw_ts, tz)
+            try:
+                price = float(raw_price)
+            except (TypeError, ValueError):
+                continue
+            if ts is not None:
+                points[ts] = price  # later snapshots win
+    ts = np.array(sorted(points), dtype=np.float64)
+    return ts, np.array([points[t] for t in ts], dtype=np.float64)
+
+
+def _telemetry_rows(path: str):
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            yield from csv.DictReader(f)
+            return
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def load_telemetry(path: str, tz, grid_sign: float) -> dict:
+    cols = {k: [] for k in ("ts", "pv", "grid", "load", "mode")}
+
+    def num(row, key):
+        try:
+            return float(row[key])
+        except (KeyError, TypeError, ValueError):
+            return np.nan
+
+    for row in _telemetry_rows(path):
+        ts = to_epoch(row.get("timestamp", row.get("reported_at")), tz)
+        if ts is None:
+            continue
+        cols["ts"].append(ts)
+        cols["pv"].append(num(row, "pv_power_w") / 1000)
+        cols["grid"].append(grid_sign * num(row, "grid_power_w") / 1000)
+        cols["load"].append(num(row, "load_w") / 1000)
+        cols["mode"].append(num(row, "battery_mode"))
+    return {k: np.array(v, dtype=np.float64) for k, v in cols.items()}
+
+
+def synthetic(days: int, step: int, tz, seed: int = 1) -> tuple:
+    """Price curve with a morning/evening peak and a midday dip, PV bell, flat-ish load."""
+    rng = np.random.default_rng(seed)
+    start = datetime(2025, 1, 1, tzinfo=tz).timestamp()
+    ts = start + step * np.arange(days * 86400 // step)
+    hour = ((ts - start) % 86400) / 3600
+    doy = (ts - start) / 86400
+    season = 0.5 - 0.5 * np.cos(2 * np.pi * doy / 365)  # 0 winter .. 1 summer
+    day_level = np.repeat(rng.normal(0.10, 0.03, days), 86400 // step)
+    price = (
+        day_level
+        + 0.06 * np.exp(-((hour - 8) ** 2) / 3)
+        + 0.10 * np.exp(-((hour - 19) ** 2) / 4)
+        - 0.08 * season * np.exp(-((hour - 13.5) ** 2) / 6)
+        + rng.normal(0, 0.01, ts.size)
+    )
+    pv = np.clip(6 * (0.3 + 0.7 * season) * np.cos((hour - 13.5) / 5 * np.pi / 2), 0, None)
+    pv *= rng.uniform(0.4, 1.0, days).repeat(86400 // step)
+    load = 0.35 + 0.8 * np.exp(-((hour - 19) ** 2) / 5) + rng.gamma(1.0, 0.15, ts.size)
+    tel = {
+        "ts": ts,
+        "pv": pv,
+        "grid": load - pv,
+        "load": load,
+        "mode": np.where(price < np.quantile(price, 0.15), 3, np.where(price > np.quantile(price, 0.85), 4, 7)),
+    }
+    return ts, price, tel
+
+
+# ========================
+# Alignment on a (day, step) grid
+# ========================
+
+
+class Series:
+    """Prices and telemetry on a grid of D x S steps: 24 h days from the first local midnight
+    (DST shifts the later days by an hour; padded steps are masked)."""
+
+    def __init__(self, price_ts: np.ndarray, price: np.ndarray, tel: dict, step: int, tz):
+        if price_ts.size == 0:
+            raise ValueError("no prices")
+        first = datetime.fromtimestamp(price_ts[0], tz).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.t0 = first.timestamp()
+        self.step = step
+        self.dt = step / 3600.0  # hours per step
+        self.S = 86400 // step
+        n = int((price_ts[-1] - self.t0) // step) + 1
+        self.D = -(-n // self.S)
+        T = self.D * self.S
+
+        def bucket(ts, values):
+            idx = ((ts - self.t0) // step).astype(np.int64)
+            ok = (idx >= 0) & (idx < T) & ~np.isnan(values)
+            total = np.bincount(idx[ok], weights=values[ok], minlength=T)
+            count = np.bincount(idx[ok], minlength=T)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+
+        # hourly prices on a quarter-hour grid: carry each price forward
+        p = _ffill(bucket(price_ts, price))
+        pv = bucket(tel["ts"], tel["pv"])
+        grid = bucket(tel["ts"], tel["grid"])
+        load = bucket(tel["ts"], tel["load"])
+        load = np.where(np.isnan(load), pv + grid, load)
+        self.valid = ~np.isnan(p) & ~np.isnan(pv) & ~np.isnan(load)
+        missing = int(np.count_nonzero(~self.valid[: n]))
+        if missing:
+            log(f"{missing} of {n} steps without price or telemetry; treated as no flow")
+
+        shape = (self.D, self.S)
+        self.price = np.nan_to_num(p).reshape(shape)
+        self.pv = np.where(self.valid, np.nan_to_num(pv), 0.0).reshape(shape)
+        self.load = np.where(self.valid, np.nan_to_num(load), 0.0).reshape(shape)
+        self.valid = self.valid.reshape(shape)
+
+        mode = np.full(T, np.nan)
+        if tel["mode"].size and not np.all(np.isnan(tel["mode"])):
+            idx = ((tel["ts"] - self.t0) // step).astype(np.int64)
+            ok = (idx >= 0) & (idx < T) & np.isin(tel["mode"], (1, 3, 4, 7))
+            mode[idx[ok]] = tel["mode"][ok]  # last heartbeat in a step wins
+            # agents keep the previous mode until a new one arrives
+            mode = np.nan_to_num(_ffill(mode), nan=7)
+            self.server_mode = mode.astype(np.int8).reshape(shape)
+        else:
+            self.server_mode = None
+
+
+def _ffill(a: np.ndarray) -> np.ndarray:
+    idx = np.where(np.isnan(a), 0, np.arange(a.size))
+    np.maximum.accumulate(idx, out=idx)
+    out = a[idx]
+    return out
+
+
+# ========================
+# Policies -> modes (P, D, S), power (P,), labels
+# ========================
+
+
+def parse_range(spec: str) -> np.ndarray:
+    """'0.05' | '0.05,0.1' | 'start:stop:step' (stop inclusive)."""
+    if ":" in spec:
+        a, b, s = (float(x) for x in spec.split(":"))
+        return np.round(np.arange(a, b + s / 2, s), 6)
+    return np.array([float(x) for x in spec.split(",")])
+
+
+def policy_fixed(series: Series, mode: int, powers: np.ndarray, name: str):
+    modes = np.full((powers.size, series.D, series.S), mode, dtype=np.int8)
+    return modes, powers, [(name, f"power={p:g}kW") for p in powers]
+
+
+def policy_server(series: Series, powers: np.ndarray):
+    if series.server_mode is None:
+        raise ValueError("policy 'server' needs battery_mode in the telemetry")
+    modes = np.broadcast_to(series.server_mode, (powers.size, series.D, series.S))
+    return modes, powers, [("server", f"power={p:g}kW") for p in powers]
+
+
+def policy_threshold(series: Series, lows: np.ndarray, highs: np.ndarray, powers: np.ndarray):
+    """Charge at price <= low, discharge at price >= high, else self-consumption."""
+    lo, hi, pw = (g.ravel() for g in np.meshgrid(lows, highs, powers, indexing="ij"))
+    keep = lo < hi
+    lo, hi, pw = lo[keep], hi[keep], pw[keep]
+    price = series.price[None]
+    # int8 throughout: P x D x S gets large for a year of quarter-hours
+    modes = np.full((lo.size, series.D, series.S), 7, dtype=np.int8)
+    modes[price >= hi[:, None, None]] = 4
+    modes[price <= lo[:, None, None]] = 3
+    labels = [("threshold", f"low={a:g} high={b:g} power={p:g}kW") for a, b, p in zip(lo, hi, pw)]
+    return modes, pw, labels
+
+
+def policy_rank(series: Series, n_charge: np.ndarray, n_discharge: np.ndarray, powers: np.ndarray):
+    """Per day: charge in the n cheapest steps, discharge in the m most expensive."""
+    nc, nd, pw = (g.ravel() for g in np.meshgrid(n_charge, n_discharge, powers, indexing="ij"))
+    cheap = np.where(series.valid, series.price, np.inf).argsort(axis=1).argsort(axis=1)
+    dear = np.where(series.valid, -series.price, np.inf).argsort(axis=1).argsort(axis=1)
+    modes = np.full((nc.size, series.D, series.S), 7, dtype=np.int8)
+    modes[dear[None] < nd[:, None, None]] = 4
+    modes[cheap[None] < nc[:, None, None]] = 3
+    labels = [("rank", f"charge={int(a)} discharge={int(b)} power={p:g}kW") for a, b, p in zip(nc, nd, pw)]
+    return modes, pw, labels
+
+
+# ========================
+# Battery model
+# ========================
+
+
+class Battery:
+    def __init__(
+        self,
+        capacity_kwh: float,
+        max_power_kw: float,
+        efficiency: float = 0.92,
+        soc_min: float = 0.10,
+        soc_max: float = 1.0,
+        soc_start: float = 0.5,
+        mode1_hold: bool = False,
+    ):
+        self.capacity = capacity_kwh
+        self.max_power = max_power_kw
+        # round-trip efficiency split evenly over charge and discharge
+        self.eta = efficiency ** 0.5
+        self.soc_min = soc_min
+        self.soc_max = soc_max
+        self.soc_start = soc_start
+        self.mode1_hold = mode1_hold
+
+
+def _day_pass(series: Series, modes: np.ndarray, pmax: np.ndarray, start: np.ndarray, bat: Battery,
+              buy: np.ndarray, sell: np.ndarray) -> tuple:
+    """One pass over the S steps of every day; modes is (S, p, D), start (p, D)."""
+    dt, cap, eta = series.dt, bat.capacity, bat.eta
+    net = series.load - series.pv  # (D, S), positive = deficit
+    sc_dis = np.clip(net, 0, bat.max_power)
+    sc_chg = np.clip(-net, 0, bat.max_power)
+    soc = start.copy()
+    cost = np.zeros_like(soc)
+    imp = np.zeros_like(soc)
+    exp_ = np.zeros_like(soc)
+    dis_e = np.zeros_like(soc)
+    for s in range(series.S):
+        m = modes[s]
+        selfc = (m == 7) | ((m == 1) & ~bat.mode1_hold)
+        charge = np.where(m == 3, pmax, np.where(selfc | (m == 1), sc_chg[:, s], 0.0))
+        discharge = np.where(m == 4, pmax, np.where(selfc, sc_dis[:, s], 0.0))
+        # SOC limits (kW that fit in this step)
+        np.minimum(charge, (bat.soc_max - soc) * (cap / (dt * eta)), out=charge)
+        np.minimum(discharge, (soc - bat.soc_min) * (cap * eta / dt), out=discharge)
+        np.maximum(charge, 0, out=charge)
+        np.maximum(discharge, 0, out=discharge)
+        soc += (charge * eta - discharge / eta) * (dt / cap)
+        grid = (net[:, s] + charge - discharge) * series.valid[:, s]
+        gi = np.maximum(grid, 0) * dt
+        ge = np.maximum(-grid, 0) * dt
+        cost += gi * buy[:, s] - ge * sell[:, s]
+        imp += gi
+        exp_ += ge
+        dis_e += discharge
+    return soc, cost, imp, exp_, dis_e * (dt / eta)
+
+
+def simulate(series: Series, modes: np.ndarray, power: np.ndarray, bat: Battery, import_fee: float, export_fee: float,
+             max_passes: int = 0) -> dict:
+    """Run all P parameter sets over all D days. Returns per-set totals (P,)."""
+    P, D, S = modes.shape
+    # step-major so every per-step slice is contiguous
+    modes = np.ascontiguousarray(modes.transpose(2, 0, 1))
+    pmax = np.minimum(power, bat.max_power)[:, None]  # forced-mode power, (P, 1)
+    buy = series.price + import_fee
+    sell = series.price - export_fee
+
+    start = np.full((P, D), bat.soc_start)
+    out = [np.zeros((P, D)) for _ in range(4)]
+    rows = np.arange(P)
+    passes = max_passes or D
+    for n in range(1, passes + 1):
+        soc, *res = _day_pass(series, modes[:, rows], pmax[rows], start[rows], bat, buy, sell)
+        for total, part in zip(out, res):
+            total[rows] = part
+        # each day starts where the previous one ended; rerun only sets that moved
+        new_start = np.concatenate([np.full((rows.size, 1), bat.soc_start), soc[:, :-1]], axis=1)
+        moved = ~np.all(np.isclose(new_start, start[rows], rtol=0, atol=1e-6), axis=1)
+        start[rows] = new_start
+        rows = rows[moved]
+        if rows.size == 0:
+            break
+    cost, imp, exp_, dis_e = out
+
+    pv_e = float(series.pv.sum() * series.dt)
+    total_exp = exp_.sum(axis=1)
+    return {
+        "cost_eur": cost.sum(axis=1),
+        "import_kwh": imp.sum(axis=1),
+        "export_kwh": total_exp,
+        "cycles": dis_e.sum(axis=1) / bat.capacity,
+        "self_consumption": 1 - np.minimum(total_exp, pv_e) / pv_e if pv_e > 0 else np.full(P, np.nan),
+        "daily_cost": cost,
+        "passes": n,
+    }
+
+
+# ========================
+# Main
+# ========================
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--prices", nargs="+", help="dwars-epex JSON snapshots or timestamp,price CSV")
+    src.add_argument("--synthetic", type=int, metavar="DAYS", help="generate DAYS of demo data")
+    ap.add_argument("--telemetry", help="heartbeats as JSON lines or CSV")
+    ap.add_argument("--grid-export-positive", action="store_true", help="grid_power_w > 0 means export")
+    ap.add_argument("--tz", default="Europe/Amsterdam")
+    ap.add_argument("--step", type=int, default=900, help="simulation step in seconds (default 900)")
+
+    ap.add_argument("--policy", default="self,threshold", help=f"comma list of {', '.join(POLICIES)}")
+    ap.add_argument("--power", default="5", help="forced charge/discharge power in kW (range ok)")
+    ap.add_argument("--low", default="0:0.15:0.01", help="threshold: charge at price <= low (EUR/kWh)")
+    ap.add_argument("--high", default="0.15:0.40:0.01", help="threshold: discharge at price >= high")
+    ap.add_argument("--n-charge", default="0:16:2", help="rank: cheapest steps per day to charge in")
+    ap.add_argument("--n-discharge", default="0:16:2", help="rank: dearest steps per day to discharge in")
+
+    ap.add_argument("--capacity", type=float, default=10.0, help="usable kWh")
+    ap.add_argument("--max-power", type=float, default=5.0, help="inverter limit in kW")
+    ap.add_argument("--efficiency", type=float, default=0.92, help="round-trip")
+    ap.add_argument("--soc-min", type=float, default=0.10)
+    ap.add_argument("--soc-start", type=float, default=0.5)
+    ap.add_argument("--mode1", choices=("self", "hold"), default="self", help="meaning of mode 1 (Enphase: hold)")
+    ap.add_argument("--import-fee", type=float, default=0.15, help="tax + markup on top of spot, EUR/kWh")
+    ap.add_argument("--export-fee", type=float, default=0.02, help="deducted from spot on export, EUR/kWh")
+    ap.add_argument("--max-passes", type=int, default=0, help="SOC carry-over passes (0 = until converged)")
+
+    ap.add_argument("--top", type=int, default=10)
+    ap.add_argument("--csv", help="write all results to this file")
+    args = ap.parse_args()
+
+    tz = ZoneInfo(args.tz)
+    t_load = time.perf_counter()
+    if args.synthetic:
+        price_ts, price, tel = synthetic(args.synthetic, args.step, tz)
+    else:
+        price_ts, price = load_prices(args.prices, tz)
+        if not args.telemetry:
+            ap.error("--telemetry is required with --prices")
+        tel = load_telemetry(args.telemetry, tz, -1.0 if args.grid_export_positive else 1.0)
+    series = Series(price_ts, price, tel, args.step, tz)
+    log(f"{series.D} day(s) x {series.S} steps loaded in {time.perf_counter() - t_load:.2f}s")
+
+    bat = Battery(
+        args.capacity,
+        args.max_power,
+        efficiency=args.efficiency,
+        soc_min=args.soc_min,
+        soc_start=args.soc_start,
+        mode1_hold=args.mode1 == "hold",
+    )
+    powers = parse_range(args.power)
+    runs = [policy_fixed(series, IDLE, np.array([0.0]), "idle")]
+    for name in (p.strip() for p in args.policy.split(",")):
+        if name == "idle":
+            continue
+        if name == "self":
+            runs.append(policy_fixed(series, 7, np.array([args.max_power]), "self"))
+        elif name == "server":
+            runs.append(policy_server(series, powers))
+        elif name == "threshold":
+            runs.append(policy_threshold(series, parse_range(args.low), parse_range(args.high), powers))
+        elif name == "rank":
+            runs.append(policy_rank(series, parse_range(args.n_charge), parse_range(args.n_discharge), powers))
+        else:
+            ap.error(f"unknown policy {name!r}")
+
+    rows = []
+    t_sim = time.perf_counter()
+    for modes, power, labels in runs:
+        res = simulate(series, modes, power, bat, args.import_fee, args.export_fee, args.max_passes)
+        for i, (policy, params) in enumerate(labels):
+            rows.append(
+                {
+                    "policy": policy,
+                    "params": params,
+                    "cost_eur": float(res["cost_eur"][i]),
+                    "import_kwh": float(res["import_kwh"][i]),
+                    "export_kwh": float(res["export_kwh"][i]),
+                    "cycles": float(res["cycles"][i]),
+                    "self_consumption": float(res["self_consumption"][i]),
+                }
+            )
+    elapsed = time.perf_counter() - t_sim
+    log(f"{len(rows)} parameter set(s) simulated in {elapsed:.2f}s")
+
+    baseline = rows[0]["cost_eur"]
+    for r in rows:
+        r["savings_eur"] = baseline - r["cost_eur"]
+    if args.csv:
+        with open(args.csv, "w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=list(rows[0]))
+            w.writeheader()
+            w.writerows(rows)
+
+    ranked = sorted(rows[1:], key=lambda r: r["cost_eur"])
+    shown = [rows[0]] + ranked[: args.top]
+    print(f"{'policy':<10} {'params':<40} {'cost €':>9} {'saved €':>9} {'import':>8} {'export':>8} {'cycles':>7} {'self%':>6}")
+    for r in shown:
+        print(
+            f"{r['policy']:<10} {r['params']:<40} {r['cost_eur']:>9.2f} {r['savings_eur']:>9.2f} "
+            f"{r['import_kwh']:>8.0f} {r['export_kwh']:>8.0f} {r['cycles']:>7.1f} {100 * r['self_consumption']:>6.1f}"
+        )
+    # the server's own decisions next to the best alternative
+    for r in rows:
+        if r["policy"] == "server" and r not in shown:
+            print(f"{r['policy']:<10} {r['params']:<40} {r['cost_eur']:>9.2f} {r['savings_eur']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,765 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Time-accelerated soak test of a vendor agent on a virtual clock.
+
+Imports the agent of one add-on (goodwe, Sungrow or enphase) and runs its
+own loop() unchanged, with time.time/monotonic/sleep and the agent's wait
+event on a virtual clock: waiting for the next poll costs no real time, so
+weeks of operation take seconds. Around the agent:
+
+* a simulated backend: next_action from synthetic day-ahead prices per
+  slot (cheapest --n-charge slots per day forced charge, dearest
+  --n-discharge forced discharge, the rest self-consumption), telemetry
+  upload, optional error rate and MQTT push at slot boundaries (--push);
+* a simulated Home Assistant (GET /api/states, POST /api/services), the
+  GoodWe Modbus module (setmode) or the Envoy, depending on the vendor;
+* a battery/inverter model with SOC, power limit, efficiency, PV and load.
+
+Every call advances the virtual clock by a configurable latency, so the
+report shows how long after a slot boundary the inverter actually got the
+new command, next to command counts, energy, and real CPU time and RSS.
+
+    # four weeks of the Sungrow agent, 60 s polling
+    python3 simulate.py sungrow --days 28
+
+    # Enphase via the Envoy driver, MQTT push, 1% backend errors
+    python3 simulate.py enphase-envoy --days 14 --push --backend-errors 0.01
+
+Stdlib only (besides what the agent itself imports). Agent output goes to
+--log (default: discarded).
+"""
+
+import argparse
+import bisect
+import importlib
+import json
+import math
+import os
+import random
+import sys
+import time
+import types
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# vendor -> (add-on folder, agent module)
+VENDORS = {
+    "goodwe": ("goodwe", "goodwe_agent"),
+    "sungrow": ("Sungrow", "sungrow_agent"),
+    "enphase": ("enphase", "enphase_agent"),
+    "enphase-envoy": ("enphase", "enphase_agent"),
+}
+
+BACKEND_URL = "http://sim-backend"
+HA_URL = "http://sim-ha/api"
+
+# the real clock, for measuring the run itself
+_perf_counter = time.perf_counter
+_process_time = time.process_time
+_monotonic = time.monotonic
+
+
+def log(msg: str) -> None:
+    print(f"[Simulate] {msg}", file=sys.stderr, flush=True)
+
+
+class SimulationEnd(BaseException):
+    """Raised from the agent's wait once the simulated period is over.
+
+    A BaseException, so the agent's `except Exception` around a cycle does
+    not swallow it.
+    """
+
+
+# ========================
+# Virtual clock
+# ========================
+
+
+class VirtualClock:
+    def __init__(self, start: float, end: float):
+        self.t = start
+        self.end = end
+        self._t0 = start
+        self._mono0 = _monotonic()
+
+    def time(self) -> float:
+        return self.t
+
+    def monotonic(self) -> float:
+        return self._mono0 + (self.t - self._t0)
+
+    def advance(self, seconds: float) -> None:
+        if seconds > 0:
+            self.t += seconds
+
+    def sleep(self, seconds: float) -> None:
+        self.advance(seconds)
+        if self.t >= self.end:
+            raise SimulationEnd
+
+    def install(self) -> None:
+        time.time = self.time
+        time.monotonic = self.monotonic
+        time.sleep = self.sleep
+
+
+# ========================
+# Prices, PV and load
+# ========================
+
+
+class Profile:
+    """Synthetic prices per slot and PV/load per minute; same shapes as backtest.synthetic()."""
+
+    def __init__(self, tz, slot: int, pv_kw: float, seed: int):
+        self.tz = tz
+        self.slot = slot
+        self.pv_w = pv_kw * 1000
+        self.seed = seed
+        self._days: dict = {}
+
+    def _hour(self, t: float) -> tuple[float, int, int]:
+        d = datetime.fromtimestamp(t, self.tz)
+        return d.hour + d.minute / 60 + d.second / 3600, d.toordinal(), d.timetuple().tm_yday
+
+    def _day(self, ordinal: int, doy: int) -> tuple:
+        day = self._days.get(ordinal)
+        if day is None:
+            rng = random.Random(self.seed * 100003 + ordinal)
+            season = 0.5 - 0.5 * math.cos(2 * math.pi * (doy - 1) / 365)  # 0 winter .. 1 summer
+            level = rng.gauss(0.10, 0.03)
+            n = 86400 // self.slot
+            prices = []
+            for i in range(n):
+                h = (i + 0.5) * self.slot / 3600
+                prices.append(
+                    level
+                    + 0.06 * math.exp(-((h - 8) ** 2) / 3)
+                    + 0.10 * math.exp(-((h - 19) ** 2) / 4)
+                    - 0.08 * season * math.exp(-((h - 13.5) ** 2) / 6)
+                    + rng.gauss(0, 0.01)
+                )
+            day = (season, rng.uniform(0.4, 1.0), prices)
+            self._days[ordinal] = day
+        return day
+
+    def prices(self, t: float) -> list:
+        """The slot prices of the local day t falls in (index = slot of the day)."""
+        _, ordinal, doy = self._hour(t)
+        return self._day(ordinal, doy)[2]
+
+    def power(self, t: float) -> tuple[float, float]:
+        """(pv_w, load_w) at t."""
+        h, ordinal, doy = self._hour(t)
+        season, clouds, _ = self._day(ordinal, doy)
+        pv = max(0.0, self.pv_w * (0.3 + 0.7 * season) * clouds * math.cos((h - 13.5) / 5 * math.pi / 2))
+        if abs(h - 13.5) > 5:
+            pv = 0.0
+        noise = random.Random(self.seed * 7919 + int(t // 300)).random()
+        load = 350 + 800 * math.exp(-((h - 19) ** 2) / 5) + 300 * noise
+        return pv, load
+
+
+# ========================
+# Battery / inverter
+# ========================
+
+
+class Battery:
+    """SOC integration per minute for one of four intents: self, charge, discharge, hold."""
+
+    STEP = 60.0
+
+    def __init__(self, clock: VirtualClock, profile: Profile, capacity_kwh: float, max_power_kw: float,
+                 efficiency: float, soc_min: float, soc_start: float):
+        self.clock = clock
+        self.profile = profile
+        self.capacity = capacity_kwh * 1000  # Wh
+        self.max_power = max_power_kw * 1000
+        self.eff = math.sqrt(efficiency)  # one way
+        self.soc_min = soc_min
+        self.soc = soc_start  # 0..1
+        self.t = clock.t
+        self.intent = "self"
+        self.power = self.max_power
+        self.batt_w = 0.0  # > 0 charging
+        self.pv_w = 0.0
+        self.grid_w = 0.0  # > 0 import
+        # (t, intent) per command, for the latency analysis
+        self.log_t: list = []
+        self.log_intent: list = []
+        self.commands = 0
+        self.redundant = 0
+        self.import_wh = 0.0
+        self.export_wh = 0.0
+        self.throughput_wh = 0.0
+        self.soc_low = self.soc_high = soc_start
+
+    def command(self, intent: str, power: float | None = None) -> None:
+        self.advance()
+        power = self.max_power if not power or power <= 0 else min(float(power), self.max_power)
+        if intent in ("self", "hold"):
+            power = self.max_power
+        self.commands += 1
+        if (intent, power) == (self.intent, self.power):
+            self.redundant += 1
+        self.intent, self.power = intent, power
+        self.log_t.append(self.clock.t)
+        self.log_intent.append(intent)
+
+    def advance(self) -> None:
+        while self.t < self.clock.t:
+            dt = min(self.STEP, self.clock.t - self.t)
+            pv, load = self.profile.power(self.t)
+            if self.intent == "self":
+                want = pv - load
+            elif self.intent == "charge":
+                want = self.power
+            elif self.intent == "discharge":
+                want = -self.power
+            else:
+                want = 0.0
+            want = max(-self.max_power, min(self.max_power, want))
+            h = dt / 3600
+            if want > 0:
+                room = (1.0 - self.soc) * self.capacity / self.eff
+                want = min(want, room / h)
+                self.soc += want * h * self.eff / self.capacity
+            elif want < 0:
+                avail = max(0.0, self.soc - self.soc_min) * self.capacity * self.eff
+                want = -min(-want, avail / h)
+                self.soc += want * h / self.eff / self.capacity
+            self.batt_w, self.pv_w = want, pv
+            self.grid_w = load - pv + want
+            if self.grid_w > 0:
+                self.import_wh += self.grid_w * h
+            else:
+                self.export_wh -= self.grid_w * h
+            self.throughput_wh += abs(want) * h
+            self.soc_low = min(self.soc_low, self.soc)
+            self.soc_high = max(self.soc_high, self.soc)
+            self.t += dt
+
+    def telemetry(self) -> dict:
+        self.advance()
+        return {
+            "soc_pct": round(100 * self.soc, 1),
+            "pv_power_w": int(self.pv_w),
+            "grid_power_w": int(self.grid_w),
+            "battery_power_w": int(self.batt_w),
+        }
+
+
+# ========================
+# Simulated backend, Home Assistant and inverter links
+# ========================
+
+
+class Backend:
+    """next_action per slot from the day's price ranking."""
+
+    def __init__(self, profile: Profile, n_charge: int, n_discharge: int, power_w: int, error_rate: float, seed: int):
+        self.profile = profile
+        self.n_charge = n_charge
+        self.n_discharge = n_discharge
+        self.power_w = power_w
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self._modes: dict = {}
+        self.heartbeats = 0
+
+    def action_at(self, t: float) -> tuple[int, int]:
+        prices = self.profile.prices(t)
+        key = id(prices)
+        modes = self._modes.get(key)
+        if modes is None:
+            order = sorted(range(len(prices)), key=prices.__getitem__)
+            modes = [7] * len(prices)
+            for i in order[: self.n_charge]:
+                modes[i] = 3
+            for i in order[len(order) - self.n_discharge:] if self.n_discharge else ():
+                modes[i] = 4
+            self._modes[key] = modes
+        h = datetime.fromtimestamp(t, self.profile.tz)
+        slot = (h.hour * 3600 + h.minute * 60 + h.second) // self.profile.slot
+        mode = modes[min(slot, len(modes) - 1)]
+        return mode, (self.power_w if mode in (3, 4) else 0)
+
+    def fails(self) -> bool:
+        return self.error_rate > 0 and self.rng.random() < self.error_rate
+
+
+class HomeAssistant:
+    """States from the battery; service calls translated per vendor into battery intents."""
+
+    def __init__(self, agent, vendor: str, battery: Battery):
+        self.agent = agent
+        self.vendor = vendor
+        self.battery = battery
+        self.forced_power = 0.0
+        self.flags = {"charge": False, "discharge": False, "restrict": False}
+
+    def state(self, entity_id: str):
+        a = self.agent
+        tel = self.battery.telemetry()
+        values = {
+            a.SOC_ENTITY: tel["soc_pct"],
+            a.PV_ENTITY: tel["pv_power_w"],
+            a.GRID_ENTITY: tel["grid_power_w"],
+        }
+        if entity_id not in values:
+            return None
+        return {"entity_id": entity_id, "state": str(values[entity_id]), "attributes": {}}
+
+    def service(self, domain: str, service: str, data: dict) -> None:
+        if self.vendor == "sungrow":
+            self._sungrow(domain, service, data)
+        elif self.vendor == "enphase":
+            self._enphase(f"{domain}.{service}", data)
+
+    def _sungrow(self, domain: str, service: str, data: dict) -> None:
+        a = self.agent
+        entity = data.get("entity_id")
+        if domain == "input_number" and entity == a.FORCED_POWER_ENTITY:
+            self.forced_power = float(data.get("value", 0))
+        elif domain == "script" and service == "turn_on":
+            if entity == a.SCRIPT_FORCE_CHARGE:
+                self.battery.command("charge", self.forced_power)
+            elif entity == a.SCRIPT_FORCE_DISCH:
+                self.battery.command("discharge", self.forced_power)
+            elif entity == a.SCRIPT_SELF_CONS:
+                self.battery.command("self")
+
+    def _enphase(self, name: str, data: dict) -> None:
+        a = self.agent
+        if name == a.ENPHASE_CHARGE_SCRIPT:
+            self.flags["charge"] = bool(data.get("charge"))
+        elif name == a.ENPHASE_DISCHARGE_SCRIPT:
+            self.flags["discharge"] = bool(data.get("discharge"))
+        elif name == a.ENPHASE_RESTRICT_COMMAND:
+            self.flags["restrict"] = bool(data.get("restrict"))
+        else:
+            return
+        if self.flags["restrict"]:
+            intent = "hold"
+        elif self.flags["charge"]:
+            intent = "charge"
+        elif self.flags["discharge"]:
+            intent = "discharge"
+        else:
+            intent = "self"
+        self.battery.command(intent)
+
+
+class SimHTTP:
+    """Stands in for the agent's HTTP module (lite_http / requests): get() and post()."""
+
+    def __init__(self, sim: "Simulation", response_cls):
+        self.sim = sim
+        self.Response = response_cls
+
+    def get(self, url: str, **kw):
+        return self.request("GET", url, **kw)
+
+    def post(self, url: str, **kw):
+        return self.request("POST", url, **kw)
+
+    def _reply(self, url: str, status: int, body) -> object:
+        content = json.dumps(body).encode() if body is not None else b""
+        reason = {200: "OK", 404: "Not Found", 503: "Service Unavailable"}.get(status, "")
+        return self.Response(status, reason, {}, content, url)
+
+    def request(self, method: str, url: str, json=None, **kw):
+        sim = self.sim
+        if url.startswith(BACKEND_URL):
+            sim.clock.advance(sim.latency["backend"])
+            kind = "fetch" if url.endswith("/next_action") else "upload"
+            sim.count(kind)
+            if sim.backend.fails():
+                sim.count("backend_errors")
+                return self._reply(url, 503, {"error": "simulated"})
+            if kind == "fetch":
+                mode, power = sim.backend.action_at(sim.clock.t)
+                return self._reply(url, 200, {"mode": mode, "power_watt": power})
+            sim.backend.heartbeats += 1
+            return self._reply(url, 200, {"ok": True})
+        if url.startswith(HA_URL):
+            sim.clock.advance(sim.latency["ha"])
+            path = url[len(HA_URL):]
+            if path.startswith("/states/"):
+                sim.count("ha_get")
+                state = sim.ha.state(path[len("/states/"):])
+                return self._reply(url, 200, state) if state else self._reply(url, 404, {"message": "Entity not found."})
+            if path.startswith("/services/"):
+                sim.count("ha_service")
+                domain, _, service = path[len("/services/"):].partition("/")
+                sim.ha.service(domain, service, json or {})
+                return self._reply(url, 200, [])
+        return self._reply(url, 404, None)
+
+
+def goodwe_setmode(sim: "Simulation") -> types.ModuleType:
+    """Replacement for goodwe/setmode.py: the Modbus write and block read, on the battery."""
+    mod = types.ModuleType("setmode")
+    intents = {1: "self", 2: "charge", 3: "discharge"}
+
+    def set_mode(mode: int, power: int = 0) -> None:
+        sim.clock.advance(sim.latency["inverter"])
+        sim.battery.command(intents.get(mode, "self"), power)
+
+    def read_telemetry() -> dict:
+        sim.clock.advance(sim.latency["inverter"])
+        tel = sim.battery.telemetry()
+        tel["mode"] = {v: k for k, v in intents.items()}.get(sim.battery.intent, 1)
+        return tel
+
+    mod.set_mode = set_mode
+    mod.read_telemetry = read_telemetry
+    return mod
+
+
+class SimEnvoy:
+    """Replacement for envoy.Envoy: apply_mode() only writes on a change, like the real driver."""
+
+    INTENTS = {7: "self", 3: "charge", 4: "discharge", 1: "hold"}
+
+    def __init__(self, sim: "Simulation"):
+        self.sim = sim
+        self.base = "https://sim-envoy"
+
+    def apply_mode(self, server_mode: int) -> bool:
+        intent = self.INTENTS[server_mode]
+        self.sim.clock.advance(self.sim.latency["ha"])  # GET storage_settings
+        if intent == self.sim.battery.intent:
+            return False
+        self.sim.clock.advance(self.sim.latency["inverter"])
+        self.sim.battery.command(intent)
+        return True
+
+    def read_telemetry(self) -> dict:
+        self.sim.clock.advance(2 * self.sim.latency["ha"])
+        return self.sim.battery.telemetry()
+
+
+class FakeMqtt:
+    """Just enough of a paho client for ActionPush.connected/stop()."""
+
+    def is_connected(self) -> bool:
+        return True
+
+    def disconnect(self) -> None:
+        pass
+
+    def loop_stop(self) -> None:
+        pass
+
+
+class VirtualEvent:
+    """The agent's PUSH.event: wait() jumps the clock instead of sleeping."""
+
+    def __init__(self, sim: "Simulation"):
+        self.sim = sim
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self.sim.idle(timeout or 0.0)
+
+    def set(self) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+    def is_set(self) -> bool:
+        return False
+
+
+# ========================
+# Simulation
+# ========================
+
+
+class Simulation:
+    def __init__(self, args):
+        self.args = args
+        self.vendor = args.vendor
+        self.tz = ZoneInfo(args.tz)
+        start = datetime.strptime(args.start, "%Y-%m-%d").replace(tzinfo=self.tz).timestamp()
+        self.start = start
+        # the agent starts somewhere within a poll interval, not exactly on a slot boundary
+        offset = args.offset if args.offset is not None else random.Random(args.seed).uniform(0, args.interval)
+        self.clock = VirtualClock(start + offset, start + args.days * 86400)
+        self.profile = Profile(self.tz, args.slot, args.pv, args.seed)
+        self.battery = Battery(self.clock, self.profile, args.capacity, args.max_power, args.efficiency,
+                               args.soc_min, args.soc_start)
+        self.backend = Backend(self.profile, args.n_charge, args.n_discharge, args.power, args.backend_errors,
+                               args.seed)
+        self.latency = {
+            "backend": args.backend_ms / 1000,
+            "ha": args.ha_ms / 1000,
+            "inverter": args.inverter_ms / 1000,
+        }
+        self.counts: dict = {}
+        self.cycles = 0
+        self.pushes = 0
+        self.rss: list = []  # (day, MB) at each simulated midnight
+        self._next_day = start + 86400
+        self._events = self.slot_changes()
+        self._next_event = 0
+        self.agent = None
+        self.footprint = None
+
+    def count(self, kind: str) -> None:
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def expected_intent(self, mode: int) -> str:
+        if mode == 1:
+            return "hold" if self.vendor.startswith("enphase") else "self"
+        return {3: "charge", 4: "discharge"}.get(mode, "self")
+
+    def slot_changes(self) -> list:
+        """[(boundary, mode, power)] for every slot whose intent differs from the slot before."""
+        out = []
+        prev = None
+        t = self.start
+        while t < self.clock.end:
+            mode, power = self.backend.action_at(t)
+            intent = self.expected_intent(mode)
+            if intent != prev:
+                if prev is not None:
+                    out.append((t, mode, power))
+                prev = intent
+            t += self.args.slot
+        return out
+
+    # ---- agent side ------------------------------------------------------
+
+    def load_agent(self):
+        folder, module = VENDORS[self.vendor]
+        sys.path.insert(0, os.path.join(ROOT, folder))
+        env = {
+            "API_URL": f"{BACKEND_URL}/next_action",
+            "TELEMETRY_URL": f"{BACKEND_URL}/telemetry",
+            "HA_URL": HA_URL,
+            "HA_TOKEN": "sim",
+            "CLIENT_ID": "sim",
+            "INTERVAL": str(self.args.interval),
+            "MQTT_HOST": "",
+            "OPTIONS_RELOAD": "0",
+            "DIAGNOSTICS": "0",
+            "ENVOY_HOST": "",
+        }
+        if self.vendor == "goodwe":
+            env["TELEMETRY_SOURCE"] = "modbus"
+            sys.modules["setmode"] = goodwe_setmode(self)
+        for kv in self.args.env or ():
+            k, _, v = kv.partition("=")
+            env[k] = v
+        os.environ.update(env)
+
+        agent = importlib.import_module(module)
+        self.footprint = importlib.import_module("footprint")
+        lite_http = importlib.import_module("lite_http")
+
+        agent.HTTP = SimHTTP(self, lite_http.Response)
+        self.ha = HomeAssistant(agent, self.vendor, self.battery)
+        agent.PUSH.event = VirtualEvent(self)
+        if self.args.push:
+            agent.PUSH.client = FakeMqtt()
+        if self.vendor == "enphase-envoy":
+            agent.ENVOY = SimEnvoy(self)
+        agent.LOG.stream = open(self.args.log or os.devnull, "w", encoding="utf-8")
+        self.agent = agent
+        return agent
+
+    def idle(self, timeout: float) -> bool:
+        """The agent waits up to timeout; True when a pushed action ends the wait early."""
+        self.cycles += 1  # every wait follows one pass through the loop body
+        clock = self.clock
+        target = clock.t + max(0.0, timeout)
+        if self.args.push:
+            events = self._events
+            i = self._next_event
+            while i < len(events) and events[i][0] + self.latency["backend"] <= clock.t:
+                i += 1
+            self._next_event = i
+            if i < len(events) and events[i][0] + self.latency["backend"] <= target:
+                boundary, mode, power = events[i]
+                self._next_event = i + 1
+                self._advance_to(boundary + self.latency["backend"])
+                self.agent.PUSH.deliver((mode, power))
+                self.pushes += 1
+                return True
+        self._advance_to(target)
+        return False
+
+    def _advance_to(self, t: float) -> None:
+        clock = self.clock
+        while self._next_day <= min(t, clock.end):
+            clock.t = self._next_day
+            self.battery.advance()
+            self.rss.append(((self._next_day - self.start) / 86400, self.footprint.rss_mb()[0]))
+            self._next_day += 86400
+        if t >= clock.end:
+            clock.t = clock.end
+            self.battery.advance()
+            raise SimulationEnd
+        clock.t = max(clock.t, t)
+
+    def run(self) -> dict:
+        agent = self.load_agent()
+        rss0 = self.footprint.rss_mb()[0]
+        self.clock.install()
+        wall0, cpu0 = _perf_counter(), _process_time()
+        try:
+            agent.loop()
+        except SimulationEnd:
+            pass
+        wall, cpu = _perf_counter() - wall0, _process_time() - cpu0
+        return self.report(wall, cpu, rss0)
+
+    # ---- results ---------------------------------------------------------
+
+    def latencies(self) -> tuple[list, int]:
+        """Seconds from each slot change to the first command with the new intent; and the misses."""
+        bat = self.battery
+        out, missed = [], 0
+        events = self._events
+        for n, (boundary, mode, _) in enumerate(events):
+            until = events[n + 1][0] if n + 1 < len(events) else self.clock.end
+            want = self.expected_intent(mode)
+            i = bisect.bisect_left(bat.log_t, boundary)
+            while i < len(bat.log_t) and bat.log_t[i] < until and bat.log_intent[i] != want:
+                i += 1
+            if i < len(bat.log_t) and bat.log_t[i] < until:
+                out.append(bat.log_t[i] - boundary)
+            else:
+                missed += 1
+        return out, missed
+
+    def report(self, wall: float, cpu: float, rss0) -> dict:
+        days = (self.clock.t - self.start) / 86400
+        lat, missed = self.latencies()
+        lat.sort()
+
+        def pct(p: float):
+            return round(lat[min(len(lat) - 1, int(p * len(lat)))], 3) if lat else None
+
+        bat = self.battery
+        rss_now, rss_peak = self.footprint.rss_mb()
+        return {
+            "vendor": self.vendor,
+            "simulated_days": round(days, 3),
+            "wall_s": round(wall, 3),
+            "speedup": round(days * 86400 / wall) if wall > 0 else None,
+            "cycles": self.cycles,
+            "pushes": self.pushes,
+            "requests": dict(sorted(self.counts.items())),
+            "inverter_commands": bat.commands,
+            "redundant_commands": bat.redundant,
+            "slot_changes": len(self._events),
+            "latency_s": {
+                "mean": round(sum(lat) / len(lat), 3) if lat else None,
+                "p50": pct(0.50),
+                "p95": pct(0.95),
+                "max": round(lat[-1], 3) if lat else None,
+                "missed": missed,
+            },
+            "energy_kwh": {
+                "import": round(bat.import_wh / 1000, 1),
+                "export": round(bat.export_wh / 1000, 1),
+                "battery_throughput": round(bat.throughput_wh / 1000, 1),
+                "full_cycles": round(bat.throughput_wh / 2 / bat.capacity, 1),
+            },
+            "soc_pct": {"min": round(100 * bat.soc_low, 1), "max": round(100 * bat.soc_high, 1)},
+            "heartbeats": self.backend.heartbeats,
+            "cpu_s": round(cpu, 3),
+            "cpu_ms_per_day": round(1000 * cpu / days, 1) if days else None,
+            "rss_mb": {
+                "start": round(rss0, 1) if rss0 else None,
+                "end": round(rss_now, 1) if rss_now else None,
+                "peak": round(rss_peak, 1) if rss_peak else None,
+            },
+            "rss_daily_mb": [[round(d, 1), round(mb, 1) if mb else None] for d, mb in self.rss],
+        }
+
+
+def print_report(r: dict) -> None:
+    lat = r["latency_s"]
+    req = r["requests"]
+    days = r["simulated_days"] or 1
+    print(f"{r['vendor']}: {r['simulated_days']:g} simulated days in {r['wall_s']:.1f}s wall ({r['speedup']:,}x real time)")
+    print(
+        f"  cycles {r['cycles']:,} (pushed {r['pushes']:,}); requests: "
+        + ", ".join(f"{k} {v:,}" for k, v in req.items())
+    )
+    print(
+        f"  inverter commands {r['inverter_commands']:,} ({r['inverter_commands'] / days:.0f}/day), "
+        f"redundant {r['redundant_commands']:,}; heartbeats {r['heartbeats']:,}"
+    )
+    if lat["mean"] is not None:
+        print(
+            f"  slot changes {r['slot_changes']:,}: latency mean {lat['mean']:.1f}s p50 {lat['p50']:.1f}s "
+            f"p95 {lat['p95']:.1f}s max {lat['max']:.1f}s, missed {lat['missed']}"
+        )
+    else:
+        print(f"  slot changes {r['slot_changes']:,}: none applied, missed {lat['missed']}")
+    e = r["energy_kwh"]
+    print(
+        f"  grid import {e['import']} kWh, export {e['export']} kWh; battery {e['battery_throughput']} kWh "
+        f"({e['full_cycles']} cycles), SOC {r['soc_pct']['min']}..{r['soc_pct']['max']}%"
+    )
+    rss = r["rss_mb"]
+    print(
+        f"  CPU {r['cpu_s']:.2f}s ({r['cpu_ms_per_day']} ms per simulated day); "
+        f"RSS (agent + simulator) start {rss['start']} MB, end {rss['end']} MB, peak {rss['peak']} MB"
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("vendor", choices=sorted(VENDORS))
+    ap.add_argument("--days", type=float, default=28)
+    ap.add_argument("--start", default="2025-06-02", help="first simulated local day (YYYY-MM-DD)")
+    ap.add_argument("--tz", default="Europe/Amsterdam")
+    ap.add_argument("--interval", type=int, default=60, help="agent INTERVAL (poll seconds)")
+    ap.add_argument("--offset", type=float, help="agent start in seconds after local midnight (default: random)")
+    ap.add_argument("--push", action="store_true", help="simulate MQTT push of each slot change")
+    ap.add_argument("--env", action="append", metavar="KEY=VALUE", help="extra agent environment (repeatable)")
+
+    ap.add_argument("--slot", type=int, default=900, help="price slot in seconds")
+    ap.add_argument("--n-charge", type=int, default=8, help="cheapest slots per day with forced charge")
+    ap.add_argument("--n-discharge", type=int, default=8, help="dearest slots per day with forced discharge")
+    ap.add_argument("--power", type=int, default=2500, help="power_watt in next_action for charge/discharge")
+    ap.add_argument("--backend-errors", type=float, default=0.0, help="fraction of backend calls answered 503")
+
+    ap.add_argument("--capacity", type=float, default=10.0, help="usable kWh")
+    ap.add_argument("--max-power", type=float, default=5.0, help="inverter limit in kW")
+    ap.add_argument("--efficiency", type=float, default=0.92, help="round-trip")
+    ap.add_argument("--soc-min", type=float, default=0.10)
+    ap.add_argument("--soc-start", type=float, default=0.5)
+    ap.add_argument("--pv", type=float, default=5.0, help="PV peak in kW")
+    ap.add_argument("--seed", type=int, default=1)
+
+    ap.add_argument("--backend-ms", type=float, default=150, help="simulated latency per backend call")
+    ap.add_argument("--ha-ms", type=float, default=20, help="simulated latency per HA / Envoy call")
+    ap.add_argument("--inverter-ms", type=float, default=80, help="simulated latency per inverter write/read")
+
+    ap.add_argument("--log", help="write the agent's log here (default: discarded)")
+    ap.add_argument("--json", help="write the report as JSON to this file")
+    args = ap.parse_args()
+
+    sim = Simulation(args)
+    log(f"{args.vendor}: {args.days:g} days from {args.start}, {len(sim._events)} slot changes")
+    result = sim.run()
+    print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
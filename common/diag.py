@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Opt-in diagnostics: per-cycle span traces and a bounded sampling profiler.
+
+Switched on by DIAGNOSTICS=1 at start or by SIGUSR2 at runtime, for
+DIAG_WINDOW seconds. While on:
+
+* every agent cycle becomes one JSON line in trace-<start>.jsonl with its
+  spans (fetch, each HA call, inverter write, telemetry, upload):
+  {"t": epoch, "ms": 812.4, "ok": true, "spans": [[name, start_ms, ms, ok, info], ...]}
+* a sampling thread records the main thread's stack every
+  DIAG_SAMPLE_MS milliseconds while a cycle runs (the idle wait between
+  cycles is not sampled) and writes profile-<start>.folded (one
+  "frame;frame;frame count" line per stack, the format flamegraph.pl and
+  speedscope read) when the window ends.
+
+Files go to DIAG_DIR (/share/metdezon-diag, reachable over Samba) and stop
+growing at DIAG_MAX_MB. Off, begin()/span()/traced() cost one attribute check.
+
+Environment: DIAGNOSTICS (0/1), DIAG_WINDOW (s, default 900), DIAG_SAMPLE_MS
+(default 20), DIAG_DIR, DIAG_MAX_MB (default 5).
+"""
+
+import collections
+import contextlib
+import functools
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+DIAGNOSTICS = os.environ.get("DIAGNOSTICS", "false").lower() in ("1", "true", "yes")
+DIAG_WINDOW = float(os.environ.get("DIAG_WINDOW", "900"))
+DIAG_SAMPLE_MS = float(os.environ.get("DIAG_SAMPLE_MS", "20"))
+DIAG_DIR = os.environ.get("DIAG_DIR", "/share/metdezon-diag")
+DIAG_MAX_MB = float(os.environ.get("DIAG_MAX_MB", "5"))
+
+
+class Sampler(threading.Thread):
+    """Samples one thread's stack while busy() until stopped; aggregates identical stacks."""
+
+    def __init__(self, thread_id: int, interval: float, busy=lambda: True):
+        super().__init__(name="diag-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.busy = busy
+        self.stacks: collections.Counter = collections.Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            if not self.busy():
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join(timeout=1)
+
+
+class Diagnostics:
+    def __init__(self, log=None, window: float = DIAG_WINDOW, out_dir: str = DIAG_DIR,
+                 sample_ms: float = DIAG_SAMPLE_MS, max_mb: float = DIAG_MAX_MB):
+        self.log = log  # AgentLog
+        self.window = window
+        self.out_dir = out_dir
+        self.sample_ms = sample_ms
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.until = 0.0
+        self.spans: list | None = None  # spans of the cycle being traced
+        self._t0 = 0.0
+        self._error = None
+        self._thread = threading.main_thread().ident
+        self._trace = None
+        self._written = 0
+        self._sampler: Sampler | None = None
+        self._stamp = ""
+        self._requested = False
+
+    @property
+    def active(self) -> bool:
+        return self.until > 0
+
+    # ---- switching on / off ---------------------------------------------
+
+    def install_signal(self, signum=getattr(signal, "SIGUSR2", None)) -> None:
+        if signum is not None:
+            # only flag it here; files are opened between cycles
+            signal.signal(signum, lambda *_: setattr(self, "_requested", True))
+
+    def start(self, window: float | None = None) -> None:
+        self.until = time.monotonic() + (window or self.window)
+        if self._trace is not None:
+            return  # already on: just extend the window
+        self._stamp = time.strftime("%Y%m%d-%H%M%S")
+        try:
+            os.makedirs(self.out_dir, exist_ok=True)
+            self._trace = open(os.path.join(self.out_dir, f"trace-{self._stamp}.jsonl"), "w", encoding="utf-8")
+        except OSError as e:
+            if self.log:
+                self.log.warn("diag", "cannot write traces to %s: %s", self.out_dir, e)
+            self.until = 0.0
+            return
+        self._written = 0
+        self._sampler = Sampler(self._thread, self.sample_ms / 1000.0, busy=lambda: self.spans is not None)
+        self._sampler.start()
+        if self.log:
+            self.log.info("diag", "diagnostics on for %.0fs -> %s", self.until - time.monotonic(), self.out_dir)
+
+    def stop(self) -> None:
+        self.until = 0.0
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
+        sampler, self._sampler = self._sampler, None
+        if sampler is None:
+            return
+        sampler.stop()
+        path = os.path.join(self.out_dir, f"profile-{self._stamp}.folded")
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, n in sampler.stacks.most_common():
+                    f.write(f"{stack} {n}\n")
+        except OSError as e:
+            if self.log:
+                self.log.warn("diag", "cannot write profile %s: %s", path, e)
+            return
+        if self.log:
+            leaves = collections.Counter()
+            for stack, n in sampler.stacks.items():
+                leaves[stack.rsplit(";", 1)[-1]] += n
+            top = ", ".join(f"{k} {100 * n / max(sampler.samples, 1):.0f}%" for k, n in leaves.most_common(5))
+            self.log.info("diag", "diagnostics off; %s samples in %s (top: %s)", sampler.samples, path, top or "-")
+
+    def poll(self) -> None:
+        """Between cycles: honour SIGUSR2 and close an expired window."""
+        if self._requested:
+            self._requested = False
+            self.start()
+        elif self.until and time.monotonic() > self.until:
+            self.stop()
+
+    # ---- tracing --------------------------------------------------------
+
+    def begin(self) -> None:
+        """Start of an agent cycle."""
+        self.poll()
+        if self.until:
+            self.spans = []
+            self._error = None
+            self._t0 = time.perf_counter()
+
+    def fail(self, error) -> None:
+        """The cycle ended in an exception (called from the agent's except)."""
+        if self.spans is not None:
+            self._error = str(error)[:200]
+
+    def end(self) -> None:
+        if self.spans is None:
+            return
+        spans, self.spans = self.spans, None
+        ms = 1000 * (time.perf_counter() - self._t0)
+        record = {"t": round(time.time(), 3), "ms": round(ms, 1), "ok": self._error is None, "spans": spans}
+        if self._error is not None:
+            record["error"] = self._error
+        self._write(record)
+
+    @contextlib.contextmanager
+    def span(self, name: str, info=None):
+        if self.spans is None or threading.get_ident() != self._thread:
+            yield
+            return
+        t = time.perf_counter()
+        ok = True
+        try:
+            yield
+        except BaseException:
+            ok = False
+            raise
+        finally:
+            end = time.perf_counter()
+            self.spans.append(
+                [name, round(1000 * (t - self._t0), 1), round(1000 * (end - t), 1), ok, info]
+            )
+
+    def traced(self, name: str, info_arg: int | None = None, ok=None):
+        """Decorator: the call becomes a span; ok(result) marks a failed result."""
+
+        def deco(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kw):
+                if self.spans is None or threading.get_ident() != self._thread:
+                    return fn(*args, **kw)
+                info = args[info_arg] if info_arg is not None and len(args) > info_arg else None
+                with self.span(name, info):
+                    result = fn(*args, **kw)
+                if ok is not None and not ok(result):
+                    self.spans[-1][3] = False
+                return result
+
+            return wrapper
+
+        return deco
+
+    def _write(self, record: dict) -> None:
+        if self._trace is None or self._written > self.max_bytes:
+            return
+        line = json.dumps(record, separators=(",", ":"), default=str) + "\n"
+        self._written += len(line)
+        try:
+            self._trace.write(line)
+            self._trace.flush()
+        except OSError:
+            pass
+        if self._written > self.max_bytes and self.log:
+            self.log.warn("diag", "trace file reached %.0f MB; further cycles not written", self.max_bytes / 2**20)
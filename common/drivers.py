@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Vendor drivers for the multi-site agent.
+
+Used by the multisite add-on and the metdezon-bms integration; in the
+integration site.ha is the in-process adapter from coordinator.py instead
+of the REST client.
+
+Each driver mirrors the control logic of the matching single-vendor add-on
+(goodwe_agent.py, sungrow_agent.py, enphase_agent.py) but runs on the shared
+event loop: HA calls go through the site's HomeAssistant client and the
+GoodWe Modbus write and read run as an async subprocess that is killed
+when the site's cycle times out.
+"""
+
+import asyncio
+import json
+import os
+
+
+def _to_float(state: dict | None) -> float | None:
+    if state and "state" in state:
+        try:
+            return float(state["state"])
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+class Driver:
+    vendor = ""
+    default_entities: dict = {}
+    # Textual mode states from an optional mode_entity
+    mode_name_map = {"auto": 1, "charge": 2, "discharge": 3, "standby": 1}
+    mode_names = {1: "Auto/Standby", 2: "Charge", 3: "Discharge"}
+
+    def __init__(self, site):
+        self.site = site
+        self.opts = site.opts
+        self.ha = site.ha
+        self.log = site.log
+
+    def entity(self, key: str) -> str:
+        return self.opts.get(key) or self.default_entities.get(key, "")
+
+    async def apply(self, server_mode: int, server_power: int) -> None:
+        raise NotImplementedError
+
+    async def read_telemetry(self) -> dict:
+        """Read SOC / mode / PV / grid from HA; the four GETs run concurrently."""
+        if self.site.disable_ha:
+            return {}
+        keys = ("soc_entity", "mode_entity", "pv_entity", "grid_entity")
+        soc, md, pv, grid = await asyncio.gather(*(self.ha.get_state(self.entity(k)) for k in keys))
+
+        out: dict = {}
+        v = _to_float(soc)
+        if v is not None:
+            out["soc_pct"] = v
+        if md and "state" in md:
+            try:
+                out["mode"] = int(md["state"])
+            except (TypeError, ValueError):
+                out["mode"] = self.mode_name_map.get(str(md["state"]).strip().lower())
+        v = _to_float(pv)
+        if v is not None:
+            out["pv_power_w"] = int(v)
+        v = _to_float(grid)
+        if v is not None:
+            out["grid_power_w"] = int(v)
+        return out
+
+
+class GoodWeDriver(Driver):
+    vendor = "goodwe"
+    default_entities = {
+        "soc_entity": "sensor.battery_state_of_charge",
+        "pv_entity": "sensor.pv_power",
+        "grid_entity": "sensor.active_power",
+    }
+
+    # server → GoodWe
+    # 7=MSC -> 1 (standby/auto), 4=Export -> 3 (discharge), 1=standby -> 1, 3=charge -> 2
+    MODE_MAP = {7: 1, 4: 3, 1: 1, 3: 2}
+
+    async def _setmode(self, *args: str) -> tuple[int, bytes]:
+        python = self.opts.get("setmode_python") or "/opt/venv/bin/python"
+        script = self.opts.get("setmode_script") or "/app/setmode.py"
+        env = {
+            **os.environ,
+            "SERIAL_PORT": str(self.opts.get("serial_port") or "/dev/ttyUSB0"),
+            "SERIAL_BAUD": str(self.opts.get("serial_baud") or 9600),
+            "SERIAL_SLAVE": str(self.opts.get("serial_slave") or 247),
+            # host:port of a GoodWe add-on's modbus_gateway.py sharing the same bus
+            "MODBUS_GATEWAY": str(self.opts.get("modbus_gateway") or ""),
+        }
+        self.site.logger.debug("modbus", "exec %s %s %s on %s", python, script, " ".join(args), env["SERIAL_PORT"])
+        proc = await asyncio.create_subprocess_exec(python, script, *args, env=env, stdout=asyncio.subprocess.PIPE)
+        try:
+            out, _ = await proc.communicate()
+        except asyncio.CancelledError:
+            # a hung serial transfer must not survive the cycle that started it
+            proc.kill()
+            await proc.wait()
+            raise
+        if proc.returncode != 0:
+            self.site.logger.warn("modbus", "setmode.py %s exit code %s", args[0], proc.returncode)
+        return proc.returncode, out
+
+    async def set_mode(self, mode: int, power: int = 0) -> None:
+        await self._setmode(str(mode), str(power))
+
+    async def read_telemetry(self) -> dict:
+        """SOC / mode / PV / grid straight from the inverter unless telemetry_source is 'ha'."""
+        if str(self.opts.get("telemetry_source") or "modbus").lower() != "modbus":
+            return await super().read_telemetry()
+        rc, out = await self._setmode("--telemetry")
+        if rc != 0:
+            return {}
+        try:
+            return json.loads(out)
+        except ValueError:
+            self.site.logger.warn("modbus", "unreadable telemetry output: %r", out[:200])
+            return {}
+
+    async def apply(self, server_mode: int, server_power: int) -> None:
+        if server_mode not in self.MODE_MAP:
+            self.log(f"Unknown server mode {server_mode}; nothing to do.", "control")
+            return
+        gw_mode = self.MODE_MAP[server_mode]
+        pwr = server_power if server_power > 0 else (self.site.power if gw_mode in (2, 3) else 0)
+        self.log(f"Set mode {gw_mode} with power {pwr}W", "control")
+        await self.set_mode(gw_mode, pwr)
+
+
+class SungrowDriver(Driver):
+    vendor = "sungrow"
+    default_entities = {
+        "soc_entity": "sensor.battery_level",
+        "pv_entity": "sensor.total_dc_power",
+        "grid_entity": "sensor.meter_active_power",
+        "forced_power_entity": "input_number.set_sg_forced_charge_discharge_power",
+        "ems_mode_input": "input_select.set_sg_ems_mode",
+        "force_cmd_input": "input_select.set_sg_battery_forced_charge_discharge_cmd",
+        "script_force_charge": "script.sg_set_forced_charge_battery_mode",
+        "script_force_disch": "script.sg_set_forced_discharge_battery_mode",
+        "script_self_cons": "script.sg_set_self_consumption_mode",
+    }
+
+    async def _select(self, key: str, option: str) -> None:
+        entity_id = self.entity(key)
+        if entity_id:
+            await self.ha.call_service("input_select", "select_option", {"entity_id": entity_id, "option": option})
+
+    async def _forced(self, power: int, script_key: str, cmd_option: str) -> None:
+        if self.entity("forced_power_entity"):
+            await self.ha.call_service(
+                "input_number", "set_value", {"entity_id": self.entity("forced_power_entity"), "value": power}
+            )
+        if self.entity(script_key):
+            await self.ha.call_service("script", "turn_on", {"entity_id": self.entity(script_key)})
+        else:
+            await self._select("ems_mode_input", "Forced mode")
+            await self._select("force_cmd_input", cmd_option)
+
+    async def apply(self, server_mode: int, server_power: int) -> None:
+        # Same meaning as the GoodWe agent: 1/7 = self-consumption, 3 = charge, 4 = discharge
+        if self.site.disable_ha:
+            self.log("DISABLE_HA=1, skipping inverter control", "control")
+            return
+
+        effective_power = server_power if server_power > 0 else self.site.power
+
+        if server_mode in (1, 7):
+            self.log("Set Sungrow to self-consumption mode", "control")
+            if self.entity("script_self_cons"):
+                await self.ha.call_service("script", "turn_on", {"entity_id": self.entity("script_self_cons")})
+            else:
+                await self._select("ems_mode_input", "Self-consumption mode (default)")
+                await self._select("force_cmd_input", "Stop (default)")
+        elif server_mode == 3:
+            if effective_power <= 0:
+                self.log("Charge mode requested but no power_watt > 0 supplied; skipping change.", "control")
+                return
+            self.log(f"Set Sungrow to forced charge at {effective_power} W", "control")
+            await self._forced(effective_power, "script_force_charge", "Forced charge")
+        elif server_mode == 4:
+            if effective_power <= 0:
+                self.log("Discharge mode requested but no power_watt > 0 supplied; skipping change.", "control")
+                return
+            self.log(f"Set Sungrow to forced discharge at {effective_power} W", "control")
+            await self._forced(effective_power, "script_force_disch", "Forced discharge")
+        else:
+            self.log(f"Unknown server mode {server_mode}; not changing Sungrow mode.", "control")
+
+
+class EnphaseDriver(Driver):
+    vendor = "enphase"
+    default_entities = {
+        "soc_entity": "sensor.enphase_battery_soc",
+        "pv_entity": "sensor.pv_power",
+        "grid_entity": "sensor.grid_power",
+        "enphase_charge_script": "script.toggle_enphase_charge_from_grid",
+        "enphase_discharge_script": "script.toggle_enphase_discharge_to_grid",
+        "enphase_restrict_command": "rest_command.enphase_battery_restrict_discharge",
+    }
+    mode_name_map = {
+        "auto": 7,
+        "idle": 7,
+        "selfconsumption": 7,
+        "self-consumption": 7,
+        "charge": 3,
+        "charging": 3,
+        "discharge": 4,
+        "discharging": 4,
+        "standby": 1,
+    }
+    mode_names = {
+        1: "Standby / hold",
+        3: "Charge (netladen)",
+        4: "Discharge (naar net)",
+        7: "Idle / zelfconsumptie",
+    }
+
+    # server_mode -> (charge_from_grid, discharge_to_grid, restrict_discharge)
+    MODE_FLAGS = {
+        7: (False, False, False),
+        3: (True, False, False),
+        4: (False, True, False),
+        1: (False, False, True),
+    }
+
+    async def apply(self, server_mode: int, server_power: int) -> None:
+        if server_mode not in self.MODE_FLAGS:
+            self.log(f"Onbekende server_mode {server_mode}; geen Enphase-actie.", "control")
+            return
+        self.log(f"Apply policy mode {server_mode} ({self.mode_names[server_mode]}), power={server_power}W", "control")
+        charge, discharge, restrict = self.MODE_FLAGS[server_mode]
+        await self.ha.call_service_name(self.entity("enphase_charge_script"), {"charge": charge})
+        await self.ha.call_service_name(self.entity("enphase_discharge_script"), {"discharge": discharge})
+        if self.entity("enphase_restrict_command"):
+            await self.ha.call_service_name(self.entity("enphase_restrict_command"), {"restrict": restrict})
+
+
+DRIVERS = {d.vendor: d for d in (GoodWeDriver, SungrowDriver, EnphaseDriver)}
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Report-by-exception for the telemetry heartbeat.
+
+With report-by-exception on, a heartbeat is only uploaded when a field moved
+more than its deadband since the last value the backend received, or when
+the battery mode changed. Such an upload is a delta: client_id, reported_at,
+battery_mode and the changed fields, marked with "delta": true. After
+max_silence seconds without an upload a full heartbeat is sent as
+keep-alive, which also brings the backend back in sync.
+
+Baselines are only moved after a successful upload (call sent()), so a
+failed POST is retried next cycle and slow drift still adds up to a report.
+
+The single-vendor agents configure it from the environment: TEL_RBE (0/1),
+TEL_DEADBANDS ("soc=0.5,pv_power_w=50,..."), TEL_MAX_SILENCE (seconds,
+default 900). Each site of the multisite add-on and of the metdezon-bms
+integration passes its report_by_exception, telemetry_deadbands and
+telemetry_max_silence options to ReportByException instead.
+"""
+
+import os
+import time
+
+DEFAULT_DEADBANDS = "soc=0.5,pv_power_w=50,grid_power_w=50"
+
+# always part of a payload; battery_mode so the DB never gets NULL
+ALWAYS_KEYS = ("client_id", "reported_at", "battery_mode")
+
+
+def parse_deadbands(spec: str) -> dict:
+    """'soc=0.5,grid_power_w=50' -> {'soc': 0.5, 'grid_power_w': 50.0}"""
+    bands = {}
+    for part in (spec or "").split(","):
+        key, _, value = part.strip().partition("=")
+        if not key or not value:
+            continue
+        try:
+            bands[key.strip()] = float(value)
+        except ValueError:
+            continue
+    return bands
+
+
+class ReportByException:
+    def __init__(self, enabled: bool | None = None, deadbands: dict | None = None, max_silence: float | None = None):
+        if enabled is None:
+            enabled = os.environ.get("TEL_RBE", "0").lower() in ("1", "true", "yes")
+        self.enabled = enabled
+        if deadbands is None:
+            deadbands = parse_deadbands(os.environ.get("TEL_DEADBANDS") or DEFAULT_DEADBANDS)
+        self.deadbands = deadbands
+        if max_silence is None:
+            max_silence = float(os.environ.get("TEL_MAX_SILENCE") or 900)
+        self.max_silence = max_silence
+        self.last: dict = {}  # field -> value the backend last received
+        self.last_sent = None  # monotonic time of the last successful upload
+        self.skipped = 0
+
+    def _changed(self, key: str, value) -> bool:
+        if key not in self.last:
+            return True
+        old = self.last[key]
+        band = self.deadbands.get(key)
+        if band is not None and isinstance(value, (int, float)) and isinstance(old, (int, float)):
+            return abs(value - old) > band
+        return value != old
+
+    def filter(self, heartbeat: dict, now: float | None = None) -> dict | None:
+        """Payload to upload for this heartbeat, or None to stay silent."""
+        if not self.enabled:
+            return heartbeat
+        now = time.monotonic() if now is None else now
+        if self.last_sent is None or now - self.last_sent >= self.max_silence:
+            return heartbeat
+
+        changed = {
+            k: v for k, v in heartbeat.items() if k not in ALWAYS_KEYS and v is not None and self._changed(k, v)
+        }
+        if not changed and heartbeat.get("battery_mode") == self.last.get("battery_mode"):
+            self.skipped += 1
+            return None
+        payload = {k: heartbeat[k] for k in ALWAYS_KEYS if k in heartbeat}
+        payload.update(changed)
+        payload["delta"] = True
+        return payload
+
+    def sent(self, payload: dict, now: float | None = None) -> None:
+        """Record a successful upload of payload (as returned by filter())."""
+        for k, v in payload.items():
+            if k not in ("client_id", "reported_at", "delta"):
+                self.last[k] = v
+        self.last_sent = time.monotonic() if now is None else now
+        self.skipped = 0
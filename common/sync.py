@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Copy the shared modules from common/ into the folders that ship them.
+
+common/ is the only place to edit these modules. A Home Assistant add-on is
+built with its own folder as Docker build context, and the integration is
+installed as one folder, so each of them still carries a copy; this script
+writes those copies, and --check (run by the tests) fails on any copy that
+differs from its source.
+
+    python3 common/sync.py            # write the copies
+    python3 common/sync.py --check    # exit 1 and show a diff on drift
+"""
+
+import argparse
+import difflib
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMON = os.path.join(ROOT, "common")
+
+AGENTS = ("goodwe", "Sungrow", "enphase")
+
+# module in common/ -> folders that ship a copy
+TARGETS = {
+    "agentlog.py": AGENTS + ("multisite",),
+    "backend.py": ("multisite", "metdezon-bms"),
+    "diag.py": AGENTS,
+    "drivers.py": ("multisite", "metdezon-bms"),
+    "footprint.py": AGENTS,
+    "history.py": AGENTS,
+    "hotreload.py": AGENTS + ("multisite",),
+    "lite_http.py": AGENTS,
+    "mqttpush.py": AGENTS,
+    "reporting.py": AGENTS + ("multisite", "metdezon-bms"),
+    "setmode.py": ("goodwe", "multisite", "metdezon-bms"),
+}
+
+
+def _read(path: str) -> str | None:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def drift() -> list:
+    """[(copy path, source text, copy text or None)] for every copy that differs."""
+    out = []
+    for name, folders in sorted(TARGETS.items()):
+        source = _read(os.path.join(COMMON, name))
+        for folder in folders:
+            path = os.path.join(ROOT, folder, name)
+            copy = _read(path)
+            if copy != source:
+                out.append((path, source, copy))
+    return out
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--check", action="store_true", help="only report copies that differ from common/")
+    args = ap.parse_args()
+
+    stale = drift()
+    for path, source, copy in stale:
+        rel = os.path.relpath(path, ROOT)
+        if args.check:
+            if copy is None:
+                print(f"{rel}: missing")
+                continue
+            name = os.path.basename(path)
+            sys.stdout.writelines(
+                difflib.unified_diff(source.splitlines(True), copy.splitlines(True), f"common/{name}", rel)
+            )
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(source)
+            print(f"updated {rel}")
+    if args.check and stale:
+        print(f"{len(stale)} cop{'y' if len(stale) == 1 else 'ies'} out of sync; edit common/ and run common/sync.py")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
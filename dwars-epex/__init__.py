@@ -1,14 +1,87 @@
 from __future__ import annotations
 
-from homeassistant.core import HomeAssistant
+from typing import Any
+
+import voluptuous as vol
+
+from homeassistant.core import (
+    HomeAssistant,
+    ServiceCall,
+    ServiceResponse,
+    SupportsResponse,
+)
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import config_validation as cv
 from homeassistant.helpers.typing import ConfigType
+from homeassistant.util import dt as dt_util
+
+from .const import DOMAIN, LOGGER, SERVICE_GET_PRICES
+from .price_index import AGGREGATIONS, RESOLUTIONS
+from .tariff import SERIES
+
+GET_PRICES_SCHEMA = vol.Schema(
+    {
+        vol.Optional("start"): cv.datetime,
+        vol.Optional("end"): cv.datetime,
+        vol.Optional("resolution", default="native"): vol.In(RESOLUTIONS),
+        vol.Optional("aggregation", default="mean"): vol.In(AGGREGATIONS),
+        vol.Optional("series", default="raw"): vol.In(SERIES),
+    }
+)
+
+
+def _epoch(value: Any) -> float | None:
+    """Service-datetime (naive = lokale tijd) naar epoch-seconden."""
+    if value is None:
+        return None
+    return dt_util.as_utc(value).timestamp()
 
-from .const import DOMAIN, LOGGER
+
+def _iso(ts: float) -> str:
+    return dt_util.as_local(dt_util.utc_from_timestamp(ts)).isoformat()
 
 
 async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
     """Set up the Dwars EPEX integration from YAML."""
     LOGGER.debug("Setting up Dwars EPEX via YAML")
-    # Niks speciaals nodig, sensor-platform regelt de rest.
-    return True
+    # Sensor-platform regelt de fetch; hier alleen de query-service.
+    hass.data.setdefault(DOMAIN, {})
+
+    async def async_get_prices(call: ServiceCall) -> ServiceResponse:
+        """Ruwe of all-in prijzen in een tijdvenster, per kwartier, uur of dag."""
+        coordinator = hass.data[DOMAIN].get("coordinator")
+        if coordinator is None:
+            raise HomeAssistantError("Dwars EPEX: sensor platform not set up")
 
+        resolution = call.data["resolution"]
+        aggregation = call.data["aggregation"]
+        series = call.data["series"]
+        if series != "raw" and coordinator.tariff is None:
+            raise HomeAssistantError(
+                f"Dwars EPEX: series {series!r} needs a tariff block in the sensor config"
+            )
+        rows = coordinator.index.query(
+            _epoch(call.data.get("start")),
+            _epoch(call.data.get("end")),
+            resolution,
+            aggregation,
+            series,
+        )
+        for row in rows:
+            row["start"] = _iso(row["start"])
+        return {
+            "resolution": resolution,
+            "aggregation": aggregation,
+            "series": series,
+            "count": len(rows),
+            "prices": rows,
+        }
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_GET_PRICES,
+        async_get_prices,
+        schema=GET_PRICES_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+    return True
@@ -11,3 +11,7 @@ API_URL = "https://ems.dwarsenergie.nl/dayahead.php?range=2"
 # Zelfde interval als je command_line sensor: 3600 sec
 SCAN_INTERVAL = timedelta(hours=1)
 
+SERVICE_GET_PRICES = "get_prices"
+
+# sensor-platform optie met de tariefcomponenten (zie tariff.py)
+CONF_TARIFF = "tariff"
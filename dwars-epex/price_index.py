@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone, tzinfo
+from typing import Any
+
+from .tariff import SERIES, Tariff
+
+RESOLUTIONS = ("native", "hour", "day")
+AGGREGATIONS = ("mean", "min", "max", "stats")
+
+
+def _to_epoch(value: Any, tz: tzinfo) -> float | None:
+    """Timestamp uit de API (epoch s/ms of ISO-string) naar epoch-seconden."""
+    if isinstance(value, (int, float)):
+        return value / 1000 if value > 1e11 else float(value)
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        return _to_epoch(float(value), tz)
+    except ValueError:
+        pass
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00").replace(" ", "T"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=tz)
+    return dt.timestamp()
+
+
+def _pairs(data: dict[str, Any]) -> list[tuple[Any, Any]]:
+    """(timestamp, prijs)-paren uit 'timestamps'/'prices' of uit 'data'."""
+    if isinstance(data.get("timestamps"), list) and isinstance(data.get("prices"), list):
+        return list(zip(data["timestamps"], data["prices"]))
+    pairs = []
+    for row in data.get("data") or []:
+        if isinstance(row, dict):
+            ts = row.get("timestamp", row.get("time", row.get("start")))
+            pairs.append((ts, row.get("price")))
+    return pairs
+
+
+class PriceIndex:
+    """Gesorteerde, array-backed index over de prijsreeks.
+
+    Eén keer opgebouwd per fetch. Een query is een binary search op de
+    tijdas plus een slice; de uur- en dag-grenzen per punt liggen al klaar,
+    zodat aggregeren één lineaire pass over alleen de slice is. Naast de
+    ruwe prijs staan de all-in import- en exportreeksen van het tarief,
+    ook één keer per fetch berekend.
+    """
+
+    def __init__(
+        self,
+        data: dict[str, Any] | None,
+        tz: tzinfo = timezone.utc,
+        tariff: Tariff | None = None,
+    ) -> None:
+        """Bouw de index uit de API-response."""
+        points: dict[float, float] = {}
+        for raw_ts, raw_price in _pairs(data or {}):
+            ts = _to_epoch(raw_ts, tz)
+            try:
+                price = float(raw_price)
+            except (TypeError, ValueError):
+                continue
+            if ts is not None:
+                points[ts] = price  # dubbele tijdstempel: laatste wint
+
+        self.tz = tz
+        self.ts = array("d", sorted(points))
+        self.price = array("d", (points[t] for t in self.ts))
+        self.tariff = tariff or Tariff()
+        self.series = {name: self.tariff.apply(self.price, name) for name in SERIES}
+        # begin van het uur / de (lokale) dag van elk punt
+        self.hour = array("d", (t - t % 3600 for t in self.ts))
+        self.day = array("d", (self._day_start(t) for t in self.ts))
+
+    def _day_start(self, ts: float) -> float:
+        local = datetime.fromtimestamp(ts, self.tz)
+        return local.replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+    def __len__(self) -> int:
+        """Aantal prijspunten."""
+        return len(self.ts)
+
+    def bounds(self, start: float | None = None, end: float | None = None) -> tuple[int, int]:
+        """Indexbereik [i, j) van de punten met start <= ts < end."""
+        i = 0 if start is None else bisect_left(self.ts, start)
+        j = len(self.ts) if end is None else bisect_left(self.ts, end, i)
+        return i, j
+
+    def query(
+        self,
+        start: float | None = None,
+        end: float | None = None,
+        resolution: str = "native",
+        aggregation: str = "mean",
+        series: str = "raw",
+    ) -> list[dict[str, Any]]:
+        """Prijzen in [start, end), eventueel geaggregeerd per uur of dag."""
+        if series not in SERIES:
+            raise ValueError(f"unknown series {series!r}")
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"unknown resolution {resolution!r}")
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"unknown aggregation {aggregation!r}")
+        i, j = self.bounds(start, end)
+        price = self.series[series]
+        if resolution == "native":
+            return [{"start": self.ts[k], "price": price[k]} for k in range(i, j)]
+
+        keys = self.hour if resolution == "hour" else self.day
+        out = []
+        k = i
+        while k < j:
+            # punten zijn gesorteerd: een bucket is een aaneengesloten run
+            key = keys[k]
+            m = k + 1
+            while m < j and keys[m] == key:
+                m += 1
+            values = price[k:m]
+            out.append(self._aggregate(key, values, aggregation))
+            k = m
+        return out
+
+    @staticmethod
+    def _aggregate(key: float, values: array, aggregation: str) -> dict[str, Any]:
+        mean = sum(values) / len(values)
+        if aggregation == "mean":
+            return {"start": key, "price": mean}
+        if aggregation == "min":
+            return {"start": key, "price": min(values)}
+        if aggregation == "max":
+            return {"start": key, "price": max(values)}
+        return {
+            "start": key,
+            "mean": mean,
+            "min": min(values),
+            "max": max(values),
+            "count": len(values),
+        }
@@ -3,9 +3,14 @@ from __future__ import annotations
 from typing import Any
 
 import async_timeout
+import voluptuous as vol
 
-from homeassistant.components.sensor import SensorEntity
+from homeassistant.components.sensor import (
+    PLATFORM_SCHEMA as SENSOR_PLATFORM_SCHEMA,
+    SensorEntity,
+)
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers import config_validation as cv
 from homeassistant.helpers.aiohttp_client import async_get_clientsession
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
@@ -14,8 +19,27 @@ from homeassistant.helpers.update_coordinator import (
     CoordinatorEntity,
     DataUpdateCoordinator,
 )
+from homeassistant.util import dt as dt_util
+
+from .const import API_URL, CONF_TARIFF, DOMAIN, LOGGER, SCAN_INTERVAL
+from .price_index import PriceIndex
+from .tariff import Tariff
+
+TARIFF_SCHEMA = vol.Schema(
+    {
+        vol.Optional("energy_tax", default=0.0): vol.Coerce(float),
+        vol.Optional("surcharge", default=0.0): vol.Coerce(float),
+        vol.Optional("import_spread", default=0.0): vol.Coerce(float),
+        vol.Optional("export_spread", default=0.0): vol.Coerce(float),
+        vol.Optional("vat", default=0.0): vol.All(vol.Coerce(float), vol.Range(min=0, max=1)),
+        vol.Optional("export_energy_tax", default=False): cv.boolean,
+        vol.Optional("export_vat", default=False): cv.boolean,
+    }
+)
 
-from .const import API_URL, DOMAIN, LOGGER, SCAN_INTERVAL
+PLATFORM_SCHEMA = SENSOR_PLATFORM_SCHEMA.extend(
+    {vol.Optional(CONF_TARIFF): TARIFF_SCHEMA}
+)
 
 
 async def async_setup_platform(
@@ -25,7 +49,11 @@ async def async_setup_platform(
     discovery_info: DiscoveryInfoType | None = None,
 ) -> None:
     """Set up the Dwars EPEX sensors from YAML."""
-    coordinator = DwarsEpexCoordinator(hass)
+    # zonder tariff-blok alleen de ruwe spotprijs, geen all-in reeksen
+    tariff = Tariff.from_config(config[CONF_TARIFF]) if CONF_TARIFF in config else None
+    coordinator = DwarsEpexCoordinator(hass, tariff)
+    # de get_prices service (zie __init__.py) vraagt de index hier op
+    hass.data.setdefault(DOMAIN, {})["coordinator"] = coordinator
 
     # Eerste fetch zodat we data hebben bij het toevoegen
     await coordinator.async_refresh()
@@ -41,7 +69,7 @@ async def async_setup_platform(
 class DwarsEpexCoordinator(DataUpdateCoordinator[dict[str, Any] | None]):
     """Coordinator die de API van dwarsenergie.nl ophaalt."""
 
-    def __init__(self, hass: HomeAssistant) -> None:
+    def __init__(self, hass: HomeAssistant, tariff: Tariff | None = None) -> None:
         """Initialiseer de coordinator."""
         super().__init__(
             hass,
@@ -50,6 +78,10 @@ class DwarsEpexCoordinator(DataUpdateCoordinator[dict[str, Any] | None]):
             update_interval=SCAN_INTERVAL,
         )
         self._session = async_get_clientsession(hass)
+        self.tariff = tariff
+        self.index = PriceIndex(None, tariff=tariff)
+        # all-in reeksen in de volgorde van de ruwe 'prices', per fetch berekend
+        self.all_in: dict[str, Any] = {}
 
     async def _async_update_data(self) -> dict[str, Any] | None:
         """Haal data op van de API."""
@@ -61,8 +93,29 @@ class DwarsEpexCoordinator(DataUpdateCoordinator[dict[str, Any] | None]):
             data = await response.json()
 
         LOGGER.debug("Dwars EPEX: received data %s", data)
+        # één keer per fetch sorteren en tarief toepassen; queries zijn daarna binary search + slice
+        self.index = PriceIndex(data, dt_util.DEFAULT_TIME_ZONE, self.tariff)
+        self.all_in = self._all_in(data or {}) if self.tariff is not None else {}
         return data
 
+    def _all_in(self, data: dict[str, Any]) -> dict[str, Any]:
+        """import_/export_prices naast de ruwe 'prices', plus de gemiddelden."""
+        out: dict[str, Any] = {}
+        try:
+            avg = float(data.get("avg"))
+        except (TypeError, ValueError):
+            avg = None
+        prices = data.get("prices")
+        if not isinstance(prices, list) and isinstance(data.get("data"), list):
+            # alleen 'data'-rijen: zelfde volgorde als die rijen
+            prices = [row.get("price") if isinstance(row, dict) else None for row in data["data"]]
+        for series in ("import", "export"):
+            if isinstance(prices, list):
+                out[f"{series}_prices"] = self.tariff.apply_list(prices, series)
+            value = self.tariff.value(avg, series)
+            out[f"{series}_avg"] = round(value, 5) if value is not None else None
+        return out
+
 
 class DwarsEpexAveragePriceSensor(CoordinatorEntity, SensorEntity):
     """Representatie van de gemiddelde day-ahead prijs NL."""
@@ -70,6 +123,10 @@ class DwarsEpexAveragePriceSensor(CoordinatorEntity, SensorEntity):
     _attr_name = "Day Ahead Price NL"
     _attr_icon = "mdi:flash"
     _attr_native_unit_of_measurement = "€/kWh"
+    # de prijsreeksen horen niet in de recorder-database; ook via dwars_epex.get_prices op te vragen
+    _unrecorded_attributes = frozenset(
+        {"prices", "timestamps", "data", "import_prices", "export_prices"}
+    )
 
     def __init__(self, coordinator: DwarsEpexCoordinator) -> None:
         """Initialiseer de sensor."""
@@ -95,6 +152,10 @@ class DwarsEpexAveragePriceSensor(CoordinatorEntity, SensorEntity):
             if key in data:
                 attrs[key] = data[key]
 
+        # all-in reeksen van het tarief, zelfde volgorde als 'prices'
+        if self.coordinator.tariff is not None:
+            attrs.update(self.coordinator.all_in)
+            attrs["tariff"] = self.coordinator.tariff.as_dict()
         return attrs
 
     @property
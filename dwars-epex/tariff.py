@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from array import array
+from collections.abc import Iterable
+from typing import Any
+
+SERIES = ("raw", "import", "export")
+
+# componenten in €/kWh exclusief btw; vat als fractie (0.21)
+COMPONENTS = (
+    "energy_tax",
+    "surcharge",
+    "import_spread",
+    "export_spread",
+    "vat",
+    "export_energy_tax",
+    "export_vat",
+)
+
+
+class Tariff:
+    """All-in import- en exporttarief uit de EPEX-spotprijs.
+
+    import = (spot + surcharge + import_spread + energy_tax) * (1 + vat)
+    export = (spot - export_spread [+ energy_tax]) [* (1 + vat)]
+
+    Energiebelasting en btw op teruglevering staan aan bij salderen
+    (export_energy_tax / export_vat). Beide formules zijn a * spot + b;
+    de coëfficiënten liggen vast per configuratie, dus een hele reeks is
+    één pass over de array zonder per-kwartier herberekening.
+    """
+
+    def __init__(
+        self,
+        energy_tax: float = 0.0,
+        surcharge: float = 0.0,
+        import_spread: float = 0.0,
+        export_spread: float = 0.0,
+        vat: float = 0.0,
+        export_energy_tax: bool = False,
+        export_vat: bool = False,
+    ) -> None:
+        """Leid de coëfficiënten (a, b) per reeks af uit de componenten."""
+        self.energy_tax = float(energy_tax)
+        self.surcharge = float(surcharge)
+        self.import_spread = float(import_spread)
+        self.export_spread = float(export_spread)
+        self.vat = float(vat)
+        self.export_energy_tax = bool(export_energy_tax)
+        self.export_vat = bool(export_vat)
+
+        vat_mul = 1.0 + self.vat
+        export_mul = vat_mul if self.export_vat else 1.0
+        export_add = -self.export_spread + (self.energy_tax if self.export_energy_tax else 0.0)
+        self.coefficients: dict[str, tuple[float, float]] = {
+            "raw": (1.0, 0.0),
+            "import": (vat_mul, (self.surcharge + self.import_spread + self.energy_tax) * vat_mul),
+            "export": (export_mul, export_add * export_mul),
+        }
+
+    @classmethod
+    def from_config(cls, conf: dict[str, Any] | None) -> Tariff:
+        """Tarief uit de YAML-configuratie; onbekende sleutels worden genegeerd."""
+        conf = conf or {}
+        return cls(**{key: conf[key] for key in COMPONENTS if key in conf})
+
+    def as_dict(self) -> dict[str, Any]:
+        """De componenten, voor de sensor-attributen."""
+        return {key: getattr(self, key) for key in COMPONENTS}
+
+    def value(self, spot: float | None, series: str) -> float | None:
+        """Eén prijs (bv. het gemiddelde: een affiene afbeelding behoudt het)."""
+        if spot is None:
+            return None
+        a, b = self.coefficients[series]
+        return a * spot + b
+
+    def apply(self, prices: array, series: str) -> array:
+        """Hele reeks in één pass; prices is een array('d') zonder gaten."""
+        a, b = self.coefficients[series]
+        if (a, b) == (1.0, 0.0):
+            return prices
+        return array("d", [a * p + b for p in prices])
+
+    def apply_list(self, prices: Iterable[Any], series: str, ndigits: int = 5) -> list[float | None]:
+        """Zelfde voor de ruwe API-lijst (volgorde blijft, ongeldige waarden worden None)."""
+        a, b = self.coefficients[series]
+        out: list[float | None] = []
+        for p in prices:
+            try:
+                out.append(round(a * float(p) + b, ndigits))
+            except (TypeError, ValueError):
+                out.append(None)
+        return out
@@ -1,11 +1,20 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import footprint  # first: times the imports below when STARTUP_REPORT=1
+
 import os
 import time
-import requests
 import traceback
 
+from agentlog import AgentLog, install_dump_signal
+from lite_http import http_client
+from reporting import ReportByException
+import diag
+import history
+import hotreload
+import mqttpush
+
 # ========================
 # Env configuration
 # ========================
@@ -43,6 +52,18 @@ HA_URL_ENV = os.environ.get("HA_URL") or DEFAULT_HA_URL
 
 DISABLE_HA = os.environ.get("DISABLE_HA", "false").lower() in ("1", "true", "yes")
 
+# Optional MQTT push of actions (empty MQTT_HOST = HTTP polling only)
+MQTT_HOST          = os.environ.get("MQTT_HOST", "")
+MQTT_PORT          = int(os.environ.get("MQTT_PORT", "1883"))
+MQTT_USERNAME      = os.environ.get("MQTT_USERNAME", "")
+MQTT_PASSWORD      = os.environ.get("MQTT_PASSWORD", "")
+MQTT_TLS           = os.environ.get("MQTT_TLS", "false").lower() in ("1", "true", "yes")
+MQTT_TOPIC         = os.environ.get("MQTT_TOPIC", "metdezon/bms/{client_id}/action")
+# HTTP next_action becomes a slow consistency check while MQTT is connected
+MQTT_POLL_INTERVAL = int(os.environ.get("MQTT_POLL_INTERVAL", "600"))
+# Retained actions older than this (by their issued_at) are ignored
+MQTT_MAX_AGE       = int(os.environ.get("MQTT_MAX_AGE", "900"))
+
 # Enphase via HA-services / rest_command
 # Dit sluit aan op de namen uit de GitHub-handleiding.
 ENPHASE_CHARGE_SCRIPT = os.environ.get(
@@ -58,6 +79,14 @@ ENPHASE_RESTRICT_COMMAND = os.environ.get(
     "rest_command.enphase_battery_restrict_discharge",
 )
 
+# Enphase direct via de lokale Envoy API (envoy.py); leeg = via HA-scripts hierboven
+ENVOY_HOST = os.environ.get("ENVOY_HOST", "")
+ENVOY_TOKEN = os.environ.get("ENVOY_TOKEN", "")
+ENVOY_USERNAME = os.environ.get("ENVOY_USERNAME", "")
+ENVOY_PASSWORD = os.environ.get("ENVOY_PASSWORD", "")
+ENVOY_SERIAL = os.environ.get("ENVOY_SERIAL", "")
+ENVOY_RESERVE_SOC = int(os.environ.get("ENVOY_RESERVE_SOC", "10"))
+
 # X-API-Key voor MetDeZon backend
 HEADERS_EXT = {"X-API-Key": API_KEY} if API_KEY else {}
 
@@ -74,8 +103,72 @@ MODE_NAMES = {
 # ========================
 
 
-def log(msg: str) -> None:
-    print(f"[Enphase] {msg}", flush=True)
+LOG = AgentLog("Enphase", debug=DEBUG)
+RBE = ReportByException()  # TEL_RBE / TEL_DEADBANDS / TEL_MAX_SILENCE
+HTTP = http_client()  # lite_http, or requests with HTTP_CLIENT=requests
+DIAG = diag.Diagnostics(LOG)  # span traces + sampling profiler (DIAGNOSTICS / SIGUSR2)
+HISTORY = history.TelemetryHistory()  # last HISTORY_HOURS of heartbeats in memory (HISTORY_PORT)
+
+# Options that take effect without a restart (hotreload.py):
+# option -> (global, or $ENV var, type, run.sh default)
+RELOADABLE = {
+    "api_url":                  ("API_URL", str, "https://api.metdezon.nl/bms/api/next_action.php"),
+    "api_key":                  ("API_KEY", str, ""),
+    "telemetry_url":            ("TEL_URL", str, ""),
+    "poll_interval":            ("INTERVAL", int, 60),
+    "debug":                    ("DEBUG", hotreload.as_bool, False),
+    "soc_entity":               ("SOC_ENTITY", str, "sensor.enphase_battery_soc"),
+    "mode_entity":              ("MODE_ENTITY", str, ""),
+    "pv_entity":                ("PV_ENTITY", str, "sensor.pv_power"),
+    "grid_entity":              ("GRID_ENTITY", str, "sensor.grid_power"),
+    "ha_url":                   ("HA_URL_ENV", str, DEFAULT_HA_URL),
+    "ha_token":                 ("$HA_TOKEN", str, ""),
+    "client_id":                ("CLIENT_ID", str, ""),
+    "mqtt_host":                ("MQTT_HOST", str, ""),
+    "mqtt_port":                ("MQTT_PORT", int, 1883),
+    "mqtt_username":            ("MQTT_USERNAME", str, ""),
+    "mqtt_password":            ("MQTT_PASSWORD", str, ""),
+    "mqtt_tls":                 ("MQTT_TLS", hotreload.as_bool, False),
+    "mqtt_topic":               ("MQTT_TOPIC", str, "metdezon/bms/{client_id}/action"),
+    "mqtt_poll_interval":       ("MQTT_POLL_INTERVAL", int, 600),
+    "report_by_exception":      ("$TEL_RBE", hotreload.as_bool, False),
+    "telemetry_deadbands":      ("$TEL_DEADBANDS", str, ""),
+    "telemetry_max_silence":    ("$TEL_MAX_SILENCE", int, 900),
+    "http_client":              ("$HTTP_CLIENT", str, "lite"),
+    "enphase_charge_script":    ("ENPHASE_CHARGE_SCRIPT", str, "script.toggle_enphase_charge_from_grid"),
+    "enphase_discharge_script": ("ENPHASE_DISCHARGE_SCRIPT", str, "script.toggle_enphase_discharge_to_grid"),
+    "enphase_restrict_command": ("ENPHASE_RESTRICT_COMMAND", str, "rest_command.enphase_battery_restrict_discharge"),
+    "envoy_host":               ("ENVOY_HOST", str, ""),
+    "envoy_token":              ("ENVOY_TOKEN", str, ""),
+    "envoy_username":           ("ENVOY_USERNAME", str, ""),
+    "envoy_password":           ("ENVOY_PASSWORD", str, ""),
+    "envoy_serial":             ("ENVOY_SERIAL", str, ""),
+    "envoy_reserve_soc":        ("ENVOY_RESERVE_SOC", int, 10),
+}
+
+
+def log(msg: str, cat: str = "main") -> None:
+    LOG.info(cat, msg)
+
+
+def make_envoy():
+    if not ENVOY_HOST:
+        return None
+    # envoy.py brengt requests mee; alleen laden als de Envoy gebruikt wordt
+    from envoy import Envoy
+
+    return Envoy(
+        ENVOY_HOST,
+        token=ENVOY_TOKEN or None,
+        username=ENVOY_USERNAME or None,
+        password=ENVOY_PASSWORD or None,
+        serial=ENVOY_SERIAL or None,
+        reserve_soc=ENVOY_RESERVE_SOC,
+        log=LOG,
+    )
+
+
+ENVOY = make_envoy()
 
 
 def ha_base_url() -> str:
@@ -94,41 +187,41 @@ def get_ha_token():
     return None
 
 
+@DIAG.traced("ha.get", info_arg=0, ok=lambda r: r is not None)
 def ha_get_state(entity_id: str):
     if DISABLE_HA or not entity_id:
         return None
 
     token = get_ha_token()
     if not token:
-        log("ERROR: geen Home Assistant token (SUPERVISOR_TOKEN/HASSIO_TOKEN/HA_TOKEN).")
-        log("Als je buiten Supervisor draait, zet dan HA_URL en HA_TOKEN in de env.")
+        LOG.warn("ha", "geen Home Assistant token (SUPERVISOR_TOKEN/HASSIO_TOKEN/HA_TOKEN).")
+        LOG.warn("ha", "Als je buiten Supervisor draait, zet dan HA_URL en HA_TOKEN in de env.")
         return None
 
     url = f"{ha_base_url()}/states/{entity_id}"
     headers = {"Authorization": f"Bearer {token}"}
     try:
-        r = requests.get(url, headers=headers, timeout=5)
+        r = HTTP.get(url, headers=headers, timeout=5)
         if r.status_code == 200:
             return r.json()
         else:
-            if DEBUG:
-                log(f"HA GET {entity_id} -> {r.status_code} {r.text[:200]}")
+            if LOG.recording:
+                LOG.debug("ha", "GET %s -> %s %s", entity_id, r.status_code, r.text[:200])
     except Exception as e:
-        if DEBUG:
-            log(f"HA GET {entity_id} error: {e}")
+        LOG.debug("ha", "GET %s error: %s", entity_id, e)
     return None
 
 
+@DIAG.traced("ha.service", info_arg=1, ok=bool)
 def ha_call_service(domain: str, service: str, data: dict | None = None) -> bool:
     """Call HA service via REST API."""
     if DISABLE_HA:
-        if DEBUG:
-            log(f"HA disabled, skip service call {domain}.{service}")
+        LOG.debug("ha", "HA disabled, skip service call %s.%s", domain, service)
         return False
 
     token = get_ha_token()
     if not token:
-        log("ERROR: geen Home Assistant token om services aan te roepen.")
+        LOG.warn("ha", "geen Home Assistant token om services aan te roepen.")
         return False
 
     url = f"{ha_base_url()}/services/{domain}/{service}"
@@ -138,14 +231,13 @@ def ha_call_service(domain: str, service: str, data: dict | None = None) -> bool
     }
 
     try:
-        if DEBUG:
-            log(f"HA POST {domain}.{service} data={data}")
-        r = requests.post(url, headers=headers, json=data or {}, timeout=10)
-        if DEBUG:
-            log(f"HA service resp: {r.status_code} {r.text[:200]}")
+        LOG.debug("ha", "POST %s.%s data=%s", domain, service, data)
+        r = HTTP.post(url, headers=headers, json=data or {}, timeout=10)
+        if LOG.recording:
+            LOG.debug("ha", "service resp: %s %s", r.status_code, r.text[:200])
         return r.status_code in (200, 201)
     except Exception as e:
-        log(f"HA service error {domain}.{service}: {e}")
+        LOG.warn("ha", "service error %s.%s: %s", domain, service, e)
         if DEBUG:
             traceback.print_exc()
         return False
@@ -156,7 +248,7 @@ def ha_call_service_name(full_name: str, data: dict | None = None) -> bool:
     if not full_name:
         return False
     if "." not in full_name:
-        log(f"Invalid HA service '{full_name}' (expected 'domain.service')")
+        LOG.warn("ha", "Invalid HA service '%s' (expected 'domain.service')", full_name)
         return False
     domain, service = full_name.split(".", 1)
     return ha_call_service(domain, service, data)
@@ -167,6 +259,7 @@ def ha_call_service_name(full_name: str, data: dict | None = None) -> bool:
 # ========================
 
 
+@DIAG.traced("telemetry")
 def read_from_home_assistant() -> dict:
     out: dict = {}
 
@@ -222,47 +315,47 @@ def read_from_home_assistant() -> dict:
 # ========================
 
 
-def upload_telemetry(payload: dict) -> None:
+@DIAG.traced("upload", ok=bool)
+def upload_telemetry(payload: dict) -> bool:
     if not TEL_URL:
-        if DEBUG:
-            log("Geen TELEMETRY_URL geconfigureerd; skip telemetry")
-        return
+        LOG.debug("http", "Geen TELEMETRY_URL geconfigureerd; skip telemetry")
+        return False
     try:
-        if DEBUG:
-            log(f"POST {TEL_URL} -> {payload}")
-        r = requests.post(
+        LOG.debug("http", "POST %s -> %s", TEL_URL, payload)
+        r = HTTP.post(
             TEL_URL,
             headers=HEADERS_EXT,
             json=payload,
             timeout=10,
             verify=VERIFY_SSL,
         )
-        if DEBUG:
-            log(f"TEL HTTP {r.status_code} {r.text[:200]}")
+        if LOG.recording:
+            LOG.debug("http", "TEL HTTP %s %s", r.status_code, r.text[:200])
         r.raise_for_status()
+        return True
     except Exception as e:
-        log(f"Telemetry upload error: {e}")
+        LOG.warn("http", "Telemetry upload error: %s", e)
         if DEBUG:
             traceback.print_exc()
+        return False
 
 
+@DIAG.traced("fetch")
 def fetch_next_action() -> tuple[int, int]:
     """Vraag de volgende actie op bij de MetDeZon backend."""
     if not API_URL:
         return -1, 0
 
-    if DEBUG:
-        log(f"HTTP GET {API_URL} (verify_ssl={VERIFY_SSL}) …")
+    LOG.debug("http", "GET %s (verify_ssl=%s)", API_URL, VERIFY_SSL)
 
-    r = requests.get(API_URL, headers=HEADERS_EXT, timeout=10, verify=VERIFY_SSL)
-    if DEBUG:
-        log(f"HTTP {r.status_code}, len={len(r.content)}")
+    r = HTTP.get(API_URL, headers=HEADERS_EXT, timeout=10, verify=VERIFY_SSL)
+    LOG.debug("http", "HTTP %s, len=%s", r.status_code, len(r.content))
     r.raise_for_status()
 
     try:
         data = r.json()
     except Exception as e:
-        log(f"JSON decode error: {e}")
+        LOG.warn("http", "JSON decode error: %s", e)
         if DEBUG:
             traceback.print_exc()
         return -1, 0
@@ -284,9 +377,11 @@ def fetch_next_action() -> tuple[int, int]:
 # Enphase mode mapping
 # ========================
 
+@DIAG.traced("apply", info_arg=0)
 def apply_enphase_mode(server_mode: int, server_power: int) -> None:
     """
-    Vertaal MetDeZon policy -> Enphase battery mode via Home Assistant.
+    Vertaal MetDeZon policy -> Enphase battery mode via Home Assistant,
+    of rechtstreeks via de Envoy als ENVOY_HOST gezet is.
 
     Belangrijk:
       * Idle (7) = zelfconsumptie:
@@ -296,7 +391,19 @@ def apply_enphase_mode(server_mode: int, server_power: int) -> None:
       * power (server_power) wordt nu alleen gelogd, Enphase krijgt geen hard limiet.
     """
     name = MODE_NAMES.get(server_mode, "Unknown")
-    log(f"Apply policy mode {server_mode} ({name}), power={server_power}W")
+    log(f"Apply policy mode {server_mode} ({name}), power={server_power}W", "control")
+
+    if ENVOY is not None:
+        if server_mode not in (1, 3, 4, 7):
+            log(f"Onbekende server_mode {server_mode}; geen Enphase-actie.", "control")
+        else:
+            with DIAG.span("inverter.write", server_mode):
+                written = ENVOY.apply_mode(server_mode)
+            if written:
+                log(f"Envoy storage_settings bijgewerkt voor mode {server_mode}", "control")
+            else:
+                LOG.debug("control", "Envoy staat al in mode %s; niets geschreven", server_mode)
+        return
 
     # We gaan uit van de scripts zoals in de handleiding:
     # - script.toggle_enphase_charge_from_grid(charge: bool)
@@ -333,7 +440,75 @@ def apply_enphase_mode(server_mode: int, server_power: int) -> None:
             ha_call_service_name(ENPHASE_RESTRICT_COMMAND, {"restrict": True})
 
     else:
-        log(f"Onbekende server_mode {server_mode}; geen Enphase-actie.")
+        log(f"Onbekende server_mode {server_mode}; geen Enphase-actie.", "control")
+
+
+# ========================
+# MQTT push (optional)
+# ========================
+# The backend publishes the next_action JSON for each client on a retained
+# topic. A pushed action is applied as soon as it arrives; polling keeps going
+# at MQTT_POLL_INTERVAL while the broker is connected, INTERVAL otherwise.
+
+PUSH = mqttpush.ActionPush(LOG, MQTT_MAX_AGE)
+
+
+def mqtt_start():
+    if not MQTT_HOST:
+        return
+    if not CLIENT_ID:
+        LOG.warn("mqtt", "MQTT_HOST set but no CLIENT_ID for the topic; HTTP polling only")
+        return
+    PUSH.start(
+        MQTT_HOST,
+        MQTT_PORT,
+        MQTT_TOPIC.format(client_id=CLIENT_ID),
+        client_id=f"metdezon-{CLIENT_ID}",
+        username=MQTT_USERNAME,
+        password=MQTT_PASSWORD,
+        tls=MQTT_TLS,
+    )
+
+
+def poll_interval() -> int:
+    if PUSH.connected:
+        return max(INTERVAL, MQTT_POLL_INTERVAL)
+    return INTERVAL
+
+
+def wait_for_push(timeout: float) -> tuple[int, int] | None:
+    """Sleep up to timeout; return a pushed action as soon as one arrives."""
+    return PUSH.wait(timeout)
+
+
+def mqtt_stop():
+    PUSH.stop()
+
+
+def reload_options(watcher: hotreload.OptionsWatcher) -> None:
+    """Apply changed options between cycles; rebuild only what depends on them."""
+    global HEADERS_EXT, RBE, HTTP, ENVOY
+    changes = watcher.changes()
+    if not changes:
+        return
+    applied, restart = hotreload.apply(changes, RELOADABLE, globals())
+    if "API_KEY" in applied:
+        HEADERS_EXT = {"X-API-Key": API_KEY} if API_KEY else {}
+    if "DEBUG" in applied:
+        LOG.set_debug(DEBUG)
+    if {"$TEL_RBE", "$TEL_DEADBANDS", "$TEL_MAX_SILENCE"} & set(applied):
+        RBE = ReportByException()
+    if "$HTTP_CLIENT" in applied:
+        HTTP = http_client(os.environ.get("HTTP_CLIENT"))
+    if any(n.startswith("ENVOY_") for n in applied):
+        ENVOY = make_envoy()
+    if any(n.startswith("MQTT_") for n in applied) or "CLIENT_ID" in applied:
+        mqtt_stop()
+        mqtt_start()
+    # option names only: values may be passwords
+    log(f"Options reloaded: {', '.join(k for k in sorted(changes) if k not in restart) or '-'}")
+    if restart:
+        LOG.warn("main", "Changed options that need an add-on restart: %s", ", ".join(restart))
 
 
 # ========================
@@ -342,33 +517,70 @@ def apply_enphase_mode(server_mode: int, server_power: int) -> None:
 
 def loop() -> None:
     token_present = bool(get_ha_token())
+    install_dump_signal()
     log(f"Agent up. verify_ssl={VERIFY_SSL} debug={DEBUG}")
     log(f"HA_URL={ha_base_url()} token_present={token_present} disable_ha={DISABLE_HA}")
+    if ENVOY is not None:
+        log(f"Envoy direct: {ENVOY.base} (reserve {ENVOY_RESERVE_SOC}%)")
+
+    startup_reported = False
+    watcher = None
+    if hotreload.OPTIONS_RELOAD:
+        watcher = hotreload.OptionsWatcher()
+        watcher.install_signal(wake=PUSH.wake)
+    DIAG.install_signal()
+    if diag.DIAGNOSTICS:
+        DIAG.start()
+
+    history.serve(HISTORY, log=LOG)
+    mqtt_start()
+    next_poll = 0.0
+    last_action = None
 
     while True:
+        pushed = wait_for_push(max(0.0, next_poll - time.monotonic()))
+        if watcher is not None:
+            try:
+                reload_options(watcher)
+            except Exception as e:
+                LOG.error("main", "options reload failed: %s", e)
+        if pushed is not None and pushed == last_action:
+            continue
+        DIAG.begin()
         try:
-            # 1) Vraag volgende actie op
-            server_mode, server_power = fetch_next_action()
-            if DEBUG:
-                log(f"server_mode={server_mode}, server_power={server_power}")
+            if pushed is not None:
+                server_mode, server_power = pushed
+                log(f"MQTT push: mode={server_mode} power={server_power}", "control")
+            else:
+                next_poll = time.monotonic() + poll_interval()
+                # 1) Vraag volgende actie op
+                server_mode, server_power = fetch_next_action()
+            last_action = (server_mode, server_power)
+            LOG.debug("cycle", "server_mode=%s, server_power=%s", server_mode, server_power)
 
             if server_mode > 0:
                 apply_enphase_mode(server_mode, server_power)
             else:
-                log(f"Geen geldige server mode ({server_mode}); skip set_mode.")
+                log(f"Geen geldige server mode ({server_mode}); skip set_mode.", "control")
 
-            # 2) Telemetry uit HA lezen & heartbeat sturen
-            tel = read_from_home_assistant() if not DISABLE_HA else {}
+            # 2) Telemetry (Envoy of HA) lezen & heartbeat sturen
+            if ENVOY is not None:
+                with DIAG.span("envoy.read"):
+                    tel = ENVOY.read_telemetry()
+            else:
+                tel = read_from_home_assistant() if not DISABLE_HA else {}
             if tel:
-                if "soc_pct" in tel:
-                    log(f"SOC uit HA: {tel['soc_pct']}%")
-                if "mode" in tel:
-                    m = tel["mode"]
-                    log(f"Mode uit HA: {m} ({MODE_NAMES.get(m, 'Unknown')})")
-                if "pv_power_w" in tel:
-                    log(f"PV power uit HA: {tel['pv_power_w']} W")
-                if "grid_power_w" in tel:
-                    log(f"Grid power uit HA: {tel['grid_power_w']} W")
+                # één regel per cyclus, rate-limited (LOG_RATE "telemetry")
+                LOG.info(
+                    "telemetry",
+                    "Uit %s: SOC=%s%% mode=%s (%s) PV=%sW grid=%sW",
+                    "Envoy" if ENVOY is not None else "HA",
+                    tel.get("soc_pct"),
+                    tel.get("mode"),
+                    MODE_NAMES.get(tel.get("mode"), "Unknown"),
+                    tel.get("pv_power_w"),
+                    tel.get("grid_power_w"),
+                )
 
             heartbeat = {
                 "client_id": CLIENT_ID,
@@ -380,20 +592,33 @@ def loop() -> None:
                 "grid_power_w": tel.get("grid_power_w") if tel else None,
             }
 
+            # lokale historie houdt elke cyclus bij, ook wat report-by-exception overslaat
+            HISTORY.record(heartbeat)
+
             # None-velden eruit, behalve battery_mode
             payload = {
                 k: v
                 for k, v in heartbeat.items()
                 if v is not None or k == "battery_mode"
             }
-            upload_telemetry(payload)
+            # report-by-exception: alleen wijzigingen buiten de deadbands, plus keep-alive
+            payload = RBE.filter(payload)
+            if payload is None:
+                LOG.debug("telemetry", "Geen significante wijziging; heartbeat overgeslagen (%s op rij)", RBE.skipped)
+            elif upload_telemetry(payload):
+                RBE.sent(payload)
 
         except Exception as e:
-            log(f"ERROR: {e}")
+            DIAG.fail(e)
+            LOG.error("cycle", "%s", e)
             if DEBUG:
                 traceback.print_exc()
+        DIAG.end()
 
-        time.sleep(INTERVAL)
+        if not startup_reported:
+            startup_reported = True
+            LOG.info("startup", "%s", footprint.report())
+            footprint.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Lokale Envoy API: batterij-instellingen en meterdata zonder HA-scripts.
+
+Eén requests.Session (keep-alive, connection pool) naar de Envoy. Het JWT
+wordt gecachet in /data (overleeft herstarts) en pas vernieuwd als het bijna
+verloopt of de Envoy 401 geeft; vernieuwen kan alleen met Enlighten-
+credentials, anders moet envoy_token handmatig geplakt worden.
+
+Endpoints (firmware 7.x/8.x, IQ Battery):
+  GET  /production.json?details=1   productie + net-consumption (W)
+  GET  /ivp/ensemble/secctrl        agg_soc
+  GET  /admin/lib/tariff            tariff incl. storage_settings
+  PUT  /admin/lib/tariff            idem, terugschrijven
+
+Mock voor tests: mock_envoy.py.
+"""
+
+import base64
+import json
+import os
+import time
+
+import requests
+
+ENLIGHTEN_LOGIN_URL = os.environ.get("ENLIGHTEN_LOGIN_URL", "https://enlighten.enphaseenergy.com/login/login.json")
+ENTREZ_TOKEN_URL = os.environ.get("ENTREZ_TOKEN_URL", "https://entrez.enphaseenergy.com/tokens")
+TOKEN_CACHE = os.environ.get("ENVOY_TOKEN_CACHE", "/data/envoy_token.json")
+
+# server_mode -> (storage mode, charge_from_grid); reserve: zie Envoy.apply_mode
+STORAGE_MODES = {
+    7: ("self-consumption", False),
+    3: ("backup", True),  # backup laadt tot 100%, met charge_from_grid ook uit het net
+    4: ("savings-mode", False),  # ontladen naar het net volgens het tariefschema van de Envoy
+    1: ("self-consumption", False),  # hold: reserve = SOC bij de start van hold
+}
+
+
+def _jwt_exp(token: str) -> float:
+    """exp-claim uit het JWT (niet geverifieerd; alleen voor de cache)."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return 0.0
+
+
+class EnvoyError(Exception):
+    pass
+
+
+class Envoy:
+    def __init__(
+        self,
+        host: str,
+        token: str | None = None,
+        username: str | None = None,
+        password: str | None = None,
+        serial: str | None = None,
+        reserve_soc: int = 10,
+        verify_ssl: bool = False,
+        timeout: float = 10,
+        log=None,
+    ):
+        self.base = host if "://" in host else f"https://{host}"
+        self.base = self.base.rstrip("/")
+        self.username = username
+        self.password = password
+        self.serial = serial
+        self.reserve_soc = reserve_soc
+        self.timeout = timeout
+        self.log = log  # AgentLog
+        self.hold_reserve: int | None = None  # reserve zolang hold (mode 1) loopt
+        self.session = requests.Session()
+        self.session.verify = verify_ssl
+        if not verify_ssl:
+            # Envoy heeft een self-signed certificaat
+            import urllib3
+
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        self.token = token or self._load_cached_token()
+        if self.token:
+            self.session.headers["Authorization"] = f"Bearer {self.token}"
+
+    # ---- token -----------------------------------------------------------
+
+    def _load_cached_token(self) -> str | None:
+        try:
+            with open(TOKEN_CACHE, encoding="utf-8") as f:
+                return json.load(f).get("token")
+        except (OSError, ValueError):
+            return None
+
+    def _save_token(self, token: str) -> None:
+        try:
+            with open(TOKEN_CACHE, "w", encoding="utf-8") as f:
+                json.dump({"token": token, "exp": _jwt_exp(token)}, f)
+        except OSError as e:
+            if self.log:
+                self.log.warn("envoy", "token cache %s: %s", TOKEN_CACHE, e)
+
+    def refresh_token(self) -> None:
+        if not (self.username and self.password and self.serial):
+            raise EnvoyError("Envoy token expired/rejected and no Enlighten credentials to renew it")
+        r = requests.post(
+            ENLIGHTEN_LOGIN_URL,
+            data={"user[email]": self.username, "user[password]": self.password},
+            timeout=self.timeout,
+        )
+        r.raise_for_status()
+        session_id = r.json()["session_id"]
+        r = requests.post(
+            ENTREZ_TOKEN_URL,
+            json={"session_id": session_id, "serial_num": self.serial, "username": self.username},
+            timeout=self.timeout,
+        )
+        r.raise_for_status()
+        self.token = r.text.strip()
+        self.session.headers["Authorization"] = f"Bearer {self.token}"
+        self._save_token(self.token)
+        if self.log:
+            self.log.info("envoy", "new Envoy token, valid until %s", time.strftime("%F", time.localtime(_jwt_exp(self.token))))
+
+    def _ensure_token(self) -> None:
+        # een dag marge: vernieuwen voordat de Envoy ons afwijst
+        if not self.token or (_jwt_exp(self.token) and _jwt_exp(self.token) - time.time() < 86400):
+            if self.username and self.password and self.serial:
+                self.refresh_token()
+
+    # ---- HTTP ------------------------------------------------------------
+
+    def request(self, method: str, path: str, **kw) -> requests.Response:
+        self._ensure_token()
+        kw.setdefault("timeout", self.timeout)
+        r = self.session.request(method, self.base + path, **kw)
+        if r.status_code == 401 and self.username:
+            self.refresh_token()
+            r = self.session.request(method, self.base + path, **kw)
+        if r.status_code == 401:
+            raise EnvoyError(f"{method} {path}: 401 (token invalid)")
+        r.raise_for_status()
+        return r
+
+    def get_json(self, path: str):
+        return self.request("GET", path).json()
+
+    # ---- meterdata -------------------------------------------------------
+
+    def read_telemetry(self) -> dict:
+        out: dict = {}
+        prod = self.get_json("/production.json?details=1")
+        for p in prod.get("production", []):
+            if p.get("measurementType") == "production" or (p.get("type") == "inverters" and "pv_power_w" not in out):
+                out["pv_power_w"] = int(p.get("wNow", 0))
+        for c in prod.get("consumption", []):
+            if c.get("measurementType") == "net-consumption":
+                out["grid_power_w"] = int(c.get("wNow", 0))  # > 0 = import
+        try:
+            out["soc_pct"] = self.read_soc()
+        except (requests.RequestException, ValueError, EnvoyError) as e:
+            if self.log:
+                self.log.debug("envoy", "secctrl: %s", e)
+        return out
+
+    def read_soc(self) -> float:
+        soc = self.get_json("/ivp/ensemble/secctrl").get("agg_soc")
+        if soc is None:
+            raise EnvoyError("secctrl: geen agg_soc")
+        return float(soc)
+
+    # ---- batterij-instellingen ------------------------------------------
+
+    def storage_settings(self) -> tuple[dict, dict]:
+        data = self.get_json("/admin/lib/tariff")
+        tariff = data.get("tariff", data)
+        return tariff, dict(tariff.get("storage_settings") or {})
+
+    def set_storage(self, mode: str, charge_from_grid: bool, reserve_soc: int) -> bool:
+        """Alleen een PUT als er echt iets verandert. True = geschreven."""
+        tariff, current = self.storage_settings()
+        wanted = {**current, "mode": mode, "charge_from_grid": charge_from_grid, "reserved_soc": reserve_soc}
+        if wanted == current:
+            return False
+        tariff["storage_settings"] = wanted
+        self.request("PUT", "/admin/lib/tariff", json={"tariff": tariff})
+        return True
+
+    def apply_mode(self, server_mode: int) -> bool:
+        mode, cfg = STORAGE_MODES[server_mode]
+        reserve = self.reserve_soc
+        if server_mode == 1:
+            # vasthouden: reserve op de SOC bij de start van hold zet ontladen stil.
+            # Die reserve blijft staan zolang hold duurt, anders volgt er elke
+            # cyclus een PUT omdat de SOC een procent verschuift.
+            if self.hold_reserve is None:
+                self.hold_reserve = max(self.reserve_soc, min(100, int(round(self.read_soc()))))
+            reserve = self.hold_reserve
+        else:
+            self.hold_reserve = None
+        return self.set_storage(mode, cfg, reserve)
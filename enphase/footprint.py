@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Startup and memory report for the agents.
+
+Import this module first. With STARTUP_REPORT=1 it times every module
+imported after it (own time, without nested imports); report() then gives
+one line with startup time, current and peak RSS, the number of loaded
+modules and the slowest imports. Without STARTUP_REPORT nothing is hooked
+and report() only reads the RSS figures.
+
+Environment: STARTUP_REPORT (0/1), STARTUP_REPORT_TOP (default 8).
+"""
+
+import os
+import sys
+import time
+
+STARTUP_REPORT = os.environ.get("STARTUP_REPORT", "false").lower() in ("1", "true", "yes")
+TOP = int(os.environ.get("STARTUP_REPORT_TOP", "8"))
+
+T0 = time.monotonic()
+
+_self_time: dict = {}  # module -> seconds spent in its own body
+_stack: list = []  # child time accumulated per active import
+
+
+class _TimingLoader:
+    def __init__(self, loader):
+        self._loader = loader
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        _stack.append(0.0)
+        t = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            total = time.perf_counter() - t
+            children = _stack.pop()
+            _self_time[module.__name__] = total - children
+            if _stack:
+                _stack[-1] += total
+
+
+class _TimingFinder:
+    """Wraps the loader the other finders return; finds nothing itself."""
+
+    @classmethod
+    def find_spec(cls, name, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is cls or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimingLoader(spec.loader)
+                return spec
+        return None
+
+
+if STARTUP_REPORT:
+    sys.meta_path.insert(0, _TimingFinder)
+
+
+def _status_kb(field: str) -> int | None:
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def rss_mb() -> tuple[float | None, float | None]:
+    """(current, peak) resident set size in MB."""
+    cur = _status_kb("VmRSS")
+    peak = _status_kb("VmHWM")
+    if peak is None:
+        try:
+            import resource
+
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # kB on Linux
+        except (ImportError, OSError):
+            pass
+    return (cur / 1024 if cur else None), (peak / 1024 if peak else None)
+
+
+def slowest(n: int = TOP) -> list:
+    """[(module, ms)] for the n slowest imports since this module was loaded."""
+    top = sorted(_self_time.items(), key=lambda kv: kv[1], reverse=True)[:n]
+    return [(name, t * 1000) for name, t in top]
+
+
+def report() -> str:
+    cur, peak = rss_mb()
+    parts = [
+        f"startup {1000 * (time.monotonic() - T0):.0f}ms",
+        f"RSS {cur:.1f}MB" if cur else "RSS ?",
+        f"peak {peak:.1f}MB" if peak else "peak ?",
+        f"{len(sys.modules)} modules",
+    ]
+    if _self_time:
+        total = sum(_self_time.values()) * 1000
+        parts.append(f"imports {total:.0f}ms: " + ", ".join(f"{m} {ms:.0f}ms" for m, ms in slowest()))
+    return ", ".join(parts)
+
+
+def stop() -> None:
+    """Unhook the import timer (the numbers collected so far stay)."""
+    if _TimingFinder in sys.meta_path:
+        sys.meta_path.remove(_TimingFinder)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Small HTTP client on the standard library, for the agents' few calls.
+
+Covers exactly what the agents use from requests: get()/post() with
+headers, json, timeout and verify, and a response with status_code, text,
+content, json() and raise_for_status(). Connections are kept alive per
+(scheme, host, port, verify), so the backend and the Supervisor proxy each
+cost one TCP/TLS handshake instead of one per call.
+
+http_client() returns this module or requests, depending on HTTP_CLIENT
+(lite|requests, default lite); requests is then only imported when chosen.
+"""
+
+import http.client
+import json as _json
+import os
+import ssl
+import threading
+import urllib.parse
+
+HTTP_CLIENT = os.environ.get("HTTP_CLIENT", "lite").lower()
+
+
+class HTTPError(IOError):
+    def __init__(self, msg: str, response=None):
+        super().__init__(msg)
+        self.response = response
+
+
+class Response:
+    def __init__(self, status: int, reason: str, headers, content: bytes, url: str):
+        self.status_code = status
+        self.reason = reason
+        self.headers = headers
+        self.content = content
+        self.url = url
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", "replace")
+
+    def json(self):
+        return _json.loads(self.content)
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise HTTPError(f"{self.status_code} {self.reason} for url: {self.url}", self)
+
+
+_pool: dict = {}
+_pool_lock = threading.Lock()
+_contexts: dict = {}
+
+
+def _ssl_context(verify: bool) -> ssl.SSLContext:
+    ctx = _contexts.get(verify)
+    if ctx is None:
+        ctx = ssl.create_default_context()
+        if not verify:
+            ctx.check_hostname = False
+            ctx.verify_mode = ssl.CERT_NONE
+        _contexts[verify] = ctx
+    return ctx
+
+
+def _checkout(key: tuple, timeout: float) -> http.client.HTTPConnection:
+    with _pool_lock:
+        idle = _pool.get(key)
+        conn = idle.pop() if idle else None
+    if conn is None:
+        scheme, host, port, verify = key
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(host, port, timeout=timeout, context=_ssl_context(verify))
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    else:
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+    return conn
+
+
+def _checkin(key: tuple, conn: http.client.HTTPConnection) -> None:
+    with _pool_lock:
+        _pool.setdefault(key, []).append(conn)
+
+
+def request(method: str, url: str, headers: dict | None = None, json=None, data=None,
+            timeout: float = 10, verify: bool = True) -> Response:
+    parts = urllib.parse.urlsplit(url)
+    scheme = parts.scheme or "http"
+    port = parts.port or (443 if scheme == "https" else 80)
+    key = (scheme, parts.hostname, port, bool(verify) if scheme == "https" else True)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+
+    hdrs = {"Accept": "*/*", "User-Agent": "metdezon-agent"}
+    hdrs.update(headers or {})
+    body = data
+    if json is not None:
+        body = _json.dumps(json).encode()
+        hdrs.setdefault("Content-Type", "application/json")
+    elif isinstance(body, str):
+        body = body.encode()
+
+    # a kept-alive connection may have been closed by the server meanwhile: retry once on a fresh one
+    for attempt in (0, 1):
+        conn = _checkout(key, timeout)
+        reused = conn.sock is not None
+        try:
+            conn.request(method, path, body=body, headers=hdrs)
+            resp = conn.getresponse()
+            content = resp.read()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conn.close()
+            if reused and attempt == 0:
+                continue
+            raise
+        except Exception:
+            conn.close()
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            _checkin(key, conn)
+        return Response(resp.status, resp.reason, resp.headers, content, url)
+
+
+def get(url: str, **kw) -> Response:
+    return request("GET", url, **kw)
+
+
+def post(url: str, **kw) -> Response:
+    return request("POST", url, **kw)
+
+
+def http_client(name: str | None = None):
+    """The module the agent calls .get()/.post() on."""
+    if (name or HTTP_CLIENT).lower() == "requests":
+        import requests
+
+        return requests
+    import sys
+
+    return sys.modules[__name__]
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Lokale stand-in voor de Envoy (en de Enlighten token-endpoints).
+
+Plain HTTP, zelfde JSON-vorm als de echte Envoy voor de endpoints die
+envoy.py gebruikt. De SOC loopt mee met de ingestelde storage mode, zodat
+het agent zonder batterij end-to-end te testen is:
+
+    python3 mock_envoy.py --port 8089 --token test
+    ENVOY_HOST=http://127.0.0.1:8089 ENVOY_TOKEN=test python3 enphase_agent.py
+
+Token vernieuwen testen: start zonder --token geldig te geven en zet
+ENLIGHTEN_LOGIN_URL=http://127.0.0.1:8089/login/login.json
+ENTREZ_TOKEN_URL=http://127.0.0.1:8089/tokens (elk wachtwoord werkt).
+"""
+
+import argparse
+import base64
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_token(valid_s: int = 365 * 86400) -> str:
+    def b64(obj) -> str:
+        return base64.urlsafe_b64encode(json.dumps(obj).encode()).decode().rstrip("=")
+
+    return f"{b64({'alg': 'none'})}.{b64({'exp': int(time.time()) + valid_s})}.mock"
+
+
+class MockEnvoy:
+    def __init__(self, token: str, capacity_wh: float = 5000.0):
+        self.tokens = {token}
+        self.capacity_wh = capacity_wh
+        self.soc = 50.0
+        self.pv_w = 1200
+        self.load_w = 600
+        self.updated = time.monotonic()
+        self.tariff = {
+            "currency": {"code": "EUR"},
+            "storage_settings": {
+                "mode": "self-consumption",
+                "operation_mode_sub_type": "",
+                "reserved_soc": 10.0,
+                "very_low_soc": 5,
+                "charge_from_grid": False,
+            },
+        }
+        self.puts = 0
+        self.lock = threading.Lock()
+
+    def battery_w(self) -> int:
+        """> 0 = laden."""
+        ss = self.tariff["storage_settings"]
+        surplus = self.pv_w - self.load_w
+        if ss["mode"] == "backup" and ss["charge_from_grid"]:
+            return 3000 if self.soc < 100 else 0
+        if ss["mode"] == "savings-mode":
+            return -3000 if self.soc > ss["reserved_soc"] else 0
+        if surplus < 0 and self.soc <= ss["reserved_soc"]:
+            return 0
+        if surplus > 0 and self.soc >= 100:
+            return 0
+        return surplus
+
+    def step(self) -> None:
+        now = time.monotonic()
+        dt = now - self.updated
+        self.updated = now
+        self.soc = min(100.0, max(0.0, self.soc + self.battery_w() * dt / 3600 / self.capacity_wh * 100))
+
+    def production(self) -> dict:
+        self.step()
+        net = self.load_w + self.battery_w() - self.pv_w  # > 0 = import
+        return {
+            "production": [
+                {"type": "inverters", "activeCount": 10, "wNow": self.pv_w},
+                {"type": "eim", "measurementType": "production", "wNow": float(self.pv_w)},
+            ],
+            "consumption": [
+                {"type": "eim", "measurementType": "total-consumption", "wNow": float(self.load_w)},
+                {"type": "eim", "measurementType": "net-consumption", "wNow": float(net)},
+            ],
+        }
+
+
+def make_handler(env: MockEnvoy):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, zoals de echte Envoy
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send(self, code: int, body) -> None:
+            raw = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "text/plain" if isinstance(body, str) else "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def _body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        def _authorized(self) -> bool:
+            auth = self.headers.get("Authorization", "")
+            if auth.startswith("Bearer ") and auth[7:] in env.tokens:
+                return True
+            self._send(401, {"error": "unauthorized"})
+            return False
+
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if not self._authorized():
+                return
+            with env.lock:
+                if path == "/production.json":
+                    self._send(200, env.production())
+                elif path == "/ivp/ensemble/secctrl":
+                    env.step()
+                    self._send(200, {"agg_soc": round(env.soc), "Enc_commissioned_capacity": env.capacity_wh})
+                elif path == "/admin/lib/tariff":
+                    self._send(200, {"tariff": env.tariff, "schedule": {}})
+                else:
+                    self._send(404, {"error": "not found"})
+
+        def do_PUT(self):
+            body = self._body()
+            if not self._authorized():
+                return
+            if self.path != "/admin/lib/tariff":
+                self._send(404, {"error": "not found"})
+                return
+            with env.lock:
+                env.step()
+                tariff = json.loads(body)["tariff"]
+                env.tariff = tariff
+                env.puts += 1
+            self._send(200, {"tariff": env.tariff})
+
+        def do_POST(self):
+            body = self._body()
+            if self.path == "/login/login.json":
+                self._send(200, {"session_id": "mock-session", "message": "success"})
+            elif self.path == "/tokens":
+                if json.loads(body).get("session_id") != "mock-session":
+                    self._send(401, {"error": "bad session"})
+                    return
+                token = make_token()
+                env.tokens.add(token)
+                self._send(200, token)
+            else:
+                self._send(404, {"error": "not found"})
+
+    return Handler
+
+
+def serve(host: str, port: int, token: str) -> tuple[ThreadingHTTPServer, MockEnvoy]:
+    env = MockEnvoy(token)
+    server = ThreadingHTTPServer((host, port), make_handler(env))
+    return server, env
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--token", default="test", help="token dat de mock accepteert")
+    args = ap.parse_args()
+    server, _ = serve(args.host, args.port, args.token)
+    print(f"Mock Envoy on http://{args.host}:{args.port} (token {args.token!r})")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
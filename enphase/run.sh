@@ -20,11 +20,51 @@ DEBUG=$(jq -r '.debug // 0' "$OPT_FILE")
 HA_URL=$(jq -r '.ha_url // empty' "$OPT_FILE")
 HA_TOKEN=$(jq -r '.ha_token // empty' "$OPT_FILE")
 
+# Optional MQTT push of actions (mqtt_host empty = HTTP polling only)
+CLIENT_ID=$(jq -r '.client_id // empty' "$OPT_FILE")
+MQTT_HOST=$(jq -r '.mqtt_host // empty' "$OPT_FILE")
+MQTT_PORT=$(jq -r '.mqtt_port // 1883' "$OPT_FILE")
+MQTT_USERNAME=$(jq -r '.mqtt_username // empty' "$OPT_FILE")
+MQTT_PASSWORD=$(jq -r '.mqtt_password // empty' "$OPT_FILE")
+MQTT_TLS=$(jq -r '.mqtt_tls // false' "$OPT_FILE")
+MQTT_TOPIC=$(jq -r '.mqtt_topic // "metdezon/bms/{client_id}/action"' "$OPT_FILE")
+MQTT_POLL_INTERVAL=$(jq -r '.mqtt_poll_interval // 600' "$OPT_FILE")
+
+# Report-by-exception telemetry (off = full heartbeat every cycle)
+TEL_RBE=$(jq -r '.report_by_exception // false' "$OPT_FILE")
+TEL_DEADBANDS=$(jq -r '.telemetry_deadbands // empty' "$OPT_FILE")
+TEL_MAX_SILENCE=$(jq -r '.telemetry_max_silence // 900' "$OPT_FILE")
+
+# Lean runtime: stdlib HTTP client (or requests), startup/RSS report in the log
+HTTP_CLIENT=$(jq -r '.http_client // "lite"' "$OPT_FILE")
+STARTUP_REPORT=$(jq -r '.startup_report // false' "$OPT_FILE")
+# Span traces + sampling profiler into /share/metdezon-diag (see diag.py; SIGUSR2 switches it on too)
+DIAGNOSTICS=$(jq -r '.diagnostics // false' "$OPT_FILE")
+DIAG_WINDOW=$(jq -r '.diag_window // 900' "$OPT_FILE")
+# In-memory telemetry history (see history.py); history_api serves it as JSON on port 8099
+HISTORY_HOURS=$(jq -r '.history_hours // 48' "$OPT_FILE")
+HISTORY_RESOLUTION=$(jq -r '.history_resolution // 60' "$OPT_FILE")
+HISTORY_API=$(jq -r '.history_api // false' "$OPT_FILE")
+HISTORY_PORT=0
+if [ "$HISTORY_API" = "true" ]; then
+  HISTORY_PORT=8099
+fi
+# Apply changed options without a restart (see hotreload.py)
+OPTIONS_RELOAD=$(jq -r 'if .options_reload == null then true else .options_reload end' "$OPT_FILE")
+
 # Enphase service namen uit opties (met defaults)
 ENPHASE_CHARGE_SCRIPT=$(jq -r '.enphase_charge_script // "script.toggle_enphase_charge_from_grid"' "$OPT_FILE")
 ENPHASE_DISCHARGE_SCRIPT=$(jq -r '.enphase_discharge_script // "script.toggle_enphase_discharge_to_grid"' "$OPT_FILE")
 ENPHASE_RESTRICT_COMMAND=$(jq -r '.enphase_restrict_command // "rest_command.enphase_battery_restrict_discharge"' "$OPT_FILE")
 
+# Optioneel: Envoy direct via de lokale API (envoy_host leeg = via de HA-scripts)
+ENVOY_HOST=$(jq -r '.envoy_host // empty' "$OPT_FILE")
+ENVOY_TOKEN=$(jq -r '.envoy_token // empty' "$OPT_FILE")
+ENVOY_USERNAME=$(jq -r '.envoy_username // empty' "$OPT_FILE")
+ENVOY_PASSWORD=$(jq -r '.envoy_password // empty' "$OPT_FILE")
+ENVOY_SERIAL=$(jq -r '.envoy_serial // empty' "$OPT_FILE")
+ENVOY_RESERVE_SOC=$(jq -r '.envoy_reserve_soc // 10' "$OPT_FILE")
+
 # Export naar Python
 export API_URL API_KEY TELEMETRY_URL
 export SOC_ENTITY MODE_ENTITY
@@ -33,11 +73,20 @@ export INTERVAL="$POLL_INTERVAL"
 export DEBUG
 
 export ENPHASE_CHARGE_SCRIPT ENPHASE_DISCHARGE_SCRIPT ENPHASE_RESTRICT_COMMAND
+export ENVOY_HOST ENVOY_TOKEN ENVOY_USERNAME ENVOY_PASSWORD ENVOY_SERIAL ENVOY_RESERVE_SOC
 
 # HA vars indien ingevuld
 [ -n "$HA_URL" ] && export HA_URL
 [ -n "$HA_TOKEN" ] && export HA_TOKEN
 
+[ -n "$CLIENT_ID" ] && export CLIENT_ID
+export MQTT_HOST MQTT_PORT MQTT_USERNAME MQTT_PASSWORD MQTT_TLS MQTT_TOPIC MQTT_POLL_INTERVAL
+export TEL_RBE TEL_DEADBANDS TEL_MAX_SILENCE
+export HTTP_CLIENT STARTUP_REPORT
+export DIAGNOSTICS DIAG_WINDOW
+export HISTORY_HOURS HISTORY_RESOLUTION HISTORY_PORT
+export OPTIONS_FILE="$OPT_FILE" OPTIONS_RELOAD
+
 TOKLEN=$(printf '%s' "${SUPERVISOR_TOKEN-}" | wc -c | tr -d '[:space:]')
 echo "[Enphase] SUPERVISOR_TOKEN length: ${TOKLEN:-0}"
 
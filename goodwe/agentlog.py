@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Low-write structured logging for the agents.
+
+* Every event is a tuple (ts, level, category, fmt, args, fields) appended to
+  an in-memory ring buffer. Formatting happens only when a line is written.
+* Debug events are not written unless DEBUG=1; the ring buffer is written
+  out when an error is logged or on request (SIGUSR1), so the context of a
+  failure is still there without writing every cycle to the SD card.
+* Identical consecutive lines are collapsed into one "repeated N×" line.
+* Per-category token-bucket rate limits (LOG_RATE="telemetry=1/900,ha=10/60").
+  Errors are never rate limited.
+
+Environment: DEBUG, LOG_RING (buffer size, 0 = off), LOG_RATE, LOG_FORMAT
+(text|json).
+"""
+
+import collections
+import json
+import os
+import signal
+import sys
+import time
+
+DEBUG, INFO, WARN, ERROR = 10, 20, 30, 40
+LEVEL_NAMES = {DEBUG: "debug", INFO: "info", WARN: "warn", ERROR: "error"}
+
+# Routine per-cycle lines: one per 15 min per category unless DEBUG=1
+DEFAULT_RATES = "telemetry=1/900,cycle=1/900"
+
+_LOGS: list = []
+
+
+def _env_bool(name: str, default: str = "false") -> bool:
+    return os.environ.get(name, default).lower() in ("1", "true", "yes")
+
+
+def parse_rates(spec: str) -> dict:
+    """'telemetry=1/900,ha=10/60' -> {'telemetry': (1.0, 900.0), 'ha': (10.0, 60.0)}"""
+    rates = {}
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part or "=" not in part:
+            continue
+        cat, _, rate = part.partition("=")
+        n, _, per = rate.partition("/")
+        try:
+            rates[cat.strip()] = (float(n), float(per or 60))
+        except ValueError:
+            continue
+    return rates
+
+
+class AgentLog:
+    def __init__(
+        self,
+        prefix: str,
+        debug: bool | None = None,
+        ring_size: int | None = None,
+        rates: dict | None = None,
+        fmt: str | None = None,
+        stream=None,
+    ):
+        self.prefix = prefix
+        self.debug_enabled = _env_bool("DEBUG") if debug is None else debug
+        size = int(os.environ.get("LOG_RING", "200")) if ring_size is None else ring_size
+        self.ring = collections.deque(maxlen=size) if size > 0 else None
+        if rates is None:
+            rates = parse_rates(os.environ.get("LOG_RATE", DEFAULT_RATES))
+        # debug mode is for looking at every cycle: no rate limits then
+        self.rates = {} if self.debug_enabled else rates
+        self.json = (fmt or os.environ.get("LOG_FORMAT", "text")) == "json"
+        self.stream = stream or sys.stdout
+        self._buckets: dict = {}  # category -> [tokens, last_refill, suppressed]
+        self._last_line = None
+        self._repeats = 0
+        _LOGS.append(self)
+
+    # ---- hot path -------------------------------------------------------
+
+    @property
+    def recording(self) -> bool:
+        """False when debug events go nowhere; guard expensive debug arguments with it."""
+        return self.debug_enabled or self.ring is not None
+
+    def debug(self, cat: str, fmt: str, *args, **fields) -> None:
+        if self.ring is None and not self.debug_enabled:
+            return
+        ts = time.time()
+        if self.ring is not None:
+            self.ring.append((ts, DEBUG, cat, fmt, args, fields))
+        if self.debug_enabled:
+            self._write(ts, DEBUG, cat, fmt, args, fields)
+
+    def info(self, cat: str, fmt: str, *args, **fields) -> None:
+        self._event(INFO, cat, fmt, args, fields)
+
+    def warn(self, cat: str, fmt: str, *args, **fields) -> None:
+        self._event(WARN, cat, fmt, args, fields)
+
+    def error(self, cat: str, fmt: str, *args, **fields) -> None:
+        """Write the error, preceded by the buffered context that led to it."""
+        self.dump("error")
+        self._write(time.time(), ERROR, cat, fmt, args, fields)
+
+    def _event(self, level: int, cat: str, fmt: str, args: tuple, fields: dict) -> None:
+        ts = time.time()
+        if self.ring is not None:
+            self.ring.append((ts, level, cat, fmt, args, fields))
+        if cat in self.rates and not self._allow(cat, ts):
+            return
+        self._write(ts, level, cat, fmt, args, fields)
+
+    # ---- rate limiting / dedup -----------------------------------------
+
+    def _allow(self, cat: str, now: float) -> bool:
+        capacity, per = self.rates[cat]
+        b = self._buckets.get(cat)
+        if b is None:
+            b = self._buckets[cat] = [capacity, now, 0]
+        b[0] = min(capacity, b[0] + (now - b[1]) * capacity / per)
+        b[1] = now
+        if b[0] >= 1.0:
+            b[0] -= 1.0
+            if b[2]:
+                self._emit(f"{self.prefix_str()}({b[2]} '{cat}' lines suppressed)")
+                b[2] = 0
+            return True
+        b[2] += 1
+        return False
+
+    def prefix_str(self) -> str:
+        return f"[{self.prefix}] "
+
+    @staticmethod
+    def _msg(fmt: str, args: tuple, fields: dict) -> str:
+        try:
+            msg = fmt % args if args else fmt
+        except (TypeError, ValueError):
+            msg = f"{fmt} {args}"
+        if fields:
+            msg += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return msg
+
+    def _format(self, ts, level, cat, fmt, args, fields) -> str:
+        if self.json:
+            try:
+                msg = fmt % args if args else fmt
+            except (TypeError, ValueError):
+                msg = f"{fmt} {args}"
+            rec = {"ts": round(ts, 3), "level": LEVEL_NAMES[level], "src": self.prefix, "cat": cat, "msg": msg}
+            if fields:
+                rec.update(fields)
+            return json.dumps(rec, default=str)
+        return self.prefix_str() + (f"{LEVEL_NAMES[level].upper()}: " if level >= WARN else "") + self._msg(fmt, args, fields)
+
+    def _write(self, ts, level, cat, fmt, args, fields) -> None:
+        line = self._format(ts, level, cat, fmt, args, fields)
+        # compare without timestamp so json lines dedup too
+        key = (level, cat, line if not self.json else (fmt, args, tuple(fields.items())))
+        if key == self._last_line:
+            self._repeats += 1
+            return
+        self._flush_repeats()
+        self._last_line = key
+        self._emit(line)
+
+    def _flush_repeats(self) -> None:
+        if self._repeats:
+            self._emit(f"{self.prefix_str()}(previous line repeated {self._repeats}×)")
+            self._repeats = 0
+
+    def _emit(self, line: str) -> None:
+        try:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+        except Exception:
+            pass
+
+    def set_debug(self, on: bool) -> None:
+        """Switch debug output at runtime (options reload)."""
+        self.debug_enabled = on
+        self.rates = {} if on else parse_rates(os.environ.get("LOG_RATE", DEFAULT_RATES))
+        self._buckets.clear()
+
+    def close(self) -> None:
+        """Leave dump_all(); for a log that goes away with its owner (a removed site)."""
+        self._flush_repeats()
+        if self in _LOGS:
+            _LOGS.remove(self)
+
+    # ---- flush on error / on request ------------------------------------
+
+    def dump(self, reason: str = "request") -> None:
+        """Write out the ring buffer (oldest first) and clear it."""
+        self._flush_repeats()
+        if not self.ring:
+            return
+        events = list(self.ring)
+        self.ring.clear()
+        self._emit(f"{self.prefix_str()}--- {len(events)} buffered event(s) ({reason}) ---")
+        for ts, level, cat, fmt, args, fields in events:
+            stamp = time.strftime("%H:%M:%S", time.localtime(ts))
+            self._emit(f"  {stamp} {LEVEL_NAMES[level]:<5} {cat:<10} {self._msg(fmt, args, fields)}")
+        self._emit(f"{self.prefix_str()}--- end of buffer ---")
+        self._last_line = None
+
+
+def dump_all(reason: str = "request") -> None:
+    for lg in _LOGS:
+        lg.dump(reason)
+
+
+def install_dump_signal(sig=getattr(signal, "SIGUSR1", None)) -> None:
+    """`kill -USR1 <pid>` (or `docker kill -s USR1`) writes out all ring buffers."""
+    if sig is not None:
+        signal.signal(sig, lambda *_: dump_all("SIGUSR1"))
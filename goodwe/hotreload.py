@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Hot reload of /data/options.json for the agents.
+
+run.sh turns the options into environment variables once, at start. After
+that the agent asks an OptionsWatcher between cycles whether the file
+changed (one stat() call, or SIGHUP) and gets only the options whose value
+differs from what it runs with. apply() writes those into the agent's
+globals through a per-agent spec; the agent then rebuilds just what depends
+on them (HTTP headers, report-by-exception, MQTT client). Connection pools,
+caches and the last applied action are left alone.
+
+Options that are not in the spec (serial port, bus gateway, ...) are
+reported back so the agent can say that they need a restart.
+
+Environment: OPTIONS_FILE (default /data/options.json), OPTIONS_RELOAD
+(0/1, default 1).
+"""
+
+import json
+import os
+import signal
+
+OPTIONS_FILE = os.environ.get("OPTIONS_FILE", "/data/options.json")
+OPTIONS_RELOAD = os.environ.get("OPTIONS_RELOAD", "true").lower() in ("1", "true", "yes")
+
+
+def as_bool(v) -> bool:
+    return str(v).lower() in ("1", "true", "yes")
+
+
+class OptionsWatcher:
+    def __init__(self, path: str = OPTIONS_FILE):
+        self.path = path
+        self._stamp = self._stat()
+        self.current = self._load() or {}
+        self._requested = False
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def _load(self) -> dict | None:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else None
+        except (OSError, ValueError):
+            return None
+
+    def install_signal(self, wake=None, signum: int = signal.SIGHUP) -> None:
+        """SIGHUP forces a re-read; wake() lets the agent cut its sleep short."""
+
+        def handler(sig, frame):
+            self._requested = True
+            if wake is not None:
+                wake()
+
+        signal.signal(signum, handler)
+
+    def changes(self) -> dict | None:
+        """{option: new value} for every option that changed, or None."""
+        stamp = self._stat()
+        if not self._requested and stamp == self._stamp:
+            return None
+        self._requested = False
+        self._stamp = stamp
+        new = self._load()
+        if new is None:
+            # half-written or invalid: keep running on the old options;
+            # the writer finishing changes the stamp again
+            return None
+        diff = {k: new.get(k) for k in set(new) | set(self.current) if new.get(k) != self.current.get(k)}
+        self.current = new
+        return diff or None
+
+
+def apply(changes: dict, spec: dict, namespace: dict) -> tuple[list, list]:
+    """Write changed options into namespace (the agent's globals()).
+
+    spec maps option -> (global name, converter, default); the default is
+    what run.sh uses for a missing option. A name starting with "$" is an
+    environment variable instead of a global (e.g. the HA token, which is
+    read from the environment on every call).
+
+    Returns (changed global names, options that need a restart).
+    """
+    applied, restart = [], []
+    for key, value in sorted(changes.items()):
+        if key not in spec:
+            restart.append(key)
+            continue
+        name, conv, default = spec[key]
+        if value is None or value == "":
+            value = default
+        value = conv(value) if value is not None else None
+        if name.startswith("$"):
+            if value:
+                os.environ[name[1:]] = str(value)
+            else:
+                os.environ.pop(name[1:], None)
+        else:
+            namespace[name] = value
+        applied.append(name)
+    return applied, restart
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""RS485 bus owner with a local Modbus TCP gateway.
+
+This process is the only one that opens the serial port. Everything else
+(the agent's setmode.py, HA's modbus integration, a second tool) talks
+Modbus TCP to it, and the gateway turns each request into one RTU
+transaction on the bus:
+
+* strictly one transaction at a time, with the RTU 3.5 character silence
+  between frames, so clients can no longer garble each other's frames
+* writes (FC 5/6/15/16) are queued ahead of reads; FIFO within a priority
+* identical reads (same unit, function, address, count) that are queued or
+  answered within GATEWAY_COALESCE seconds share one bus transaction;
+  a write clears the cached reads of that unit
+* requests that waited longer than GATEWAY_MAX_WAIT get exception 0x0B
+  instead of a stale answer; a full queue answers 0x06 (busy)
+
+Queue delay, bus time, throughput and coalescing are logged every
+GATEWAY_STATS seconds (and on SIGUSR1 via agentlog).
+
+Environment: SERIAL_PORT, SERIAL_BAUD, GATEWAY_HOST, GATEWAY_PORT,
+GATEWAY_COALESCE, GATEWAY_MAX_WAIT, GATEWAY_MAX_QUEUE, GATEWAY_STATS.
+"""
+
+import asyncio
+import collections
+import itertools
+import os
+import struct
+import time
+
+from agentlog import AgentLog, install_dump_signal
+
+SERIAL_PORT  = os.environ.get("SERIAL_PORT", "/dev/ttyUSB0")
+SERIAL_BAUD  = int(os.environ.get("SERIAL_BAUD", "9600"))
+HOST         = os.environ.get("GATEWAY_HOST", "0.0.0.0")
+PORT         = int(os.environ.get("GATEWAY_PORT", "5020"))
+COALESCE     = float(os.environ.get("GATEWAY_COALESCE", "0.5"))
+MAX_WAIT     = float(os.environ.get("GATEWAY_MAX_WAIT", "10"))
+MAX_QUEUE    = int(os.environ.get("GATEWAY_MAX_QUEUE", "64"))
+STATS_EVERY  = float(os.environ.get("GATEWAY_STATS", "300"))
+
+READ_FCS  = (1, 2, 3, 4)
+WRITE_FCS = (5, 6, 15, 16)
+PRIO_WRITE, PRIO_READ = 0, 1
+
+EXC_ILLEGAL_FUNCTION = 0x01
+EXC_BUSY             = 0x06
+EXC_NO_RESPONSE      = 0x0B
+
+LOG = AgentLog("Bus")
+
+
+class ModbusException(Exception):
+    def __init__(self, code: int, msg: str = ""):
+        super().__init__(msg or f"exception 0x{code:02X}")
+        self.code = code
+
+
+# ========================
+# RTU over the serial port (blocking; only ever used by the one bus worker)
+# ========================
+
+
+def crc16(data: bytes) -> int:
+    crc = 0xFFFF
+    for b in data:
+        crc ^= b
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+
+class SerialBus:
+    def __init__(self, port: str, baud: int, timeout: float = 1.0):
+        self.port = port
+        self.baud = baud
+        self.timeout = timeout
+        # 11 bits per character; RTU needs 3.5 characters of silence between frames
+        self.t35 = max(3.5 * 11 / baud, 0.00175)
+        self.ser = None
+
+    def _open(self):
+        if self.ser is None:
+            import serial
+
+            self.ser = serial.Serial(self.port, self.baud, bytesize=8, parity="N", stopbits=1, timeout=self.timeout)
+        return self.ser
+
+    def close(self) -> None:
+        if self.ser is not None:
+            try:
+                self.ser.close()
+            finally:
+                self.ser = None
+
+    def transact(self, unit: int, pdu: bytes) -> bytes:
+        """Send one request PDU, return the response PDU (exceptions included)."""
+        frame = bytes([unit]) + pdu
+        frame += struct.pack("<H", crc16(frame))
+        try:
+            ser = self._open()
+            ser.reset_input_buffer()
+            ser.write(frame)
+            head = ser.read(3)
+            if len(head) < 3:
+                raise ModbusException(EXC_NO_RESPONSE, f"no response from unit {unit}")
+            fc = head[1]
+            if fc & 0x80:
+                rest = 2
+            elif fc in READ_FCS:
+                rest = head[2] + 2
+            else:
+                rest = 5  # echo of address + value/count, then CRC
+            body = ser.read(rest)
+            resp = head + body
+            if len(body) < rest or crc16(resp[:-2]) != struct.unpack("<H", resp[-2:])[0] or resp[0] != unit:
+                raise ModbusException(EXC_NO_RESPONSE, f"bad frame from unit {unit}: {resp.hex()}")
+            return resp[1:-2]
+        except ModbusException:
+            raise
+        except Exception as e:
+            self.close()  # reopen on the next transaction
+            raise ModbusException(EXC_NO_RESPONSE, f"serial error: {e}") from e
+        finally:
+            time.sleep(self.t35)
+
+
+# ========================
+# Scheduler
+# ========================
+
+
+class BusStats:
+    def __init__(self, keep: int = 2048):
+        self.since = time.monotonic()
+        self.done = collections.Counter()  # "read" / "write" -> transactions on the bus
+        self.coalesced = 0
+        self.errors = 0
+        self.rejected = 0
+        self.busy = 0.0  # seconds the bus was in a transaction
+        self.wait = {PRIO_WRITE: collections.deque(maxlen=keep), PRIO_READ: collections.deque(maxlen=keep)}
+        self.max_depth = 0
+
+    @staticmethod
+    def _pct(values, pct: float) -> float:
+        if not values:
+            return 0.0
+        s = sorted(values)
+        return s[min(len(s) - 1, int(pct / 100 * len(s)))]
+
+    def summary(self) -> str:
+        elapsed = max(time.monotonic() - self.since, 1e-9)
+        total = sum(self.done.values())
+        parts = [
+            f"{total / elapsed:.2f} tx/s ({self.done['write']} writes, {self.done['read']} reads)",
+            f"bus {100 * self.busy / elapsed:.0f}% busy",
+            f"{self.coalesced} coalesced",
+            f"{self.errors} errors",
+            f"{self.rejected} rejected",
+            f"max depth {self.max_depth}",
+        ]
+        for prio, name in ((PRIO_WRITE, "write"), (PRIO_READ, "read")):
+            w = self.wait[prio]
+            if w:
+                parts.append(
+                    f"{name} wait p50={1000 * self._pct(w, 50):.0f}ms "
+                    f"p95={1000 * self._pct(w, 95):.0f}ms max={1000 * max(w):.0f}ms"
+                )
+        return ", ".join(parts)
+
+    def reset(self) -> None:
+        self.__init__(self.wait[PRIO_READ].maxlen)
+
+
+class BusScheduler:
+    def __init__(self, bus: SerialBus, coalesce: float = COALESCE, max_wait: float = MAX_WAIT,
+                 max_queue: int = MAX_QUEUE):
+        self.bus = bus
+        self.coalesce = coalesce
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self.seq = itertools.count()
+        self.inflight: dict = {}  # read key -> future shared by identical reads
+        self.cache: dict = {}  # read key -> (monotonic done, response pdu)
+        self.stats = BusStats()
+
+    async def submit(self, unit: int, pdu: bytes) -> bytes:
+        fc = pdu[0]
+        if fc in READ_FCS:
+            key = (unit, pdu)
+            hit = self.cache.get(key)
+            if hit is not None and time.monotonic() - hit[0] <= self.coalesce:
+                self.stats.coalesced += 1
+                return hit[1]
+            fut = self.inflight.get(key)
+            if fut is not None:
+                self.stats.coalesced += 1
+                return await asyncio.shield(fut)
+            prio = PRIO_READ
+        elif fc in WRITE_FCS:
+            key = None
+            prio = PRIO_WRITE
+        else:
+            raise ModbusException(EXC_ILLEGAL_FUNCTION, f"function {fc} not supported by the gateway")
+
+        if self.queue.qsize() >= self.max_queue:
+            self.stats.rejected += 1
+            raise ModbusException(EXC_BUSY, "queue full")
+        fut = asyncio.get_running_loop().create_future()
+        # the requester may be gone (client disconnected) by the time the bus answers
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+        if key is not None:
+            self.inflight[key] = fut
+        self.queue.put_nowait((prio, next(self.seq), time.monotonic(), unit, pdu, key, fut))
+        self.stats.max_depth = max(self.stats.max_depth, self.queue.qsize())
+        return await asyncio.shield(fut)
+
+    async def run(self) -> None:
+        """The only coroutine that touches the bus."""
+        while True:
+            prio, _, queued, unit, pdu, key, fut = await self.queue.get()
+            waited = time.monotonic() - queued
+            self.stats.wait[prio].append(waited)
+            try:
+                if waited > self.max_wait:
+                    raise ModbusException(EXC_NO_RESPONSE, f"waited {waited:.1f}s in queue")
+                t0 = time.monotonic()
+                try:
+                    resp = await asyncio.to_thread(self.bus.transact, unit, pdu)
+                finally:
+                    self.stats.busy += time.monotonic() - t0
+                self.stats.done["write" if prio == PRIO_WRITE else "read"] += 1
+                if key is not None:
+                    # an exception answer (slave busy, ...) goes to the waiting readers only
+                    if not resp[0] & 0x80:
+                        self.cache[key] = (time.monotonic(), resp)
+                else:
+                    # a write may change what the cached reads of this unit would return
+                    for k in [k for k in self.cache if k[0] == unit]:
+                        del self.cache[k]
+                if not fut.done():
+                    fut.set_result(resp)
+            except ModbusException as e:
+                self.stats.errors += 1
+                LOG.debug("bus", "unit %s fc %s: %s", unit, pdu[0], e)
+                if not fut.done():
+                    fut.set_exception(e)
+            except Exception as e:
+                # never let one request take the bus worker down; the client gets 0x0B
+                self.stats.errors += 1
+                LOG.warn("bus", "unit %s fc %s: unexpected error: %s", unit, pdu[0], e)
+                if not fut.done():
+                    fut.set_exception(ModbusException(EXC_NO_RESPONSE, f"bus error: {e}"))
+            finally:
+                if key is not None and self.inflight.get(key) is fut:
+                    del self.inflight[key]
+
+    async def report(self, every: float) -> None:
+        while True:
+            await asyncio.sleep(every)
+            LOG.info("stats", "%s", self.stats.summary())
+            self.stats.reset()
+            # drop expired cache entries so the dict does not grow with every distinct read
+            now = time.monotonic()
+            for k in [k for k, (t, _) in self.cache.items() if now - t > self.coalesce]:
+                del self.cache[k]
+
+
+# ========================
+# Modbus TCP side
+# ========================
+
+
+class Gateway:
+    def __init__(self, scheduler: BusScheduler):
+        self.scheduler = scheduler
+        self.clients = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peer = writer.get_extra_info("peername")
+        self.clients += 1
+        LOG.debug("tcp", "client %s connected (%s open)", peer, self.clients)
+        lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                try:
+                    head = await reader.readexactly(7)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                tid, pid, length, unit = struct.unpack(">HHHB", head)
+                if pid != 0 or not 2 <= length <= 254:
+                    LOG.warn("tcp", "bad MBAP header from %s; closing", peer)
+                    break
+                try:
+                    pdu = await reader.readexactly(length - 1)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                # clients may pipeline; every request gets its own task and answer
+                task = asyncio.create_task(self._answer(writer, lock, tid, unit, pdu))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.clients -= 1
+            writer.close()
+
+    async def _answer(self, writer, lock, tid: int, unit: int, pdu: bytes) -> None:
+        try:
+            resp = await self.scheduler.submit(unit, pdu)
+        except ModbusException as e:
+            resp = bytes([pdu[0] | 0x80, e.code])
+        async with lock:
+            writer.write(struct.pack(">HHHB", tid, 0, len(resp) + 1, unit) + resp)
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+
+async def main() -> None:
+    install_dump_signal()
+    scheduler = BusScheduler(SerialBus(SERIAL_PORT, SERIAL_BAUD))
+    gateway = Gateway(scheduler)
+    server = await asyncio.start_server(gateway.handle, HOST, PORT)
+    LOG.info("main", "Modbus TCP gateway on %s:%s -> %s@%s", HOST, PORT, SERIAL_PORT, SERIAL_BAUD)
+    async with server:
+        await asyncio.gather(server.serve_forever(), scheduler.run(), scheduler.report(STATS_EVERY))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Optional MQTT push of actions for the single-site agents.
+
+The backend publishes the next_action JSON for each client on a retained
+topic. paho's network thread hands a pushed action to ActionPush, and the
+agent's loop picks it up in wait(), which sleeps until the next poll or
+until an action arrives, whichever comes first. wake() cuts the sleep
+short without an action (options reload on SIGHUP).
+
+Retained actions older than max_age seconds (by their issued_at) are
+ignored, so a reconnect after a long outage does not replay an old
+decision. multisite/push.py is the asyncio counterpart for many sites on
+one connection.
+"""
+
+import json
+import threading
+import time
+
+
+def parse_pushed_action(raw: bytes, max_age: float, log) -> tuple[int, int] | None:
+    try:
+        data = json.loads(raw)
+        mode = int(str(data.get("mode", -1)))
+        power_watt = int(str(data.get("power_watt", 0)))
+        issued_at = data.get("issued_at")
+        if issued_at is not None and time.time() - float(issued_at) > max_age:
+            log.debug("mqtt", "ignoring stale action issued_at=%s", issued_at)
+            return None
+    except Exception as e:
+        log.warn("mqtt", "ignoring malformed action: %s", e)
+        return None
+    return mode, power_watt
+
+
+class ActionPush:
+    def __init__(self, log, max_age: float = 900):
+        self.log = log  # AgentLog
+        self.max_age = max_age
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.action = None  # latest pushed (mode, power_watt) not yet taken by wait()
+        self.client = None
+
+    @property
+    def connected(self) -> bool:
+        return self.client is not None and self.client.is_connected()
+
+    def start(self, host: str, port: int, topic: str, client_id: str = "", username: str = "",
+              password: str = "", tls: bool = False) -> bool:
+        try:
+            import paho.mqtt.client as mqtt
+        except ImportError:
+            self.log.warn("mqtt", "MQTT_HOST set but paho-mqtt is not installed; HTTP polling only")
+            return False
+
+        def on_connect(client, userdata, flags, rc, properties=None):
+            if getattr(rc, "value", rc) == 0:
+                client.subscribe(topic, qos=1)
+                self.log.info("mqtt", "MQTT connected to %s:%s, subscribed to %s", host, port, topic)
+            else:
+                self.log.warn("mqtt", "connect failed: %s", rc)
+
+        def on_message(client, userdata, msg):
+            if msg.topic != topic:
+                return
+            action = parse_pushed_action(msg.payload, self.max_age, self.log)
+            if action is not None:
+                self.deliver(action)
+
+        # paho-mqtt 2.x wants an explicit callback API version; 1.x has no such argument
+        if hasattr(mqtt, "CallbackAPIVersion"):
+            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+        else:
+            client = mqtt.Client(client_id=client_id)
+        if username:
+            client.username_pw_set(username, password or None)
+        if tls:
+            client.tls_set()
+        client.on_connect = on_connect
+        client.on_message = on_message
+        client.reconnect_delay_set(min_delay=1, max_delay=60)
+        client.connect_async(host, port, keepalive=60)
+        client.loop_start()
+        self.client = client
+        return True
+
+    def stop(self) -> None:
+        if self.client is not None:
+            self.client.disconnect()
+            self.client.loop_stop()
+            self.client = None
+
+    def deliver(self, action: tuple[int, int]) -> None:
+        """Hand an action to the loop; a newer one replaces one not yet taken."""
+        with self.lock:
+            self.action = action
+        self.event.set()
+
+    def wake(self) -> None:
+        self.event.set()
+
+    def wait(self, timeout: float) -> tuple[int, int] | None:
+        """Sleep up to timeout; return a pushed action as soon as one arrives."""
+        if not self.event.wait(timeout):
+            return None
+        with self.lock:
+            self.event.clear()
+            action, self.action = self.action, None
+        return action
@@ -1,6 +1,10 @@
 #!/usr/bin/env bash
 set -euo pipefail
 
+# Container start time, so the agent can report time-to-first-command
+STARTED_AT=$(date +%s)
+export STARTED_AT
+
 OPT_FILE=/data/options.json
 
 API_URL=$(jq -r '.api_url' "$OPT_FILE")
@@ -12,22 +16,62 @@ SOC_ENTITY=$(jq -r '.soc_entity' "$OPT_FILE")
 MODE_ENTITY=$(jq -r '.mode_entity // empty' "$OPT_FILE")
 PV_ENTITY=$(jq -r '.pv_entity // "sensor.pv_power"' "$OPT_FILE")
 GRID_ENTITY=$(jq -r '.grid_entity // "sensor.active_power"' "$OPT_FILE")
+# modbus = read SOC/PV/grid over RS485 ourselves, ha = from the entities above
+TELEMETRY_SOURCE=$(jq -r '.telemetry_source // "modbus"' "$OPT_FILE")
 
 POLL_INTERVAL=$(jq -r '.poll_interval' "$OPT_FILE")
 POWER_WATT=$(jq -r '.power_watt' "$OPT_FILE")
 SERIAL_PORT=$(jq -r '.serial_port' "$OPT_FILE")
 SERIAL_BAUD=$(jq -r '.serial_baud' "$OPT_FILE")
 SERIAL_SLAVE=$(jq -r '.serial_slave' "$OPT_FILE")
+BUS_GATEWAY=$(jq -r 'if .bus_gateway == null then true else .bus_gateway end' "$OPT_FILE")
+# fixed inside the container (config.json "ports"); the host port that HA's
+# modbus integration etc. connect to is set in the add-on's Network settings
+GATEWAY_PORT=5020
+GATEWAY_COALESCE=$(jq -r '.bus_coalesce // 0.5' "$OPT_FILE")
 DEBUG=$(jq -r '.debug' "$OPT_FILE")
 
 # NEW: optional HA overrides from options
 HA_URL=$(jq -r '.ha_url // empty' "$OPT_FILE")
 HA_TOKEN=$(jq -r '.ha_token // empty' "$OPT_FILE")
 
+# Optional MQTT push of actions (mqtt_host empty = HTTP polling only)
+CLIENT_ID=$(jq -r '.client_id // empty' "$OPT_FILE")
+MQTT_HOST=$(jq -r '.mqtt_host // empty' "$OPT_FILE")
+MQTT_PORT=$(jq -r '.mqtt_port // 1883' "$OPT_FILE")
+MQTT_USERNAME=$(jq -r '.mqtt_username // empty' "$OPT_FILE")
+MQTT_PASSWORD=$(jq -r '.mqtt_password // empty' "$OPT_FILE")
+MQTT_TLS=$(jq -r '.mqtt_tls // false' "$OPT_FILE")
+MQTT_TOPIC=$(jq -r '.mqtt_topic // "metdezon/bms/{client_id}/action"' "$OPT_FILE")
+MQTT_POLL_INTERVAL=$(jq -r '.mqtt_poll_interval // 600' "$OPT_FILE")
+
+# Report-by-exception telemetry (off = full heartbeat every cycle)
+TEL_RBE=$(jq -r '.report_by_exception // false' "$OPT_FILE")
+TEL_DEADBANDS=$(jq -r '.telemetry_deadbands // empty' "$OPT_FILE")
+TEL_MAX_SILENCE=$(jq -r '.telemetry_max_silence // 900' "$OPT_FILE")
+
+# Lean runtime: stdlib HTTP client (or requests), startup/RSS report in the log
+HTTP_CLIENT=$(jq -r '.http_client // "lite"' "$OPT_FILE")
+STARTUP_REPORT=$(jq -r '.startup_report // false' "$OPT_FILE")
+# Span traces + sampling profiler into /share/metdezon-diag (see diag.py; SIGUSR2 switches it on too)
+DIAGNOSTICS=$(jq -r '.diagnostics // false' "$OPT_FILE")
+DIAG_WINDOW=$(jq -r '.diag_window // 900' "$OPT_FILE")
+# In-memory telemetry history (see history.py); history_api serves it as JSON on port 8099
+HISTORY_HOURS=$(jq -r '.history_hours // 48' "$OPT_FILE")
+HISTORY_RESOLUTION=$(jq -r '.history_resolution // 60' "$OPT_FILE")
+HISTORY_API=$(jq -r '.history_api // false' "$OPT_FILE")
+HISTORY_PORT=0
+if [ "$HISTORY_API" = "true" ]; then
+  HISTORY_PORT=8099
+fi
+# Apply changed options without a restart (see hotreload.py)
+OPTIONS_RELOAD=$(jq -r 'if .options_reload == null then true else .options_reload end' "$OPT_FILE")
+
 # Export names the Python expects
 export API_URL API_KEY TELEMETRY_URL
 export SOC_ENTITY MODE_ENTITY
 export PV_ENTITY GRID_ENTITY
+export TELEMETRY_SOURCE
 export INTERVAL="$POLL_INTERVAL"
 export POWER="$POWER_WATT"
 export DEBUG
@@ -36,67 +80,41 @@ export DEBUG
 [ -n "$HA_URL" ] && export HA_URL
 [ -n "$HA_TOKEN" ] && export HA_TOKEN
 
-# Zorg dat host-pad bestaat (mount via "map": ["config:rw"])
-CTRL_DIR="/config/ha/pymodbus"
-VENV="$CTRL_DIR/.venv"
-mkdir -p "$CTRL_DIR"
+[ -n "$CLIENT_ID" ] && export CLIENT_ID
+export MQTT_HOST MQTT_PORT MQTT_USERNAME MQTT_PASSWORD MQTT_TLS MQTT_TOPIC MQTT_POLL_INTERVAL
+export TEL_RBE TEL_DEADBANDS TEL_MAX_SILENCE
+export HTTP_CLIENT STARTUP_REPORT
+export DIAGNOSTICS DIAG_WINDOW
+export HISTORY_HOURS HISTORY_RESOLUTION HISTORY_PORT
+export OPTIONS_FILE="$OPT_FILE" OPTIONS_RELOAD
 
-# (leave your setmode.py creation + venv/pip bits unchanged)
-
-echo "[GoodWe] Start agent: API_URL=$API_URL interval=${INTERVAL}s power=${POWER}"
+# Serial settings for setmode.py / the agent
+export SERIAL_PORT SERIAL_BAUD SERIAL_SLAVE
 
 # Optional diagnostics: show whether Supervisor injected a token (may be 0 — that's fine now)
 TOKLEN=$(printf '%s' "${SUPERVISOR_TOKEN-}" | wc -c | tr -d '[:space:]')
 echo "[GoodWe] SUPERVISOR_TOKEN length: ${TOKLEN:-0}"
 
-# setmode.py aanmaken/overlaten
-if [ ! -f "$CTRL_DIR/setmode.py" ]; then
-  cat > "$CTRL_DIR/setmode.py" <<'PY'
-import sys
-from pymodbus.client import ModbusSerialClient
-
-if len(sys.argv) < 2:
-    print("Usage: python3 setmode.py [mode] [power]")
-    print("Modes: 1=Auto, 2=Charge, 3=Discharge")
-    sys.exit(1)
-
-mode = int(sys.argv[1])
-power = int(sys.argv[2]) if len(sys.argv) >= 3 else 0
-
-# Seriële instellingen (houden we in dit script fixed; de agent bepaalt power/mode)
-client = ModbusSerialClient(
-    port='/dev/ttyUSB0',
-    baudrate=9600,
-    stopbits=1,
-    bytesize=8,
-    parity='N',
-    timeout=1
-)
-
-client.connect()
-client.write_register(address=47511, value=mode, slave=247)
-
-if mode in [2, 3] and power > 0:
-    client.write_register(address=47512, value=power, slave=247)
-
-client.close()
-print(f"Set mode {mode} {'with power ' + str(power) + 'W' if power else ''}")
-PY
+# RS485 bus owner: the gateway is the only process that opens the serial port;
+# the agent (and e.g. HA's modbus integration via the mapped port) go through it.
+if [ "$BUS_GATEWAY" = "true" ]; then
+  export GATEWAY_PORT GATEWAY_COALESCE
+  (
+    while true; do
+      /opt/venv/bin/python /app/modbus_gateway.py || true
+      echo "[GoodWe] modbus_gateway.py exited; restarting in 2s"
+      sleep 2
+    done
+  ) &
+  export MODBUS_GATEWAY="127.0.0.1:${GATEWAY_PORT}"
+  # first command should not race the gateway's listen()
+  for _ in $(seq 50); do
+    (exec 3<>"/dev/tcp/127.0.0.1/${GATEWAY_PORT}") 2>/dev/null && break
+    sleep 0.1
+  done
 fi
-chmod +x "$CTRL_DIR/setmode.py"
-
-# venv + pymodbus==3.1.2 (self-heal)
-if [ ! -d "$VENV" ]; then
-  python3 -m venv "$VENV"
-fi
-
-if ! "$VENV/bin/python" -m pip --version >/dev/null 2>&1; then
-  "$VENV/bin/python" -m ensurepip --upgrade || true
-fi
-
-"$VENV/bin/python" -m pip install --upgrade pip setuptools wheel >/dev/null 2>&1 || true
-# gefixeerde versie die bij jou werkt
-"$VENV/bin/python" -m pip install "pymodbus==3.1.2" "pyserial"
 
-echo "[GoodWe] Start agent: API_URL=$API_URL interval=${POLL_INTERVAL}s power=$POWER_WATT"
-exec python3 /app/goodwe_agent.py
+# pymodbus + setmode.py are baked into the image (/opt/venv, /app/setmode.py):
+# no venv creation or pip install here, so startup works without network.
+echo "[GoodWe] Start agent: API_URL=$API_URL interval=${POLL_INTERVAL}s power=$POWER_WATT serial=$SERIAL_PORT@$SERIAL_BAUD slave=$SERIAL_SLAVE"
+exec /opt/venv/bin/python /app/goodwe_agent.py
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+
+import voluptuous as vol
+
+from homeassistant.const import Platform
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers import discovery
+from homeassistant.helpers.typing import ConfigType
+
+from .const import DOMAIN, FIRST_CYCLE_WAIT, LOGGER, VENDORS
+from .coordinator import MetDeZonSiteCoordinator
+
+# Zelfde site-opties als de multisite add-on; driver-specifieke keys
+# (entities, scripts, serial_*) gaan ongewijzigd door naar de driver.
+SITE_SCHEMA = vol.Schema(
+    {
+        vol.Required("vendor"): vol.In(VENDORS),
+        vol.Required("api_key"): cv.string,
+        vol.Optional("name"): cv.string,
+        vol.Optional("client_id"): cv.string,
+        vol.Optional("api_url"): cv.url,
+        vol.Optional("telemetry_url"): cv.url,
+        vol.Optional("poll_interval"): cv.positive_int,
+        vol.Optional("cycle_timeout"): cv.positive_int,
+        vol.Optional("power_watt"): cv.positive_int,
+        vol.Optional("verify_ssl"): cv.boolean,
+        vol.Optional("report_by_exception"): cv.boolean,
+        vol.Optional("telemetry_deadbands"): cv.string,
+        vol.Optional("telemetry_max_silence"): cv.positive_int,
+    },
+    extra=vol.ALLOW_EXTRA,
+)
+
+CONFIG_SCHEMA = vol.Schema(
+    {DOMAIN: vol.Schema({vol.Required("sites"): vol.All(cv.ensure_list, [SITE_SCHEMA])})},
+    extra=vol.ALLOW_EXTRA,
+)
+
+
+async def _first_cycle(coordinator: MetDeZonSiteCoordinator) -> None:
+    """Eerste cyclus; een mislukte cyclus wordt bij het volgende interval opnieuw gedaan."""
+    await coordinator.async_refresh()
+    if not coordinator.last_update_success:
+        LOGGER.warning("MetDeZon BMS: first cycle for %s failed, will retry", coordinator.site.name)
+
+
+async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
+    """Set up the MetDeZon BMS agent from YAML."""
+    LOGGER.debug("Setting up MetDeZon BMS via YAML")
+    sites = [dict(site) for site in config[DOMAIN]["sites"]]
+
+    # GoodWe zonder eigen setmode_python draait setmode.py met de Python van HA;
+    # zonder pymodbus daar zou elke write mislukken
+    goodwe_in_ha = [s for s in sites if s["vendor"] == "goodwe" and not s.get("setmode_python")]
+    if goodwe_in_ha and not await hass.async_add_executor_job(importlib.util.find_spec, "pymodbus"):
+        for site in goodwe_in_ha:
+            LOGGER.error(
+                "MetDeZon BMS: GoodWe site %s not set up: pymodbus is not installed in Home "
+                "Assistant's Python. Set setmode_python to a Python with pymodbus==3.1.2 "
+                "or use the GoodWe add-on for this site",
+                site.get("name") or site.get("client_id") or "goodwe",
+            )
+        sites = [s for s in sites if s not in goodwe_in_ha]
+        if not sites:
+            return False
+
+    coordinators = [MetDeZonSiteCoordinator(hass, site) for site in sites]
+    hass.data.setdefault(DOMAIN, {})["coordinators"] = coordinators
+
+    # Eerste cycli tegelijk en begrensd: een trage site houdt de start van HA niet op
+    tasks = [hass.async_create_task(_first_cycle(c)) for c in coordinators]
+    _, pending = await asyncio.wait(tasks, timeout=FIRST_CYCLE_WAIT)
+    if pending:
+        LOGGER.debug("MetDeZon BMS: %s first cycle(s) still running in the background", len(pending))
+
+    hass.async_create_task(
+        discovery.async_load_platform(hass, Platform.SENSOR, DOMAIN, {}, config)
+    )
+    return True
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""MetDeZon backend calls (next_action + telemetry) and the heartbeat format."""
+
+import time
+
+import aiohttp
+
+
+def build_heartbeat(client_id, server_mode: int, tel: dict | None, reported_at: int | None = None) -> dict:
+    """Same payload the single-vendor agents post to telemetry.php."""
+    tel = tel or {}
+    heartbeat = {
+        "client_id": client_id,
+        "reported_at": int(time.time()) if reported_at is None else reported_at,
+        "soc": float(tel["soc_pct"]) if "soc_pct" in tel else None,
+        # keep policy mode from server so DB never gets NULL
+        "battery_mode": server_mode,
+        "pv_power_w": tel.get("pv_power_w"),
+        "grid_power_w": tel.get("grid_power_w"),
+    }
+    # drop None fields except battery_mode (keep it always)
+    return {k: v for k, v in heartbeat.items() if v is not None or k == "battery_mode"}
+
+
+def parse_next_action(data: dict) -> tuple[int, int]:
+    try:
+        mode = int(str(data.get("mode", -1)))
+    except Exception:
+        mode = -1
+    try:
+        power_watt = int(str(data.get("power_watt", 0)))
+    except Exception:
+        power_watt = 0
+    return mode, power_watt
+
+
+class Backend:
+    """next_action / telemetry client for one site (own api_key, shared session)."""
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        api_url: str,
+        telemetry_url: str | None,
+        api_key: str | None,
+        verify_ssl: bool,
+        log,
+    ):
+        self.session = session
+        self.api_url = api_url
+        self.telemetry_url = telemetry_url
+        self.headers = {"X-API-Key": api_key} if api_key else {}
+        self.ssl = None if verify_ssl else False
+        self.log = log  # AgentLog
+
+    async def fetch_next_action(self) -> tuple[int, int]:
+        if not self.api_url:
+            return -1, 0
+        self.log.debug("http", "GET %s", self.api_url)
+        async with self.session.get(
+            self.api_url, headers=self.headers, ssl=self.ssl, timeout=aiohttp.ClientTimeout(total=10)
+        ) as r:
+            self.log.debug("http", "HTTP %s", r.status)
+            r.raise_for_status()
+            data = await r.json(content_type=None)
+        return parse_next_action(data)
+
+    async def upload_telemetry(self, payload: dict) -> bool:
+        if not self.telemetry_url:
+            self.log.debug("http", "No TELEMETRY_URL configured; skipping telemetry")
+            return False
+        try:
+            self.log.debug("http", "POST %s -> %s", self.telemetry_url, payload)
+            async with self.session.post(
+                self.telemetry_url,
+                headers=self.headers,
+                json=payload,
+                ssl=self.ssl,
+                timeout=aiohttp.ClientTimeout(total=10),
+            ) as r:
+                if self.log.recording:
+                    self.log.debug("http", "TEL HTTP %s %s", r.status, (await r.text())[:200])
+                r.raise_for_status()
+            return True
+        except Exception as e:
+            self.log.warn("http", "Telemetry upload error: %s", e)
+            return False
@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+import logging
+import os
+
+DOMAIN = "metdezon_bms"
+LOGGER = logging.getLogger(__package__)
+
+DEFAULT_API_URL = "https://api.metdezon.nl/bms/api/next_action.php"
+DEFAULT_TEL_URL = "https://api.metdezon.nl/bms/api/telemetry.php"
+
+DEFAULT_POLL_INTERVAL = 60
+DEFAULT_CYCLE_TIMEOUT = 45
+DEFAULT_POWER_WATT = 2000
+
+# zo lang wacht async_setup op de eerste cycli; trage sites lopen daarna door
+FIRST_CYCLE_WAIT = 10
+
+VENDORS = ("goodwe", "sungrow", "enphase")
+
+# GoodWe: setmode.py wordt meegeleverd en draait met de Python van HA zelf
+SETMODE_SCRIPT = os.path.join(os.path.dirname(__file__), "setmode.py")
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import logging
+import sys
+from datetime import timedelta
+from typing import Any
+
+import async_timeout
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+
+from .backend import Backend, build_heartbeat
+from .const import (
+    DEFAULT_API_URL,
+    DEFAULT_CYCLE_TIMEOUT,
+    DEFAULT_POLL_INTERVAL,
+    DEFAULT_POWER_WATT,
+    DEFAULT_TEL_URL,
+    LOGGER,
+    SETMODE_SCRIPT,
+)
+from .drivers import DRIVERS
+from .reporting import DEFAULT_DEADBANDS, ReportByException, parse_deadbands
+
+
+class SiteLogger:
+    """AgentLog-interface (cat, fmt, *args) op de logger van de integratie."""
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+
+    @property
+    def recording(self) -> bool:
+        return LOGGER.isEnabledFor(logging.DEBUG)
+
+    def _log(self, level: int, cat: str, fmt: str, *args: Any) -> None:
+        if LOGGER.isEnabledFor(level):
+            LOGGER.log(level, "[%s] %s: " + fmt, self._name, cat, *args)
+
+    def debug(self, cat: str, fmt: str, *args: Any) -> None:
+        self._log(logging.DEBUG, cat, fmt, *args)
+
+    def info(self, cat: str, fmt: str, *args: Any) -> None:
+        self._log(logging.INFO, cat, fmt, *args)
+
+    def warn(self, cat: str, fmt: str, *args: Any) -> None:
+        self._log(logging.WARNING, cat, fmt, *args)
+
+    def error(self, cat: str, fmt: str, *args: Any) -> None:
+        self._log(logging.ERROR, cat, fmt, *args)
+
+
+class InProcessHomeAssistant:
+    """Zelfde interface als multisite/hass.py, maar direct op hass.states/hass.services."""
+
+    def __init__(self, hass: HomeAssistant, log: SiteLogger) -> None:
+        self.hass = hass
+        self.log = log
+
+    async def get_state(self, entity_id: str):
+        if not entity_id:
+            return None
+        state = self.hass.states.get(entity_id)
+        if state is None:
+            self.log.debug("ha", "entity %s not found", entity_id)
+            return None
+        # zelfde vorm als GET /api/states/<entity_id>, zonder JSON-serialisatie
+        return {"entity_id": entity_id, "state": state.state, "attributes": state.attributes}
+
+    async def call_service(self, domain: str, service: str, data: dict | None = None) -> bool:
+        try:
+            self.log.debug("ha", "service %s.%s data=%s", domain, service, data)
+            await self.hass.services.async_call(domain, service, data or {}, blocking=True)
+            return True
+        except Exception as e:
+            self.log.warn("ha", "service %s.%s error: %s", domain, service, e)
+            return False
+
+    async def call_service_name(self, full_name: str, data: dict | None = None) -> bool:
+        if not full_name:
+            return False
+        if "." not in full_name:
+            self.log.warn("ha", "Invalid HA service '%s' (expected 'domain.service')", full_name)
+            return False
+        domain, service = full_name.split(".", 1)
+        return await self.call_service(domain, service, data)
+
+
+class Site:
+    """Wat de drivers van een site verwachten: opts, ha, log(), logger, power."""
+
+    def __init__(self, hass: HomeAssistant, opts: dict[str, Any]) -> None:
+        # defaults voor de GoodWe driver: geen venv in de HA-container
+        self.opts = {"setmode_python": sys.executable, "setmode_script": SETMODE_SCRIPT, **opts}
+        self.vendor = self.opts["vendor"]
+        self.name = str(self.opts.get("name") or self.opts.get("client_id") or self.vendor)
+        self.client_id = self.opts.get("client_id")
+        self.power = int(self.opts.get("power_watt", DEFAULT_POWER_WATT))
+        self.disable_ha = False
+        self.logger = SiteLogger(f"{self.name}/{self.vendor}")
+        self.ha = InProcessHomeAssistant(hass, self.logger)
+
+    def log(self, msg: str, cat: str = "main") -> None:
+        self.logger.info(cat, "%s", msg)
+
+
+class MetDeZonSiteCoordinator(DataUpdateCoordinator[dict[str, Any]]):
+    """Eén site: next_action ophalen, toepassen, telemetry lezen en uploaden."""
+
+    def __init__(self, hass: HomeAssistant, opts: dict[str, Any]) -> None:
+        """Initialiseer de coordinator voor één site."""
+        self.site = Site(hass, opts)
+        opts = self.site.opts
+        interval = int(opts.get("poll_interval", DEFAULT_POLL_INTERVAL))
+        self.cycle_timeout = min(float(opts.get("cycle_timeout", DEFAULT_CYCLE_TIMEOUT)), interval)
+        super().__init__(
+            hass,
+            LOGGER,
+            name=f"MetDeZon BMS {self.site.name}",
+            update_interval=timedelta(seconds=interval),
+        )
+
+        verify_ssl = bool(opts.get("verify_ssl", True))
+        self.backend = Backend(
+            async_get_clientsession(hass, verify_ssl=verify_ssl),
+            opts.get("api_url") or DEFAULT_API_URL,
+            opts.get("telemetry_url", DEFAULT_TEL_URL),
+            opts.get("api_key"),
+            verify_ssl,
+            self.site.logger,
+        )
+        self.driver = DRIVERS[self.site.vendor](self.site)
+        self.rbe = ReportByException(
+            enabled=bool(opts.get("report_by_exception", False)),
+            deadbands=parse_deadbands(opts.get("telemetry_deadbands") or DEFAULT_DEADBANDS),
+            max_silence=float(opts.get("telemetry_max_silence", 900)),
+        )
+
+    async def _async_update_data(self) -> dict[str, Any]:
+        """Eén agent-cyclus, begrensd door cycle_timeout."""
+        try:
+            async with async_timeout.timeout(self.cycle_timeout):
+                return await self._cycle()
+        except TimeoutError as err:
+            raise UpdateFailed(f"cycle exceeded {self.cycle_timeout:.0f}s") from err
+        except Exception as err:
+            raise UpdateFailed(str(err)) from err
+
+    async def _cycle(self) -> dict[str, Any]:
+        server_mode, server_power = await self.backend.fetch_next_action()
+        self.site.logger.debug("cycle", "server_mode=%s, server_power=%s", server_mode, server_power)
+        await self.driver.apply(server_mode, server_power)
+
+        tel = await self.driver.read_telemetry()
+        payload = self.rbe.filter(build_heartbeat(self.site.client_id, server_mode, tel))
+        uploaded = False
+        if payload is None:
+            self.site.logger.debug("telemetry", "No significant change; heartbeat skipped (%s in a row)", self.rbe.skipped)
+        elif await self.backend.upload_telemetry(payload):
+            self.rbe.sent(payload)
+            uploaded = True
+
+        return {
+            "server_mode": server_mode,
+            "server_power": server_power,
+            "mode_name": self.driver.mode_names.get(server_mode, "Unknown"),
+            "telemetry": tel,
+            "uploaded": uploaded,
+        }
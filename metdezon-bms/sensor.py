@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.sensor import SensorEntity
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.entity import DeviceInfo
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+
+from .const import DOMAIN
+from .coordinator import MetDeZonSiteCoordinator
+
+
+async def async_setup_platform(
+    hass: HomeAssistant,
+    config: ConfigType,
+    async_add_entities: AddEntitiesCallback,
+    discovery_info: DiscoveryInfoType | None = None,
+) -> None:
+    """Set up the MetDeZon BMS sensors (via discovery vanuit __init__.py)."""
+    if discovery_info is None:
+        return
+    async_add_entities(
+        [MetDeZonModeSensor(c) for c in hass.data[DOMAIN]["coordinators"]],
+        update_before_add=False,
+    )
+
+
+class MetDeZonModeSensor(CoordinatorEntity, SensorEntity):
+    """De policy mode die de backend voor deze site heeft opgegeven."""
+
+    _attr_icon = "mdi:home-battery"
+
+    def __init__(self, coordinator: MetDeZonSiteCoordinator) -> None:
+        """Initialiseer de sensor."""
+        super().__init__(coordinator)
+        site = coordinator.site
+        self._attr_name = f"MetDeZon {site.name} mode"
+        self._attr_unique_id = f"metdezon_bms_{site.client_id or site.name}_mode"
+
+    @property
+    def native_value(self) -> int | None:
+        """Return de server mode (1/3/4/7)."""
+        data = self.coordinator.data or {}
+        return data.get("server_mode")
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any]:
+        """Modenaam, vermogen en de laatst gelezen telemetry."""
+        data = self.coordinator.data or {}
+        attrs: dict[str, Any] = {}
+
+        for key in ("mode_name", "server_power", "uploaded"):
+            if key in data:
+                attrs[key] = data[key]
+        attrs.update(data.get("telemetry") or {})
+
+        return attrs
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        """Eén apparaat per site."""
+        site = self.coordinator.site
+        return DeviceInfo(
+            identifiers={(DOMAIN, site.client_id or site.name)},
+            name=f"MetDeZon {site.name}",
+            manufacturer=site.vendor,
+        )
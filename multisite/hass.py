@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Home Assistant REST client shared by all sites in the multi-site agent."""
+
+import os
+
+import aiohttp
+
+DEFAULT_HA_URL = "http://supervisor/core/api"
+
+
+def get_ha_token() -> str | None:
+    for k in ("SUPERVISOR_TOKEN", "HASSIO_TOKEN", "HOMEASSISTANT_TOKEN", "HA_TOKEN"):
+        v = os.environ.get(k)
+        if v:
+            return v
+    return None
+
+
+def ha_base_url(url: str | None) -> str:
+    url = (url or DEFAULT_HA_URL).rstrip("/")
+    if not url.endswith("/api"):
+        url += "/api"
+    return url
+
+
+class HomeAssistant:
+    """Thin async wrapper around the HA REST API on a shared aiohttp session."""
+
+    def __init__(self, session: aiohttp.ClientSession, url: str | None, token: str | None, log):
+        self.session = session
+        self.base_url = ha_base_url(url)
+        self.token = token or get_ha_token()
+        self.log = log  # AgentLog
+
+    def _headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"}
+
+    async def get_state(self, entity_id: str):
+        if not entity_id:
+            return None
+        if not self.token:
+            self.log.warn("ha", "no Home Assistant token in env (SUPERVISOR_TOKEN/HASSIO_TOKEN/HA_TOKEN).")
+            return None
+        url = f"{self.base_url}/states/{entity_id}"
+        try:
+            async with self.session.get(url, headers=self._headers(), timeout=aiohttp.ClientTimeout(total=5)) as r:
+                if r.status == 200:
+                    return await r.json()
+                if self.log.recording:
+                    self.log.debug("ha", "GET %s -> %s %s", entity_id, r.status, (await r.text())[:200])
+        except Exception as e:
+            self.log.debug("ha", "GET %s error: %s", entity_id, e)
+        return None
+
+    async def call_service(self, domain: str, service: str, data: dict | None = None) -> bool:
+        if not self.token:
+            self.log.warn("ha", "cannot call HA service; no token present.")
+            return False
+        url = f"{self.base_url}/services/{domain}/{service}"
+        try:
+            self.log.debug("ha", "service %s.%s data=%s", domain, service, data)
+            async with self.session.post(
+                url, headers=self._headers(), json=data or {}, timeout=aiohttp.ClientTimeout(total=10)
+            ) as r:
+                if self.log.recording:
+                    self.log.debug("ha", "service -> %s %s", r.status, (await r.text())[:200])
+                return r.status in (200, 201)
+        except Exception as e:
+            self.log.warn("ha", "service %s.%s error: %s", domain, service, e)
+            return False
+
+    async def call_service_name(self, full_name: str, data: dict | None = None) -> bool:
+        """Convenience: 'domain.service' string from the site options."""
+        if not full_name:
+            return False
+        if "." not in full_name:
+            self.log.warn("ha", "Invalid HA service '%s' (expected 'domain.service')", full_name)
+            return False
+        domain, service = full_name.split(".", 1)
+        return await self.call_service(domain, service, data)
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Fleet load generator for next_action.php and telemetry.php.
+
+Simulates N virtual agents. Each one runs the same cycle as the real agents
+(GET next_action with its own X-API-Key, then POST a heartbeat built by
+backend.build_heartbeat) every --interval seconds with +/- --jitter spread,
+and reports throughput and latency percentiles per endpoint.
+
+    # offline, against the local stand-in server
+    python3 loadgen.py --offline --clients 2000 --interval 60 --duration 300
+
+    # against a real (test) backend
+    python3 loadgen.py --api-url https://.../next_action.php \\
+        --telemetry-url https://.../telemetry.php --clients 500
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+
+import aiohttp
+
+from backend import build_heartbeat, parse_next_action
+
+ENDPOINTS = ("next_action", "telemetry")
+
+
+def log(msg: str) -> None:
+    print(f"[Loadgen] {msg}", flush=True)
+
+
+def percentile(sorted_vals: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_vals:
+        return float("nan")
+    k = max(0, min(len(sorted_vals) - 1, math.ceil(pct / 100.0 * len(sorted_vals)) - 1))
+    return sorted_vals[k]
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = {ep: [] for ep in ENDPOINTS}
+        self.ok = {ep: 0 for ep in ENDPOINTS}
+        self.errors = {ep: {} for ep in ENDPOINTS}
+        # how late cycles start vs their schedule: shows when the generator itself saturates
+        self.lag = []
+        self.started = time.monotonic()
+
+    def record(self, ep: str, seconds: float, error: str | None = None) -> None:
+        self.latencies[ep].append(seconds)
+        if error is None:
+            self.ok[ep] += 1
+        else:
+            self.errors[ep][error] = self.errors[ep].get(error, 0) + 1
+
+    def summary(self) -> str:
+        elapsed = max(1e-9, time.monotonic() - self.started)
+        lines = [f"elapsed={elapsed:.1f}s"]
+        for ep in ENDPOINTS:
+            lat = sorted(self.latencies[ep])
+            n = len(lat)
+            errs = sum(self.errors[ep].values())
+            line = (
+                f"{ep:<11} n={n} ok={self.ok[ep]} err={errs} rps={n / elapsed:.1f}"
+                f" p50={percentile(lat, 50) * 1000:.1f}ms p90={percentile(lat, 90) * 1000:.1f}ms"
+                f" p99={percentile(lat, 99) * 1000:.1f}ms max={(lat[-1] if lat else float('nan')) * 1000:.1f}ms"
+            )
+            if errs:
+                line += " errors=" + ",".join(f"{k}:{v}" for k, v in sorted(self.errors[ep].items()))
+            lines.append(line)
+        lag = sorted(self.lag)
+        if lag:
+            lines.append(f"sched_lag   p50={percentile(lag, 50) * 1000:.1f}ms p99={percentile(lag, 99) * 1000:.1f}ms")
+        return "\n".join(lines)
+
+
+class VirtualAgent:
+    """One simulated battery: random-walk telemetry, agent request pattern."""
+
+    def __init__(self, idx: int, args, session: aiohttp.ClientSession, stats: Stats):
+        self.client_id = f"{args.client_prefix}{idx}"
+        self.headers = {"X-API-Key": f"{args.api_key_prefix}{idx}"}
+        self.args = args
+        self.session = session
+        self.stats = stats
+        self.ssl = False if args.insecure else None
+        self.soc = random.uniform(10, 95)
+
+    def telemetry(self, mode: int) -> dict:
+        if mode == 3:
+            self.soc = min(100.0, self.soc + random.uniform(0.5, 2.0))
+        elif mode == 4:
+            self.soc = max(0.0, self.soc - random.uniform(0.5, 2.0))
+        else:
+            self.soc = min(100.0, max(0.0, self.soc + random.uniform(-0.3, 0.3)))
+        return {
+            "soc_pct": round(self.soc, 1),
+            "pv_power_w": random.randint(0, 6000),
+            "grid_power_w": random.randint(-5000, 5000),
+        }
+
+    async def _request(self, ep: str, method: str, url: str, **kw):
+        t0 = time.perf_counter()
+        try:
+            async with self.session.request(
+                method, url, headers=self.headers, ssl=self.ssl, timeout=aiohttp.ClientTimeout(total=self.args.timeout), **kw
+            ) as r:
+                body = await r.read()
+                self.stats.record(ep, time.perf_counter() - t0, None if r.status < 400 else f"http{r.status}")
+                return r.status, body
+        except asyncio.TimeoutError:
+            self.stats.record(ep, time.perf_counter() - t0, "timeout")
+        except aiohttp.ClientError as e:
+            self.stats.record(ep, time.perf_counter() - t0, type(e).__name__)
+        return None, None
+
+    async def cycle(self) -> None:
+        mode = -1
+        status, body = await self._request("next_action", "GET", self.args.api_url)
+        if status and status < 400:
+            try:
+                mode, _ = parse_next_action(json.loads(body))
+            except ValueError:
+                pass
+        payload = build_heartbeat(self.client_id, mode, self.telemetry(mode))
+        await self._request("telemetry", "POST", self.args.telemetry_url, json=payload)
+
+    async def run(self, start_delay: float, deadline: float) -> None:
+        loop = asyncio.get_running_loop()
+        due = loop.time() + start_delay
+        while due < deadline:
+            await asyncio.sleep(max(0.0, due - loop.time()))
+            self.stats.lag.append(max(0.0, loop.time() - due))
+            await self.cycle()
+            j = self.args.jitter
+            due += self.args.interval * random.uniform(1.0 - j, 1.0 + j)
+
+
+async def run(args) -> Stats:
+    stub = None
+    if args.offline:
+        import stub_backend
+
+        stub = await stub_backend.start(
+            "127.0.0.1", args.stub_port, latency_ms=args.stub_latency_ms, latency_jitter_ms=args.stub_latency_jitter_ms
+        )
+        base = f"http://127.0.0.1:{args.stub_port}/bms/api"
+        args.api_url = f"{base}/next_action.php"
+        args.telemetry_url = f"{base}/telemetry.php"
+
+    log(
+        f"{args.clients} clients, interval={args.interval}s jitter=±{args.jitter * 100:.0f}% "
+        f"duration={args.duration}s target≈{args.clients / args.interval:.1f} cycles/s"
+    )
+    log(f"next_action={args.api_url} telemetry={args.telemetry_url}")
+
+    stats = Stats()
+    connector = aiohttp.TCPConnector(limit=args.max_connections, force_close=args.fresh_connections)
+    try:
+        async with aiohttp.ClientSession(connector=connector) as session:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + args.duration
+            ramp = args.interval if args.ramp is None else args.ramp
+            agents = [VirtualAgent(i, args, session, stats) for i in range(args.clients)]
+            tasks = [asyncio.create_task(a.run(random.uniform(0, ramp), deadline)) for a in agents]
+
+            async def reporter():
+                while True:
+                    await asyncio.sleep(args.report_every)
+                    log("\n" + stats.summary())
+
+            rep = asyncio.create_task(reporter()) if args.report_every > 0 else None
+            await asyncio.gather(*tasks)
+            if rep:
+                rep.cancel()
+    finally:
+        if stub is not None:
+            await stub.cleanup()
+    return stats
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--api-url", default="https://api.metdezon.nl/bms/api/next_action.php")
+    p.add_argument("--telemetry-url", default="https://api.metdezon.nl/bms/api/telemetry.php")
+    p.add_argument("--clients", type=int, default=100, help="number of virtual agents")
+    p.add_argument("--interval", type=float, default=60.0, help="seconds between cycles per agent")
+    p.add_argument("--jitter", type=float, default=0.1, help="relative interval jitter (0.1 = ±10%%)")
+    p.add_argument("--ramp", type=float, default=None, help="spread first cycles over N s (default: interval)")
+    p.add_argument("--duration", type=float, default=120.0, help="test length in seconds")
+    p.add_argument("--timeout", type=float, default=10.0, help="per-request timeout, same as the agents")
+    p.add_argument("--max-connections", type=int, default=256)
+    p.add_argument("--fresh-connections", action="store_true", help="no keep-alive, like separate agents")
+    p.add_argument("--client-prefix", default="loadgen-")
+    p.add_argument("--api-key-prefix", default="loadgen-")
+    p.add_argument("--insecure", action="store_true", help="skip TLS verification (verify_ssl=false)")
+    p.add_argument("--report-every", type=float, default=10.0, help="interim report period, 0 = off")
+    p.add_argument("--offline", action="store_true", help="start the local stand-in backend and target it")
+    p.add_argument("--stub-port", type=int, default=8099)
+    p.add_argument("--stub-latency-ms", type=float, default=0.0)
+    p.add_argument("--stub-latency-jitter-ms", type=float, default=0.0)
+    args = p.parse_args()
+
+    stats = asyncio.run(run(args))
+    log("final\n" + stats.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""MetDeZon multi-site agent.
+
+One process drives any number of sites (inverters / households), each with
+its own vendor driver, client_id, api_key and entities. All sites run as
+separate tasks on one asyncio event loop and share a single pooled aiohttp
+session. Every cycle is bounded by a timeout, so a stuck device or HA call
+only costs its own site a cycle.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import traceback
+
+import aiohttp
+
+from agentlog import AgentLog, install_dump_signal
+from backend import Backend, build_heartbeat
+from drivers import DRIVERS
+from hass import HomeAssistant
+from hotreload import OPTIONS_RELOAD, OptionsWatcher
+from push import MqttPush
+from reporting import DEFAULT_DEADBANDS, ReportByException, parse_deadbands
+
+OPTIONS_FILE = os.environ.get("OPTIONS_FILE", "/data/options.json")
+
+DEFAULT_API_URL = "https://api.metdezon.nl/bms/api/next_action.php"
+DEFAULT_TEL_URL = "https://api.metdezon.nl/bms/api/telemetry.php"
+DEFAULT_MQTT_TOPIC = "metdezon/bms/{client_id}/action"
+
+# Seconds between options.json checks (SIGHUP checks at once)
+OPTIONS_CHECK = float(os.environ.get("OPTIONS_CHECK", "5"))
+# Shared by all sites; a change only takes effect after a restart
+RESTART_OPTIONS = (
+    "max_connections", "max_connections_per_host",
+    "mqtt_host", "mqtt_port", "mqtt_username", "mqtt_password", "mqtt_tls", "mqtt_max_age",
+)
+
+# ========================
+# Helpers
+# ========================
+
+
+LOG = AgentLog("Multi")
+
+
+def log(msg: str) -> None:
+    LOG.info("main", msg)
+
+
+def _truthy(v) -> bool:
+    return str(v).lower() in ("1", "true", "yes")
+
+
+def merge_options(opts: dict, defaults: dict) -> dict:
+    """Site options override the global ones; empty site values fall back to them."""
+    return {**defaults, **{k: v for k, v in opts.items() if v not in (None, "")}}
+
+
+def load_options(path: str = OPTIONS_FILE) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# ========================
+# Site
+# ========================
+
+
+class Site:
+    """One inverter/battery: its driver, backend identity and poll loop."""
+
+    def __init__(
+        self,
+        opts: dict,
+        defaults: dict,
+        session: aiohttp.ClientSession,
+        ha_clients: dict,
+        push: MqttPush | None = None,
+    ):
+        self.opts = merge_options(opts, defaults)
+        self.name = str(self.opts.get("name") or self.opts.get("client_id") or self.opts["vendor"])
+        self.vendor = self.opts["vendor"]
+        self.client_id = self.opts.get("client_id")
+        self.interval = int(self.opts.get("poll_interval", 60))
+        self.cycle_timeout = min(float(self.opts.get("cycle_timeout", 45)), self.interval)
+        self.power = int(self.opts.get("power_watt", 2000))
+        self.debug = _truthy(self.opts.get("debug", 0))
+        self.disable_ha = _truthy(self.opts.get("disable_ha", 0))
+        self.logger = AgentLog(
+            f"{self.name}/{self.vendor}", debug=self.debug, ring_size=int(self.opts.get("log_ring", 100))
+        )
+
+        # one HA client per (url, token): sites on the same HA share it
+        ha_key = (self.opts.get("ha_url"), self.opts.get("ha_token"))
+        if ha_key not in ha_clients:
+            ha_clients[ha_key] = HomeAssistant(session, ha_key[0], ha_key[1], LOG)
+        self.ha = ha_clients[ha_key]
+
+        self.backend = Backend(
+            session,
+            self.opts.get("api_url") or DEFAULT_API_URL,
+            self.opts.get("telemetry_url", DEFAULT_TEL_URL),
+            self.opts.get("api_key"),
+            _truthy(self.opts.get("verify_ssl", True)),
+            self.logger,
+        )
+        self.driver = DRIVERS[self.vendor](self)
+        self.rbe = ReportByException(
+            enabled=_truthy(self.opts.get("report_by_exception", False)),
+            deadbands=parse_deadbands(self.opts.get("telemetry_deadbands") or DEFAULT_DEADBANDS),
+            max_silence=float(self.opts.get("telemetry_max_silence", 900)),
+        )
+
+        # MQTT push: actions arrive between polls; HTTP becomes a slow consistency check
+        self.push = push if push is not None and push.host and self.client_id else None
+        self.mqtt_poll_interval = int(self.opts.get("mqtt_poll_interval", 600))
+        self._push_event = asyncio.Event()
+        self._pushed = None
+        self.last_action = None
+        self.topic = None
+        if self.push is not None:
+            self.topic = (self.opts.get("mqtt_topic") or DEFAULT_MQTT_TOPIC).format(client_id=self.client_id)
+            self.push.subscribe(self.topic, self.on_push)
+
+    def log(self, msg: str, cat: str = "main") -> None:
+        self.logger.info(cat, msg)
+
+    def set_debug(self, on: bool) -> None:
+        self.debug = on
+        self.logger.set_debug(on)
+
+    def stop(self) -> None:
+        """Called when the site's task is cancelled: no more pushes or log dumps for this site."""
+        if self.push is not None:
+            self.push.unsubscribe(self.topic, self.on_push)
+        self.logger.close()
+
+    def on_push(self, action: tuple[int, int]) -> None:
+        self._pushed = action
+        self._push_event.set()
+
+    def poll_interval(self) -> int:
+        if self.push is not None and self.push.connected:
+            return max(self.interval, self.mqtt_poll_interval)
+        return self.interval
+
+    async def wait_for_push(self, timeout: float) -> tuple[int, int] | None:
+        """Sleep up to timeout; return a pushed action as soon as one arrives."""
+        if not self._push_event.is_set():
+            try:
+                await asyncio.wait_for(self._push_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        self._push_event.clear()
+        action, self._pushed = self._pushed, None
+        return action
+
+    async def cycle(self, pushed: tuple[int, int] | None = None) -> None:
+        if pushed is not None:
+            server_mode, server_power = pushed
+            self.log(f"MQTT push: mode={server_mode} power={server_power}", "control")
+        else:
+            # 1) Get next action first, so we can both apply & report it
+            server_mode, server_power = await self.backend.fetch_next_action()
+        self.last_action = (server_mode, server_power)
+        self.logger.debug("cycle", "server_mode=%s, server_power=%s", server_mode, server_power)
+        await self.driver.apply(server_mode, server_power)
+
+        # 2) Read telemetry and upload heartbeat
+        tel = await self.driver.read_telemetry()
+        if tel:
+            # one rate-limited line per cycle (LOG_RATE "telemetry")
+            self.logger.info(
+                "telemetry",
+                "Telemetry: SOC=%s%% mode=%s (%s) PV=%sW grid=%sW",
+                tel.get("soc_pct"),
+                tel.get("mode"),
+                self.driver.mode_names.get(tel.get("mode"), "Unknown"),
+                tel.get("pv_power_w"),
+                tel.get("grid_power_w"),
+            )
+
+        # report-by-exception: only changes beyond the deadbands, plus a keep-alive
+        payload = self.rbe.filter(build_heartbeat(self.client_id, server_mode, tel))
+        if payload is None:
+            self.logger.debug("telemetry", "No significant change; heartbeat skipped (%s in a row)", self.rbe.skipped)
+        elif await self.backend.upload_telemetry(payload):
+            self.rbe.sent(payload)
+
+    async def run(self, start_delay: float = 0.0) -> None:
+        loop = asyncio.get_running_loop()
+        await asyncio.sleep(start_delay)
+        next_poll = 0.0
+        while True:
+            pushed = await self.wait_for_push(max(0.0, next_poll - loop.time()))
+            if pushed is not None and pushed == self.last_action:
+                continue
+            if pushed is None:
+                # keep a fixed poll cadence regardless of how long the cycle takes
+                next_poll = loop.time() + self.poll_interval()
+            try:
+                await asyncio.wait_for(self.cycle(pushed), timeout=self.cycle_timeout)
+            except asyncio.TimeoutError:
+                self.logger.error("cycle", "cycle exceeded %.0fs; cancelled", self.cycle_timeout)
+            except Exception as e:
+                self.logger.error("cycle", "%s", e)
+                if self.debug:
+                    traceback.print_exc()
+
+
+# ========================
+# Main
+# ========================
+
+
+# not part of a site's identity: debug is switched on the running site, the
+# RESTART_OPTIONS only take effect after a restart anyway
+KEY_IGNORED = ("debug",) + RESTART_OPTIONS
+
+
+def site_key(opts: dict, defaults: dict) -> str:
+    """Identity of a configured site: a site whose options did not change keeps running."""
+    return json.dumps(
+        [{k: v for k, v in d.items() if k not in KEY_IGNORED} for d in (opts, defaults)],
+        sort_keys=True,
+        default=str,
+    )
+
+
+async def run(options: dict, path: str | None = None) -> None:
+    if not options.get("sites"):
+        log("No sites configured; nothing to do.")
+        return
+
+    connector = aiohttp.TCPConnector(
+        limit=int(options.get("max_connections", 32)),
+        limit_per_host=int(options.get("max_connections_per_host", 8)),
+        ttl_dns_cache=300,
+    )
+    push = MqttPush(options, LOG)
+    install_dump_signal()
+    async with aiohttp.ClientSession(connector=connector) as session:
+        ha_clients: dict = {}
+        running: dict = {}  # site_key -> (Site, task)
+
+        def apply_sites(options: dict, initial: bool = False) -> None:
+            defaults = {k: v for k, v in options.items() if k != "sites"}
+            wanted = {}
+            for opts in options.get("sites") or []:
+                if opts.get("vendor") not in DRIVERS:
+                    log(f"Skipping site {opts.get('name')!r}: unknown vendor {opts.get('vendor')!r}")
+                    continue
+                wanted[site_key(opts, defaults)] = opts
+            removed = [k for k in running if k not in wanted]
+            for key in removed:
+                site, task = running.pop(key)
+                task.cancel()
+                site.stop()
+            for key, (site, _) in running.items():
+                debug = _truthy(merge_options(wanted[key], defaults).get("debug", 0))
+                if debug != site.debug:
+                    site.set_debug(debug)
+            added = [k for k in wanted if k not in running]
+            for i, key in enumerate(added):
+                site = Site(wanted[key], defaults, session, ha_clients, push)
+                # spread the sites over the interval so they don't all poll at the same moment
+                delay = i * site.interval / len(added) if initial else 0.0
+                running[key] = (site, asyncio.create_task(site.run(start_delay=delay)))
+            if initial:
+                names = ", ".join(f"{s.name}/{s.vendor}" for s, _ in running.values())
+                log(f"Agent up with {len(running)} site(s): {names}")
+            else:
+                log(f"Options reloaded: {len(added)} site(s) (re)started, {len(removed)} stopped, "
+                    f"{len(running) - len(added)} unchanged")
+
+        apply_sites(options, initial=True)
+        push.start()
+        try:
+            if not (OPTIONS_RELOAD and path):
+                await asyncio.gather(*(task for _, task in running.values()))
+                return
+            loop = asyncio.get_running_loop()
+            wake = asyncio.Event()
+            watcher = OptionsWatcher(path)
+            watcher.install_signal(wake=lambda: loop.call_soon_threadsafe(wake.set))
+            while True:
+                try:
+                    await asyncio.wait_for(wake.wait(), OPTIONS_CHECK)
+                except asyncio.TimeoutError:
+                    pass
+                wake.clear()
+                changes = watcher.changes()
+                if not changes:
+                    continue
+                if "debug" in changes:
+                    LOG.set_debug(_truthy(changes["debug"]))
+                restart = [k for k in RESTART_OPTIONS if k in changes]
+                if restart:
+                    LOG.warn("main", "Changed options that need an add-on restart: %s", ", ".join(restart))
+                # a site is only rebuilt when its own or the shared options changed;
+                # the HTTP session, HA clients and MQTT connection stay
+                apply_sites(watcher.current)
+        finally:
+            for _, task in running.values():
+                task.cancel()
+            push.stop()
+
+
+def main() -> None:
+    path = sys.argv[1] if len(sys.argv) > 1 else OPTIONS_FILE
+    asyncio.run(run(load_options(path), path))
+
+
+if __name__ == "__main__":
+    main()
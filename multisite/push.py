@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Optional MQTT push of actions for the multi-site agent.
+
+One broker connection serves all sites. The backend publishes the
+next_action JSON per client on a retained topic; paho's network thread
+hands each message to the owning site on the event loop.
+"""
+
+import asyncio
+import json
+import time
+
+
+def parse_pushed_action(raw: bytes, max_age: float, log) -> tuple[int, int] | None:
+    try:
+        data = json.loads(raw)
+        mode = int(str(data.get("mode", -1)))
+        power_watt = int(str(data.get("power_watt", 0)))
+        issued_at = data.get("issued_at")
+        if issued_at is not None and time.time() - float(issued_at) > max_age:
+            log.debug("mqtt", "ignoring stale action issued_at=%s", issued_at)
+            return None
+    except Exception as e:
+        log.warn("mqtt", "ignoring malformed action: %s", e)
+        return None
+    return mode, power_watt
+
+
+class MqttPush:
+    def __init__(self, opts: dict, log):
+        self.host = opts.get("mqtt_host") or ""
+        self.port = int(opts.get("mqtt_port") or 1883)
+        self.username = opts.get("mqtt_username") or ""
+        self.password = opts.get("mqtt_password") or None
+        self.tls = str(opts.get("mqtt_tls", False)).lower() in ("1", "true", "yes")
+        self.max_age = float(opts.get("mqtt_max_age") or 900)
+        self.log = log  # AgentLog
+        self.client = None
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.subscriptions: dict = {}  # topic -> callback(action) on the event loop
+
+    @property
+    def connected(self) -> bool:
+        return self.client is not None and self.client.is_connected()
+
+    def subscribe(self, topic: str, callback) -> None:
+        self.subscriptions[topic] = callback
+        if self.connected:
+            self.client.subscribe(topic, qos=1)
+
+    def unsubscribe(self, topic: str, callback=None) -> None:
+        """Drop a site's topic; with callback, only while it is still that site's."""
+        if callback is not None and self.subscriptions.get(topic) != callback:
+            return  # a rebuilt site already took the topic over
+        self.subscriptions.pop(topic, None)
+        if self.connected:
+            self.client.unsubscribe(topic)
+
+    def start(self) -> bool:
+        if not self.host:
+            return False
+        try:
+            import paho.mqtt.client as mqtt
+        except ImportError:
+            self.log.warn("mqtt", "mqtt_host set but paho-mqtt is not installed; HTTP polling only")
+            return False
+        self.loop = asyncio.get_running_loop()
+
+        def on_connect(client, userdata, flags, rc, properties=None):
+            if getattr(rc, "value", rc) == 0:
+                for topic in self.subscriptions:
+                    client.subscribe(topic, qos=1)
+                self.log.info("mqtt", "connected to %s:%s, %s topic(s)", self.host, self.port, len(self.subscriptions))
+            else:
+                self.log.warn("mqtt", "connect failed: %s", rc)
+
+        def on_message(client, userdata, msg):
+            callback = self.subscriptions.get(msg.topic)
+            if callback is None:
+                return
+            action = parse_pushed_action(msg.payload, self.max_age, self.log)
+            if action is not None:
+                self.loop.call_soon_threadsafe(callback, action)
+
+        # paho-mqtt 2.x wants an explicit callback API version; 1.x has no such argument
+        if hasattr(mqtt, "CallbackAPIVersion"):
+            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        else:
+            client = mqtt.Client()
+        if self.username:
+            client.username_pw_set(self.username, self.password)
+        if self.tls:
+            client.tls_set()
+        client.on_connect = on_connect
+        client.on_message = on_message
+        client.reconnect_delay_set(min_delay=1, max_delay=60)
+        client.connect_async(self.host, self.port, keepalive=60)
+        client.loop_start()
+        self.client = client
+        return True
+
+    def stop(self) -> None:
+        if self.client is not None:
+            self.client.loop_stop()
+            self.client.disconnect()
@@ -0,0 +1,21 @@
+#!/usr/bin/env bash
+set -euo pipefail
+
+OPT_FILE=/data/options.json
+
+SITES=$(jq -r '.sites | length' "$OPT_FILE" 2>/dev/null || echo "?")
+echo "[Multi] Start agent: sites=${SITES} options=${OPT_FILE}"
+
+TOKLEN=$(printf '%s' "${SUPERVISOR_TOKEN-}" | wc -c | tr -d '[:space:]')
+echo "[Multi] SUPERVISOR_TOKEN length: ${TOKLEN:-0}"
+
+# Logging: DEBUG for the agent-wide log, LOG_RATE for all sites (see agentlog.py)
+export DEBUG="$(jq -r '.debug // 0' "$OPT_FILE" 2>/dev/null || echo 0)"
+LOG_RATE="$(jq -r '.log_rate // empty' "$OPT_FILE" 2>/dev/null || true)"
+[ -n "$LOG_RATE" ] && export LOG_RATE
+
+# Changed options are applied without a restart: only the affected sites are rebuilt
+export OPTIONS_RELOAD="$(jq -r 'if .options_reload == null then true else .options_reload end' "$OPT_FILE" 2>/dev/null || echo true)"
+
+# The agent reads the (nested) site list straight from options.json
+exec python3 /app/multisite_agent.py "$OPT_FILE"
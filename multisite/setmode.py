@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# GoodWe mode/power write and telemetry read over RS485 (Modbus RTU).
+# Shipped in the add-on images together with pymodbus (see Dockerfile), so
+# nothing is installed at container start. goodwe_agent.py imports set_mode()
+# and read_telemetry() directly; the GoodWe driver of the multisite add-on and
+# the metdezon-bms integration runs it as a subprocess with SERIAL_PORT/
+# SERIAL_BAUD/SERIAL_SLAVE set per site. The CLI also serves for manual use:
+#   python3 setmode.py [mode] [power]
+#   python3 setmode.py --telemetry
+
+import json
+import os
+import sys
+
+SERIAL_PORT  = os.environ.get("SERIAL_PORT", "/dev/ttyUSB0")
+SERIAL_BAUD  = int(os.environ.get("SERIAL_BAUD", "9600"))
+SERIAL_SLAVE = int(os.environ.get("SERIAL_SLAVE", "247"))
+# host:port of modbus_gateway.py; when set, the bus is reached through it
+# instead of opening the serial port here
+MODBUS_GATEWAY = os.environ.get("MODBUS_GATEWAY", "")
+
+REG_MODE  = 47511
+REG_POWER = 47512
+
+# Telemetry registers (ET/EH/BT/BH family, same units as the HA goodwe sensors):
+# name -> (first register, type, scale). u32/s32 span two registers, high word first.
+TELEMETRY_REGS = {
+    "ppv1":         (35105, "u32", 1),
+    "ppv2":         (35109, "u32", 1),
+    "ppv3":         (35113, "u32", 1),
+    "ppv4":         (35117, "u32", 1),
+    "active_power": (35140, "s16", 1),    # grid, > 0 = export
+    "battery_soc":  (37007, "u16", 1),
+    "ems_mode":     (REG_MODE, "u16", 1), # what we write: 1=Auto, 2=Charge, 3=Discharge
+}
+
+# A gap of a few unused registers is cheaper to read along than a new RTU request
+MAX_GAP   = 32
+MAX_BLOCK = 125
+
+_WIDTH = {"u16": 1, "s16": 1, "u32": 2, "s32": 2}
+
+_client = None
+
+
+def _get_client(port: str, baud: int):
+    """One connection (serial or gateway), kept open for writes and reads alike."""
+    global _client
+    if _client is None:
+        if MODBUS_GATEWAY:
+            from pymodbus.client import ModbusTcpClient
+
+            host, _, gw_port = MODBUS_GATEWAY.rpartition(":")
+            # the gateway queues requests behind other bus users: allow for that
+            client = ModbusTcpClient(host or "127.0.0.1", port=int(gw_port), timeout=12)
+            port = MODBUS_GATEWAY
+        else:
+            from pymodbus.client import ModbusSerialClient
+
+            client = ModbusSerialClient(
+                port=port,
+                baudrate=baud,
+                stopbits=1,
+                bytesize=8,
+                parity='N',
+                timeout=1
+            )
+        if not client.connect():
+            raise IOError(f"cannot open {port}")
+        _client = client
+    return _client
+
+
+def close():
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+def set_mode(mode: int, power: int = 0, port: str = SERIAL_PORT, baud: int = SERIAL_BAUD, slave: int = SERIAL_SLAVE):
+    from pymodbus.exceptions import ModbusException
+
+    client = _get_client(port, baud)
+    try:
+        rr = client.write_register(address=REG_MODE, value=mode, slave=slave)
+        if rr.isError():
+            raise ModbusException(f"write mode {mode}: {rr}")
+        if mode in [2, 3] and power > 0:
+            rr = client.write_register(address=REG_POWER, value=power, slave=slave)
+            if rr.isError():
+                raise ModbusException(f"write power {power}: {rr}")
+    except Exception:
+        close()  # reopen next time; a half-read frame must not poison the next request
+        raise
+
+
+def plan_blocks(regs: dict = TELEMETRY_REGS, max_gap: int = MAX_GAP, max_block: int = MAX_BLOCK) -> list:
+    """Merge the wanted registers into as few (start, count) reads as possible."""
+    spans = sorted((addr, addr + _WIDTH[kind]) for addr, kind, _ in regs.values())
+    blocks = []
+    for start, end in spans:
+        if blocks:
+            b_start, b_end = blocks[-1]
+            if start - b_end <= max_gap and end - b_start <= max_block:
+                blocks[-1] = (b_start, max(b_end, end))
+                continue
+        blocks.append((start, end))
+    return [(start, end - start) for start, end in blocks]
+
+
+def decode(words: dict, regs: dict = TELEMETRY_REGS) -> dict:
+    """One pass over the register table: words is {address: u16} from the block reads."""
+    out = {}
+    for name, (addr, kind, scale) in regs.items():
+        hi = words.get(addr)
+        if hi is None:
+            continue
+        if _WIDTH[kind] == 2:
+            lo = words.get(addr + 1)
+            if lo is None:
+                continue
+            value = (hi << 16) | lo
+            if kind == "s32" and value & 0x80000000:
+                value -= 1 << 32
+        else:
+            value = hi
+            if kind == "s16" and value & 0x8000:
+                value -= 1 << 16
+        out[name] = value * scale
+    return out
+
+
+def read_registers(blocks: list, port: str = SERIAL_PORT, baud: int = SERIAL_BAUD, slave: int = SERIAL_SLAVE) -> dict:
+    client = _get_client(port, baud)
+    words = {}
+    try:
+        for start, count in blocks:
+            rr = client.read_holding_registers(address=start, count=count, slave=slave)
+            if rr.isError():
+                raise IOError(f"read {start}+{count}: {rr}")
+            words.update(zip(range(start, start + count), rr.registers))
+    except Exception:
+        close()
+        raise
+    return words
+
+
+_BLOCKS = plan_blocks()
+
+
+def read_telemetry(port: str = SERIAL_PORT, baud: int = SERIAL_BAUD, slave: int = SERIAL_SLAVE) -> dict:
+    """SOC, PV, grid and EMS mode in the agent's telemetry keys."""
+    raw = decode(read_registers(_BLOCKS, port, baud, slave))
+    out = {}
+    if "battery_soc" in raw:
+        out["soc_pct"] = float(raw["battery_soc"])
+    if "ems_mode" in raw:
+        out["mode"] = int(raw["ems_mode"])
+    ppv = [raw[k] for k in ("ppv1", "ppv2", "ppv3", "ppv4") if k in raw]
+    if ppv:
+        out["pv_power_w"] = int(sum(ppv))
+    if "active_power" in raw:
+        out["grid_power_w"] = int(raw["active_power"])
+    return out
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "--telemetry":
+        print(json.dumps(read_telemetry()))
+        sys.exit(0)
+    if len(sys.argv) < 2:
+        print("Usage: python3 setmode.py [mode] [power] | --telemetry")
+        print("Modes: 1=Auto, 2=Charge, 3=Discharge")
+        sys.exit(1)
+
+    mode = int(sys.argv[1])
+    power = int(sys.argv[2]) if len(sys.argv) >= 3 else 0
+    set_mode(mode, power)
+    print(f"Set mode {mode} {'with power ' + str(power) + 'W' if power else ''}")
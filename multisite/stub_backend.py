@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Local stand-in for next_action.php / telemetry.php.
+
+Used by loadgen.py (and for running agents offline). It answers with the
+same JSON shape as the real backend and can add artificial latency so the
+load generator has something realistic to measure.
+
+    python3 stub_backend.py --port 8099 --latency-ms 20
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import zlib
+
+from aiohttp import web
+
+# Modes the real backend hands out (see MODE_MAP in the agents)
+MODES = (1, 3, 4, 7)
+
+
+def make_app(latency_ms: float = 0.0, latency_jitter_ms: float = 0.0, error_rate: float = 0.0) -> web.Application:
+    stats = {"next_action": 0, "telemetry": 0, "errors": 0, "started": time.time()}
+
+    async def _delay() -> None:
+        d = latency_ms + random.uniform(0, latency_jitter_ms)
+        if d > 0:
+            await asyncio.sleep(d / 1000.0)
+
+    async def next_action(request: web.Request) -> web.Response:
+        await _delay()
+        stats["next_action"] += 1
+        if error_rate and random.random() < error_rate:
+            stats["errors"] += 1
+            return web.json_response({"error": "injected"}, status=503)
+        # slot-stable answer per api key so clients see realistic "no change" cycles
+        key = request.headers.get("X-API-Key", "")
+        slot = int(time.time() // 900)
+        mode = MODES[zlib.crc32(f"{key}:{slot}".encode()) % len(MODES)]
+        return web.json_response({"mode": mode, "power_watt": 2500 if mode in (3, 4) else 0, "reason": "stub"})
+
+    async def telemetry(request: web.Request) -> web.Response:
+        await _delay()
+        stats["telemetry"] += 1
+        payload = await request.json()
+        if "client_id" not in payload or "battery_mode" not in payload:
+            stats["errors"] += 1
+            return web.json_response({"ok": False, "error": "missing client_id/battery_mode"}, status=400)
+        if error_rate and random.random() < error_rate:
+            stats["errors"] += 1
+            return web.json_response({"ok": False, "error": "injected"}, status=503)
+        return web.json_response({"ok": True})
+
+    async def status(request: web.Request) -> web.Response:
+        return web.json_response(stats)
+
+    app = web.Application()
+    app.add_routes(
+        [
+            web.get("/bms/api/next_action.php", next_action),
+            web.post("/bms/api/telemetry.php", telemetry),
+            web.post("/bms/api/heartbeat.php", telemetry),
+            web.get("/stats", status),
+        ]
+    )
+    app["stats"] = stats
+    return app
+
+
+async def start(host: str = "127.0.0.1", port: int = 8099, **kwargs) -> web.AppRunner:
+    runner = web.AppRunner(make_app(**kwargs), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8099)
+    p.add_argument("--latency-ms", type=float, default=0.0)
+    p.add_argument("--latency-jitter-ms", type=float, default=0.0)
+    p.add_argument("--error-rate", type=float, default=0.0)
+    a = p.parse_args()
+    print(f"[Stub] Serving on http://{a.host}:{a.port}/bms/api/", flush=True)
+    web.run_app(
+        make_app(a.latency_ms, a.latency_jitter_ms, a.error_rate),
+        host=a.host,
+        port=a.port,
+        print=None,
+        access_log=None,
+    )
+
+
+if __name__ == "__main__":
+    main()
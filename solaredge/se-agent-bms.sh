@@ -28,9 +28,6 @@ CURL_TLS=()
 
 log(){ echo "[BMS] $(date '+%F %T') $*"; }
 
-# jq voor JSON parsing (idempotent; extra apk add kan geen kwaad)
-apk add --no-cache jq >/dev/null 2>&1 || true
-
 # --- Ensure control dir exists ---
 if [ ! -d "$CTRL_DIR" ]; then
   log "ERROR: Control dir $CTRL_DIR not found"
@@ -55,9 +52,10 @@ run_ctrl() {
 # ================= 1) Read local inverter state =================
 [ "$DEBUG" = "1" ] && log "DEBUG: reading inverter: $SCRIPT --info --timeout 30 $INV_IP"
 SOC_RAW="$( run_ctrl --info --timeout 30 "$INV_IP" 2>&1 || true )"
-printf '%s\n' "$SOC_RAW" > "$INFO_SNAPSHOT" 2>/dev/null || true
 
+# Alleen bij een fout wegschrijven: geen SD-kaart write elke minuut
 if ! echo "$SOC_RAW" | jq -e '.' >/dev/null 2>&1; then
+  printf '%s\n' "$SOC_RAW" > "$INFO_SNAPSHOT" 2>/dev/null || true
   log "ERROR: --info returned no/invalid JSON. See $INFO_SNAPSHOT"
   exit 0
 fi
@@ -124,19 +122,18 @@ HB_JSON="$(jq -n \
 CURL_ARGS=(-sS "${CURL_TLS[@]}" -H "Content-Type: application/json")
 [ -n "$API_KEY" ] && CURL_ARGS+=(-H "X-API-Key: $API_KEY")
 
-HTTP_TEL=$(curl -o /tmp/hb.out -w '%{http_code}' -X POST "${CURL_ARGS[@]}" -d "$HB_JSON" "$TEL_URL" || true)
-OUT_TEL="$(cat /tmp/hb.out 2>/dev/null || true)"
+# Body + statuscode in geheugen (laatste regel = code) i.p.v. via /tmp-bestanden
+OUT_TEL="$(curl -w '\n%{http_code}' -X POST "${CURL_ARGS[@]}" -d "$HB_JSON" "$TEL_URL" || true)"
+HTTP_TEL="${OUT_TEL##*$'\n'}"; OUT_TEL="${OUT_TEL%$'\n'*}"
 
-if [[ "$HTTP_TEL" =~ ^2 ]]; then
-  log "Heartbeat OK ($HTTP_TEL)"
-else
+if ! [[ "$HTTP_TEL" =~ ^2 ]]; then
   log "WARN: Heartbeat HTTP $HTTP_TEL body=$(echo "$OUT_TEL" | head -c 200)"
 fi
 
 # ================= 3) Fetch next action from server =================
-HTTP_ACT=$(curl -o /tmp/act.out -w '%{http_code}' -sS "${CURL_TLS[@]}" \
-  -H "Accept: application/json" ${API_KEY:+-H "X-API-Key: $API_KEY"} "$API_URL" || true)
-ACT_RAW="$(cat /tmp/act.out 2>/dev/null || true)"
+ACT_RAW="$(curl -w '\n%{http_code}' -sS "${CURL_TLS[@]}" \
+  -H "Accept: application/json" ${API_KEY:+-H "X-API-Key: $API_KEY"} "$API_URL" || true)"
+HTTP_ACT="${ACT_RAW##*$'\n'}"; ACT_RAW="${ACT_RAW%$'\n'*}"
 
 if ! [[ "$HTTP_ACT" =~ ^2 ]]; then
   log "ERROR: next_action HTTP $HTTP_ACT body=$(echo "$ACT_RAW" | head -c 200)"
@@ -184,9 +181,8 @@ HB2_JSON="$(jq -n \
   }
   '
 )"
-HTTP_TEL2=$(curl -o /tmp/hb2.out -w '%{http_code}' -X POST "${CURL_ARGS[@]}" -d "$HB2_JSON" "$TEL_URL" || true)
-if [[ "$HTTP_TEL2" =~ ^2 ]]; then
-  log "Heartbeat(policy) OK ($HTTP_TEL2)"
-else
-  log "WARN: Heartbeat(policy) HTTP $HTTP_TEL2 body=$(head -c 200 /tmp/hb2.out)"
+OUT_TEL2="$(curl -w '\n%{http_code}' -X POST "${CURL_ARGS[@]}" -d "$HB2_JSON" "$TEL_URL" || true)"
+HTTP_TEL2="${OUT_TEL2##*$'\n'}"; OUT_TEL2="${OUT_TEL2%$'\n'*}"
+if ! [[ "$HTTP_TEL2" =~ ^2 ]]; then
+  log "WARN: Heartbeat(policy) HTTP $HTTP_TEL2 body=$(echo "$OUT_TEL2" | head -c 200)"
 fi
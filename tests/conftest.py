@@ -0,0 +1,28 @@
+"""Helpers for the tests of the add-on modules.
+
+The add-ons are not packages: each folder is its own import root with its
+own copy of the shared modules. load() imports one file from one folder
+under a unique name, with that folder first on sys.path for its siblings.
+"""
+
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load(folder: str, module: str):
+    path = os.path.join(ROOT, folder, module + ".py")
+    name = f"{folder.replace('-', '_').lower()}_{module}"
+    if name in sys.modules:
+        return sys.modules[name]
+    sys.path.insert(0, os.path.join(ROOT, folder))
+    try:
+        spec = importlib.util.spec_from_file_location(name, path)
+        mod = importlib.util.module_from_spec(spec)
+        sys.modules[name] = mod
+        spec.loader.exec_module(mod)
+    finally:
+        sys.path.remove(os.path.join(ROOT, folder))
+    return mod
@@ -0,0 +1,74 @@
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from conftest import load
+
+np = pytest.importorskip("numpy")
+bt = load("backtest", "backtest")
+
+IMPORT_FEE, EXPORT_FEE = 0.15, 0.02
+
+
+def sequential(series, modes, power, bat):
+    """Reference: one parameter set, one step at a time, SOC carried straight into the next day."""
+    P, D, S = modes.shape
+    dt, cap, eta = series.dt, bat.capacity, bat.eta
+    out = {k: np.zeros((P, D)) for k in ("cost", "import", "export", "discharge")}
+    end_soc = np.zeros((P, D))
+    for p in range(P):
+        soc = bat.soc_start
+        pmax = min(power[p], bat.max_power)
+        for d in range(D):
+            for s in range(S):
+                m = modes[p, d, s]
+                net = series.load[d, s] - series.pv[d, s]
+                self_consumption = m == 7 or (m == 1 and not bat.mode1_hold)
+                charge = discharge = 0.0
+                if m == 3:
+                    charge = pmax
+                elif self_consumption or m == 1:
+                    charge = min(max(-net, 0.0), bat.max_power)
+                if m == 4:
+                    discharge = pmax
+                elif self_consumption:
+                    discharge = min(max(net, 0.0), bat.max_power)
+                charge = max(0.0, min(charge, (bat.soc_max - soc) * cap / (dt * eta)))
+                discharge = max(0.0, min(discharge, (soc - bat.soc_min) * cap * eta / dt))
+                soc += (charge * eta - discharge / eta) * dt / cap
+                grid = (net + charge - discharge) if series.valid[d, s] else 0.0
+                price = series.price[d, s]
+                out["cost"][p, d] += max(grid, 0) * dt * (price + IMPORT_FEE) - max(-grid, 0) * dt * (price - EXPORT_FEE)
+                out["import"][p, d] += max(grid, 0) * dt
+                out["export"][p, d] += max(-grid, 0) * dt
+                out["discharge"][p, d] += discharge * dt / eta
+            end_soc[p, d] = soc
+    return out, end_soc
+
+
+@pytest.mark.parametrize("mode1_hold", (False, True))
+def test_vectorised_matches_sequential(mode1_hold):
+    tz = ZoneInfo("Europe/Amsterdam")
+    series = bt.Series(*bt.synthetic(2, 900, tz), 900, tz)
+    assert (series.D, series.S) == (2, 96)
+
+    lows, highs, powers = np.array([0.05, 0.10]), np.array([0.15, 0.20]), np.array([2.5, 5.0])
+    modes_t, power_t, _ = bt.policy_threshold(series, lows, highs, powers)
+    modes_r, power_r, _ = bt.policy_rank(series, np.array([4, 12]), np.array([4, 12]), np.array([3.0]))
+    # one set with every mode, mode 1 included, at random
+    rng = np.random.default_rng(7)
+    modes_x = rng.choice(np.array([1, 3, 4, 7], dtype=np.int8), size=(1, series.D, series.S))
+    modes = np.concatenate([modes_t, modes_r, modes_x])
+    power = np.concatenate([power_t, power_r, [4.0]])
+
+    bat = bt.Battery(10.0, 5.0, soc_start=0.5, mode1_hold=mode1_hold)
+    got = bt.simulate(series, modes, power, bat, IMPORT_FEE, EXPORT_FEE)
+    want, end_soc = sequential(series, modes, power, bat)
+
+    # the second day must start from the first day's end, not from soc_start
+    assert not np.allclose(end_soc[:, 0], bat.soc_start)
+    assert got["passes"] == 2
+    assert got["daily_cost"] == pytest.approx(want["cost"], abs=1e-6)
+    assert got["import_kwh"] == pytest.approx(want["import"].sum(axis=1), abs=1e-6)
+    assert got["export_kwh"] == pytest.approx(want["export"].sum(axis=1), abs=1e-6)
+    assert got["cycles"] == pytest.approx(want["discharge"].sum(axis=1) / bat.capacity, abs=1e-6)
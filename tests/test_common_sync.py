@@ -0,0 +1,8 @@
+from conftest import load
+
+sync = load("common", "sync")
+
+
+def test_copies_match_common():
+    stale = [path for path, _, _ in sync.drift()]
+    assert not stale, f"out of sync with common/ (run common/sync.py): {stale}"
@@ -0,0 +1,30 @@
+import json
+import sys
+
+import pytest
+
+from conftest import load
+
+pytest.importorskip("requests")
+agent = load("enphase", "enphase_agent")
+envoy = load("enphase", "envoy")
+hotreload = load("enphase", "hotreload")
+
+
+def test_reload_rebuilds_the_envoy_driver(monkeypatch, tmp_path):
+    monkeypatch.setitem(sys.modules, "envoy", envoy)
+    for name in ("ENVOY", "ENVOY_HOST", "ENVOY_TOKEN", "RBE", "HTTP", "HEADERS_EXT"):
+        monkeypatch.setattr(agent, name, getattr(agent, name))
+    options = tmp_path / "options.json"
+    options.write_text(json.dumps({"envoy_host": "", "envoy_token": "t"}))
+    watcher = hotreload.OptionsWatcher(str(options))
+    assert agent.ENVOY is None
+
+    options.write_text(json.dumps({"envoy_host": "192.0.2.10", "envoy_token": "t"}))
+    agent.reload_options(watcher)
+    assert isinstance(agent.ENVOY, envoy.Envoy)
+    assert agent.ENVOY.base == "https://192.0.2.10"
+
+    options.write_text(json.dumps({"envoy_host": "", "envoy_token": "t"}))
+    agent.reload_options(watcher)
+    assert agent.ENVOY is None
@@ -0,0 +1,98 @@
+import threading
+
+import pytest
+
+from conftest import load
+
+pytest.importorskip("requests")
+envoy = load("enphase", "envoy")
+mock_envoy = load("enphase", "mock_envoy")
+
+
+@pytest.fixture
+def mock(monkeypatch, tmp_path):
+    server, env = mock_envoy.serve("127.0.0.1", 0, "good")
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(envoy, "TOKEN_CACHE", str(tmp_path / "envoy_token.json"))
+    monkeypatch.setattr(envoy, "ENLIGHTEN_LOGIN_URL", base + "/login/login.json")
+    monkeypatch.setattr(envoy, "ENTREZ_TOKEN_URL", base + "/tokens")
+    yield base, env
+    server.shutdown()
+    server.server_close()
+
+
+def settings(env) -> tuple:
+    ss = env.tariff["storage_settings"]
+    return ss["mode"], ss["charge_from_grid"], ss["reserved_soc"]
+
+
+def test_server_modes_map_to_storage_settings(mock):
+    base, env = mock
+    e = envoy.Envoy(base, token="good", reserve_soc=20)
+    env.soc = 64.4
+    expected = {
+        7: ("self-consumption", False, 20),
+        3: ("backup", True, 20),
+        1: ("self-consumption", False, 64),
+        4: ("savings-mode", False, 20),
+    }
+    for server_mode, wanted in expected.items():
+        env.pv_w = env.load_w  # keep the SOC where it is
+        assert e.apply_mode(server_mode)
+        assert settings(env) == wanted
+    assert env.puts == 4
+
+
+def test_put_only_on_change(mock):
+    base, env = mock
+    e = envoy.Envoy(base, token="good", reserve_soc=10)
+    assert not e.apply_mode(7)  # the mock starts in self-consumption at 10%
+    assert e.apply_mode(3)
+    assert not e.apply_mode(3)
+    assert env.puts == 1
+
+
+def test_hold_keeps_the_reserve_it_started_with(mock):
+    base, env = mock
+    e = envoy.Envoy(base, token="good", reserve_soc=10)
+    env.soc = 55.0
+    assert e.apply_mode(1)
+    env.soc = 52.0
+    assert not e.apply_mode(1)
+    assert settings(env)[2] == 55
+    # a new hold period starts from the SOC at that moment
+    assert e.apply_mode(7)
+    assert e.apply_mode(1)
+    assert settings(env)[2] == 52
+    assert env.puts == 3
+
+
+def test_401_renews_the_token(mock):
+    base, env = mock
+    e = envoy.Envoy(base, token="expired", username="me@example.com", password="pw", serial="1234")
+    assert e.apply_mode(3)
+    assert e.token in env.tokens and e.token != "expired"
+    assert env.puts == 1
+    # the new token was cached for the next start
+    assert envoy.Envoy(base)._load_cached_token() == e.token
+
+
+def test_401_without_credentials_is_an_envoy_error(mock):
+    base, env = mock
+    e = envoy.Envoy(base, token="expired")
+    with pytest.raises(envoy.EnvoyError):
+        e.read_telemetry()
+
+
+def test_telemetry_without_soc(mock, monkeypatch):
+    base, env = mock
+    e = envoy.Envoy(base, token="good")
+
+    def broken():
+        raise ValueError("no JSON")
+
+    monkeypatch.setattr(e, "read_soc", broken)
+    tel = e.read_telemetry()
+    assert "soc_pct" not in tel
+    assert tel["pv_power_w"] == env.pv_w
@@ -0,0 +1,30 @@
+import sys
+
+import pytest
+
+from conftest import load
+
+pytest.importorskip("pymodbus")
+from pymodbus.pdu import ExceptionResponse  # noqa: E402
+from pymodbus.register_write_message import WriteSingleRegisterResponse  # noqa: E402
+
+agent = load("goodwe", "goodwe_agent")
+setmode = load("goodwe", "setmode")
+
+
+class FakeClient:
+    def __init__(self, refuse: bool):
+        self.refuse = refuse
+
+    def write_register(self, address, value, slave):
+        return ExceptionResponse(6, 4) if self.refuse else WriteSingleRegisterResponse(address, value)
+
+    def close(self):
+        pass
+
+
+@pytest.mark.parametrize("refuse", (False, True))
+def test_set_mode_reports_acknowledged_writes_only(monkeypatch, refuse):
+    monkeypatch.setitem(sys.modules, "setmode", setmode)
+    monkeypatch.setattr(setmode, "_client", FakeClient(refuse))
+    assert agent.set_mode(2, 1000) is not refuse
@@ -0,0 +1,59 @@
+import json
+import socket
+import urllib.error
+import urllib.request
+
+import pytest
+
+from conftest import load
+
+# the agents' copies are held to this one by test_common_sync
+history = load("common", "history")
+
+
+def test_slot_mean_is_per_channel():
+    h = history.TelemetryHistory(hours=1, resolution=60)
+    t0 = 6000.0
+    h.record({"pv_power_w": 1000, "grid_power_w": -200}, ts=t0)
+    h.record({"pv_power_w": 2000}, ts=t0 + 10)
+    h.record({"pv_power_w": 3000}, ts=t0 + 20)
+    h.record({"grid_power_w": 400}, ts=t0 + 30)
+    assert h.series("pv_power_w", 60, now=t0 + 30) == [(t0, 2000.0)]
+    assert h.series("grid_power_w", 60, now=t0 + 30) == [(t0, 100.0)]
+    # a new slot starts both means afresh
+    h.record({"pv_power_w": 500}, ts=t0 + 60)
+    h.record({"grid_power_w": 50}, ts=t0 + 61)
+    assert h.series("pv_power_w", 60, now=t0 + 61) == [(t0 + 60, 500.0)]
+    assert h.series("grid_power_w", 60, now=t0 + 61) == [(t0 + 60, 50.0)]
+
+
+def test_parse_window():
+    assert history.parse_window(None) == 3600
+    assert history.parse_window("90") == 90
+    assert history.parse_window("15m") == 900
+    assert history.parse_window("2d") == 172800
+    for bad in ("inf", "nan", "-5", "-1h", "infh", "1e400", "h"):
+        with pytest.raises(ValueError):
+            history.parse_window(bad)
+
+
+def test_endpoint_rejects_bad_windows():
+    h = history.TelemetryHistory(hours=1, resolution=60)
+    server = history.serve(h, port=_free_port(), bind="127.0.0.1")
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        for window in ("inf", "-60", "nan"):
+            with pytest.raises(urllib.error.HTTPError) as exc:
+                urllib.request.urlopen(f"{base}/aggregates?window={window}", timeout=5)
+            assert exc.value.code == 400
+        with urllib.request.urlopen(f"{base}/aggregates?window=1h", timeout=5) as r:
+            assert json.load(r)["window_s"] == 3600
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
@@ -0,0 +1,20 @@
+import math
+
+import pytest
+
+from conftest import load
+
+pytest.importorskip("aiohttp")
+loadgen = load("multisite", "loadgen")
+
+
+def test_nearest_rank_percentile():
+    vals = list(range(1, 11))
+    assert loadgen.percentile(vals, 50) == 5
+    assert loadgen.percentile(vals, 90) == 9
+    assert loadgen.percentile(vals, 95) == 10
+    assert loadgen.percentile(vals, 100) == 10
+    assert loadgen.percentile(vals, 0) == 1
+    assert loadgen.percentile([1, 2, 3, 4], 50) == 2
+    assert loadgen.percentile([7], 99) == 7
+    assert math.isnan(loadgen.percentile([], 50))
@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+
+from conftest import load
+
+gw = load("goodwe", "modbus_gateway")
+
+READ = bytes([3, 0, 0, 0, 1])
+
+
+class BrokenPortBus(gw.SerialBus):
+    def __init__(self):
+        super().__init__("/dev/missing", 9600)
+        self.opens = 0
+
+    def _open(self):
+        self.opens += 1
+        raise OSError("could not open port /dev/missing")
+
+
+class FlakyBus:
+    """Raises something that is not a ModbusException once, then answers."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def transact(self, unit, pdu):
+        self.calls += 1
+        if self.calls == 1:
+            raise RuntimeError("driver bug")
+        return bytes([3, 2, 0, 42])
+
+
+class BusyOnceBus:
+    """Answers the first read with exception 0x06 (slave busy), then with data."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def transact(self, unit, pdu):
+        self.calls += 1
+        if self.calls == 1:
+            return bytes([0x83, 0x06])
+        return bytes([3, 2, 0, 42])
+
+
+class NullWriter:
+    def get_extra_info(self, name):
+        return ("127.0.0.1", 0)
+
+    def write(self, data):
+        pass
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_open_failure_is_no_response():
+    bus = BrokenPortBus()
+    bus.t35 = 0
+    with pytest.raises(gw.ModbusException) as exc:
+        bus.transact(1, READ)
+    assert exc.value.code == gw.EXC_NO_RESPONSE
+    # the port is retried on the next transaction
+    with pytest.raises(gw.ModbusException):
+        bus.transact(1, READ)
+    assert bus.opens == 2
+
+
+def test_scheduler_survives_unexpected_errors():
+    async def scenario():
+        sched = gw.BusScheduler(FlakyBus(), coalesce=0)
+        worker = asyncio.create_task(sched.run())
+        try:
+            with pytest.raises(gw.ModbusException) as exc:
+                await sched.submit(1, READ)
+            assert exc.value.code == gw.EXC_NO_RESPONSE
+            # the worker is still running and answers the next request
+            assert await asyncio.wait_for(sched.submit(1, READ), 2) == bytes([3, 2, 0, 42])
+            assert sched.stats.errors == 1
+            assert not sched.inflight
+        finally:
+            worker.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_gateway_answers_exception_frame_when_port_is_gone():
+    async def scenario():
+        bus = BrokenPortBus()
+        bus.t35 = 0
+        sched = gw.BusScheduler(bus)
+        worker = asyncio.create_task(sched.run())
+        server = await asyncio.start_server(gw.Gateway(sched).handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(bytes([0, 7, 0, 0, 0, 6, 1]) + READ)
+            resp = await asyncio.wait_for(reader.readexactly(9), 2)
+            writer.close()
+            assert resp == bytes([0, 7, 0, 0, 0, 3, 1, 0x83, gw.EXC_NO_RESPONSE])
+        finally:
+            worker.cancel()
+            server.close()
+
+    asyncio.run(scenario())
+
+
+def test_exception_responses_are_not_cached():
+    async def scenario():
+        bus = BusyOnceBus()
+        sched = gw.BusScheduler(bus, coalesce=60)
+        worker = asyncio.create_task(sched.run())
+        try:
+            assert await sched.submit(1, READ) == bytes([0x83, 0x06])
+            assert await sched.submit(1, READ) == bytes([3, 2, 0, 42])
+            assert await sched.submit(1, READ) == bytes([3, 2, 0, 42])
+            assert bus.calls == 2
+            assert sched.stats.coalesced == 1
+        finally:
+            worker.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_truncated_request_closes_the_connection():
+    async def scenario():
+        gateway = gw.Gateway(gw.BusScheduler(FlakyBus()))
+        reader = asyncio.StreamReader()
+        # MBAP header announces 5 PDU bytes, the client hangs up after 2
+        reader.feed_data(bytes([0, 7, 0, 0, 0, 6, 1]) + READ[:2])
+        reader.feed_eof()
+        await asyncio.wait_for(gateway.handle(reader, NullWriter()), 2)
+        assert gateway.clients == 0
+
+    asyncio.run(scenario())
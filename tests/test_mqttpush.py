@@ -0,0 +1,126 @@
+import asyncio
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from conftest import load
+
+mqtt = pytest.importorskip("paho.mqtt.client")
+mqttpush = load("goodwe", "mqttpush")
+agent = load("goodwe", "goodwe_agent")
+
+
+class Log:
+    def __init__(self):
+        self.lines = []
+
+    def _log(self, *args):
+        self.lines.append(args)
+
+    debug = info = warn = error = _log
+
+
+@pytest.fixture(scope="module")
+def broker():
+    """A local amqtt broker on a free port, for the life of this module."""
+    amqtt_broker = pytest.importorskip("amqtt.broker")
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    config = {
+        "listeners": {"default": {"type": "tcp", "bind": f"127.0.0.1:{port}"}},
+        "plugins": {"amqtt.plugins.authentication.AnonymousAuthPlugin": {"allow_anonymous": True}},
+    }
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    holder = {}
+
+    def run():
+        asyncio.set_event_loop(loop)
+        holder["broker"] = amqtt_broker.Broker(config, loop=loop)
+        loop.run_until_complete(holder["broker"].start())
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    assert started.wait(10), "broker did not start"
+    yield port
+    asyncio.run_coroutine_threadsafe(holder["broker"].shutdown(), loop).result(10)
+    loop.call_soon_threadsafe(loop.stop)
+
+
+def publish(port: int, topic: str, payload: dict, retain: bool = False) -> None:
+    if hasattr(mqtt, "CallbackAPIVersion"):
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    else:
+        client = mqtt.Client()
+    client.connect("127.0.0.1", port)
+    client.loop_start()
+    client.publish(topic, json.dumps(payload), qos=1, retain=retain).wait_for_publish(5)
+    client.disconnect()
+    client.loop_stop()
+
+
+def wait_connected(push, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not push.connected:
+        assert time.monotonic() < deadline, "no connection to the broker"
+        time.sleep(0.02)
+    time.sleep(0.3)  # on_connect subscribes right after the CONNACK
+
+
+def test_parse_pushed_action():
+    log = Log()
+    now = time.time()
+    assert mqttpush.parse_pushed_action(b'{"mode": 3, "power_watt": "1500"}', 900, log) == (3, 1500)
+    assert mqttpush.parse_pushed_action(json.dumps({"mode": 4, "issued_at": now - 60}), 900, log) == (4, 0)
+    assert mqttpush.parse_pushed_action(json.dumps({"mode": 4, "issued_at": now - 901}), 900, log) is None
+    assert mqttpush.parse_pushed_action(b"not json", 900, log) is None
+
+
+def test_retained_action_is_applied_on_connect(broker):
+    topic = "metdezon/bms/retained/action"
+    publish(broker, topic, {"mode": 3, "power_watt": 1500, "issued_at": time.time()}, retain=True)
+    push = mqttpush.ActionPush(Log(), max_age=900)
+    assert push.start("127.0.0.1", broker, topic, client_id="test-retained")
+    try:
+        assert push.wait(5) == (3, 1500)
+    finally:
+        push.stop()
+
+
+def test_stale_retained_action_is_ignored(broker):
+    topic = "metdezon/bms/stale/action"
+    publish(broker, topic, {"mode": 4, "power_watt": 2000, "issued_at": time.time() - 3600}, retain=True)
+    log = Log()
+    push = mqttpush.ActionPush(log, max_age=900)
+    assert push.start("127.0.0.1", broker, topic, client_id="test-stale")
+    try:
+        wait_connected(push)
+        assert push.wait(1) is None
+        assert any("stale" in line[1] for line in log.lines)
+    finally:
+        push.stop()
+
+
+def test_push_wakes_the_poll_loop(broker, monkeypatch):
+    monkeypatch.setattr(agent, "MQTT_HOST", "127.0.0.1")
+    monkeypatch.setattr(agent, "MQTT_PORT", broker)
+    monkeypatch.setattr(agent, "CLIENT_ID", "wake")
+    monkeypatch.setattr(agent, "INTERVAL", 60)
+    monkeypatch.setattr(agent, "MQTT_POLL_INTERVAL", 600)
+    agent.mqtt_start()
+    try:
+        wait_connected(agent.PUSH)
+        # connected: HTTP polling backs off to the slow consistency check
+        assert agent.poll_interval() == 600
+        threading.Timer(0.2, publish, (broker, "metdezon/bms/wake/action", {"mode": 7})).start()
+        t0 = time.monotonic()
+        assert agent.wait_for_push(30) == (7, 0)
+        assert time.monotonic() - t0 < 5
+    finally:
+        agent.mqtt_stop()
+    assert agent.poll_interval() == 60
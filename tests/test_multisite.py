@@ -0,0 +1,77 @@
+import asyncio
+import sys
+
+import pytest
+
+from conftest import load
+
+pytest.importorskip("aiohttp")
+agent = load("multisite", "multisite_agent")
+push = load("multisite", "push")
+
+
+class Log:
+    def _log(self, *args):
+        pass
+
+    debug = info = warn = error = _log
+
+
+class FakeClient:
+    def __init__(self):
+        self.unsubscribed = []
+
+    def is_connected(self):
+        return True
+
+    def subscribe(self, topic, qos=0):
+        pass
+
+    def unsubscribe(self, topic):
+        self.unsubscribed.append(topic)
+
+
+SITE = {"vendor": "sungrow", "name": "a", "client_id": "a", "api_key": "k"}
+DEFAULTS = {"poll_interval": 60, "debug": False, "mqtt_host": "broker", "max_connections": 32}
+
+
+def test_site_key_ignores_debug_and_restart_options():
+    key = agent.site_key(SITE, DEFAULTS)
+    assert agent.site_key({**SITE, "debug": True}, DEFAULTS) == key
+    assert agent.site_key(SITE, {**DEFAULTS, "debug": True}) == key
+    for option in agent.RESTART_OPTIONS:
+        assert agent.site_key(SITE, {**DEFAULTS, option: "changed"}) == key
+    assert agent.site_key(SITE, {**DEFAULTS, "poll_interval": 30}) != key
+    assert agent.site_key({**SITE, "mqtt_topic": "x/{client_id}"}, DEFAULTS) != key
+
+
+def test_unsubscribe_only_drops_the_owners_topic():
+    mqtt = push.MqttPush({"mqtt_host": "broker"}, Log())
+    mqtt.client = FakeClient()
+    old, new = object(), object()
+    mqtt.subscribe("t", old)
+    mqtt.subscribe("t", new)  # the rebuilt site took the topic over
+    mqtt.unsubscribe("t", old)
+    assert mqtt.subscriptions == {"t": new}
+    mqtt.unsubscribe("t", new)
+    assert mqtt.subscriptions == {}
+    assert mqtt.client.unsubscribed == ["t"]
+
+
+def test_stopped_site_drops_its_push_and_log():
+    async def scenario():
+        import aiohttp
+
+        mqtt = push.MqttPush({"mqtt_host": "broker"}, Log())
+        async with aiohttp.ClientSession() as session:
+            site = agent.Site(SITE, DEFAULTS, session, {}, mqtt)
+            logs = sys.modules[agent.AgentLog.__module__]._LOGS
+            assert site.topic in mqtt.subscriptions
+            assert site.logger in logs
+            site.stop()
+            assert site.topic not in mqtt.subscriptions
+            assert site.logger not in logs
+            site.set_debug(True)
+            assert site.logger.debug_enabled
+
+    asyncio.run(scenario())
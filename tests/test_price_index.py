@@ -0,0 +1,108 @@
+import importlib
+import os
+import sys
+import types
+from array import array
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from conftest import ROOT
+
+
+def load_epex(module: str):
+    """price_index/tariff import each other relatively; load them under a bare
+    dwars_epex package, without __init__.py (which needs Home Assistant)."""
+    if "dwars_epex" not in sys.modules:
+        pkg = types.ModuleType("dwars_epex")
+        pkg.__path__ = [os.path.join(ROOT, "dwars-epex")]
+        sys.modules["dwars_epex"] = pkg
+    return importlib.import_module(f"dwars_epex.{module}")
+
+
+price_index = load_epex("price_index")
+tariff = load_epex("tariff")
+
+T0 = datetime(2026, 3, 2, 0, 0, tzinfo=timezone.utc).timestamp()
+Q = 900  # one quarter
+
+
+def index(points: dict, tz=timezone.utc, tar=None):
+    ts = sorted(points)
+    return price_index.PriceIndex({"timestamps": ts, "prices": [points[t] for t in ts]}, tz, tar)
+
+
+def test_bounds_at_and_between_points():
+    idx = index({T0 + k * Q: 0.1 * k for k in range(8)})
+    assert idx.bounds() == (0, 8)
+    # a start on a point includes it, an end on a point excludes it
+    assert idx.bounds(T0 + Q, T0 + 3 * Q) == (1, 3)
+    # between two points: the start moves to the next one, the end keeps the one before
+    assert idx.bounds(T0 + Q + 1, T0 + 3 * Q + 1) == (2, 4)
+    assert idx.bounds(T0 - 1, T0) == (0, 0)
+    assert idx.bounds(T0 + 8 * Q, None) == (8, 8)
+    rows = idx.query(T0 + 4 * Q, T0 + 6 * Q)
+    assert [r["start"] for r in rows] == [T0 + 4 * Q, T0 + 5 * Q]
+    assert [r["price"] for r in rows] == pytest.approx([0.4, 0.5])
+
+
+def test_hour_buckets_across_a_gap():
+    # 00:00 and 00:15 only, nothing in hour 01, then 02:00..02:45
+    points = {T0: 0.10, T0 + Q: 0.20}
+    points.update({T0 + 7200 + k * Q: 0.30 + 0.1 * k for k in range(4)})
+    idx = index(points)
+    rows = idx.query(resolution="hour", aggregation="stats")
+    assert [r["start"] for r in rows] == [T0, T0 + 7200]
+    assert [r["count"] for r in rows] == [2, 4]
+    assert rows[0]["mean"] == pytest.approx(0.15)
+    assert (rows[1]["min"], rows[1]["max"]) == pytest.approx((0.30, 0.60))
+    # a window starting mid-bucket aggregates only the points inside it
+    assert idx.query(T0 + Q, T0 + 7200 + 2 * Q, "hour", "max") == [
+        {"start": T0, "price": pytest.approx(0.20)},
+        {"start": T0 + 7200, "price": pytest.approx(0.40)},
+    ]
+
+
+def test_day_buckets_follow_local_midnight():
+    tz = ZoneInfo("Europe/Amsterdam")
+    midnight = datetime(2026, 3, 2, tzinfo=tz).timestamp()  # 23:00 UTC the day before
+    idx = index({midnight - Q: 1.0, midnight: 2.0, midnight + Q: 4.0}, tz)
+    rows = idx.query(resolution="day")
+    assert [r["start"] for r in rows] == [midnight - 86400, midnight]
+    assert [r["price"] for r in rows] == pytest.approx([1.0, 3.0])
+
+
+def test_import_and_export_series():
+    tar = tariff.Tariff(energy_tax=0.10, surcharge=0.02, import_spread=0.01, export_spread=0.03, vat=0.21)
+    idx = index({T0: 0.10, T0 + Q: -0.05}, tar=tar)
+    assert list(idx.series["raw"]) == [0.10, -0.05]
+    assert list(idx.series["import"]) == pytest.approx([(0.10 + 0.13) * 1.21, (-0.05 + 0.13) * 1.21])
+    assert list(idx.series["export"]) == pytest.approx([0.07, -0.08])
+
+
+@pytest.mark.parametrize(
+    "energy_tax_on, vat_on, expected",
+    [
+        (False, False, 0.20 - 0.03),
+        (True, False, 0.20 - 0.03 + 0.10),
+        (False, True, (0.20 - 0.03) * 1.21),
+        (True, True, (0.20 - 0.03 + 0.10) * 1.21),
+    ],
+)
+def test_export_energy_tax_and_vat(energy_tax_on, vat_on, expected):
+    tar = tariff.Tariff(energy_tax=0.10, surcharge=0.02, import_spread=0.01, export_spread=0.03, vat=0.21,
+                        export_energy_tax=energy_tax_on, export_vat=vat_on)
+    assert tar.value(0.20, "export") == pytest.approx(expected)
+    assert tar.value(0.20, "import") == pytest.approx((0.20 + 0.02 + 0.01 + 0.10) * 1.21)
+    assert list(tar.apply(array("d", [0.20]), "export")) == pytest.approx([expected])
+    assert tar.apply_list([0.20, "n/a", None], "export") == [round(expected, 5), None, None]
+
+
+def test_default_tariff_is_the_spot_price():
+    tar = tariff.Tariff.from_config({"unknown": 1})
+    prices = array("d", [0.1, -0.2])
+    for series in tariff.SERIES:
+        assert tar.apply(prices, series) is prices
+        assert tar.value(0.1, series) == 0.1
+    assert tar.value(None, "import") is None
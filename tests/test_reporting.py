@@ -0,0 +1,72 @@
+import types
+
+import pytest
+
+from conftest import load
+
+reporting = load("common", "reporting")
+
+
+class Clock:
+    def __init__(self):
+        self.t = 1000.0
+
+    def monotonic(self) -> float:
+        return self.t
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(reporting, "time", types.SimpleNamespace(monotonic=c.monotonic))
+    return c
+
+
+def heartbeat(**fields) -> dict:
+    hb = {"client_id": "c1", "reported_at": "2026-01-01T00:00:00Z", "battery_mode": 7,
+          "soc": 50.0, "grid_power_w": 100, "pv_power_w": 1200}
+    hb.update(fields)
+    return hb
+
+
+def started(clock):
+    """Report-by-exception with the first (full) heartbeat already uploaded."""
+    rbe = reporting.ReportByException(True, {"soc": 0.5, "grid_power_w": 50}, max_silence=900)
+    first = rbe.filter(heartbeat())
+    assert first == heartbeat()
+    rbe.sent(first)
+    return rbe
+
+
+def test_change_inside_deadband_is_suppressed(clock):
+    rbe = started(clock)
+    clock.t += 60
+    assert rbe.filter(heartbeat(soc=50.4, grid_power_w=149)) is None
+    assert rbe.skipped == 1
+
+
+def test_change_past_deadband_is_sent(clock):
+    rbe = started(clock)
+    clock.t += 60
+    payload = rbe.filter(heartbeat(soc=50.6, grid_power_w=120))
+    assert payload == {"client_id": "c1", "reported_at": "2026-01-01T00:00:00Z", "battery_mode": 7,
+                       "soc": 50.6, "delta": True}
+    rbe.sent(payload)
+    # the deadband is measured from what the backend got, not from the last reading
+    clock.t += 60
+    assert rbe.filter(heartbeat(soc=51.0)) is None
+
+
+def test_full_heartbeat_after_max_silence(clock):
+    rbe = started(clock)
+    clock.t += 899
+    assert rbe.filter(heartbeat()) is None
+    clock.t += 1
+    assert rbe.filter(heartbeat()) == heartbeat()
+
+
+def test_key_without_deadband_is_sent_on_any_change(clock):
+    rbe = started(clock)
+    clock.t += 60
+    assert rbe.filter(heartbeat(pv_power_w=1201))["pv_power_w"] == 1201
+    assert rbe.filter(heartbeat(inverter_state="fault"))["inverter_state"] == "fault"
@@ -0,0 +1,93 @@
+import importlib.util
+
+import pytest
+
+from conftest import load
+
+# the copies in goodwe/, multisite/ and metdezon-bms/ are held to this one by test_common_sync
+setmode = load("common", "setmode")
+
+needs_pymodbus = pytest.mark.skipif(importlib.util.find_spec("pymodbus") is None, reason="needs pymodbus")
+
+
+@pytest.mark.parametrize(
+    "gap, blocks",
+    [
+        (setmode.MAX_GAP, [(100, 2 + setmode.MAX_GAP + 1)]),
+        (setmode.MAX_GAP + 1, [(100, 2), (102 + setmode.MAX_GAP + 1, 1)]),
+    ],
+)
+def test_plan_blocks_merges_up_to_max_gap(gap, blocks):
+    regs = {"a": (100, "u32", 1), "b": (102 + gap, "u16", 1)}
+    assert setmode.plan_blocks(regs) == blocks
+
+
+def test_plan_blocks_respects_max_block():
+    regs = {"a": (0, "u16", 1), "b": (10, "u16", 1), "c": (20, "s32", 1)}
+    assert setmode.plan_blocks(regs, max_block=20) == [(0, 11), (20, 2)]
+    assert setmode.plan_blocks(regs, max_block=22) == [(0, 22)]
+    assert setmode.plan_blocks(regs, max_gap=8) == [(0, 1), (10, 1), (20, 2)]
+
+
+def test_decode_signs_and_widths():
+    regs = {
+        "s16_min": (0, "s16", 1),
+        "s16_max": (1, "s16", 1),
+        "u16": (2, "u16", 1),
+        "s32_min": (3, "s32", 1),
+        "s32_max": (5, "s32", 1),
+        "u32": (7, "u32", 0.1),
+        "missing_low": (9, "u32", 1),
+    }
+    words = {0: 0x8000, 1: 0x7FFF, 2: 0x8000, 3: 0x8000, 4: 0x0000, 5: 0x7FFF, 6: 0xFFFF,
+             7: 0x8000, 8: 0x0000, 9: 0x0001}
+    assert setmode.decode(words, regs) == {
+        "s16_min": -0x8000,
+        "s16_max": 0x7FFF,
+        "u16": 0x8000,
+        "s32_min": -0x80000000,
+        "s32_max": 0x7FFFFFFF,
+        "u32": pytest.approx(0x80000000 * 0.1),
+    }
+    assert setmode.decode({0: 0xFFFF, 3: 0xFFFF, 4: 0xFFFF}, regs) == {"s16_min": -1, "s32_min": -1}
+
+
+class FakeClient:
+    def __init__(self, refuse=()):
+        self.refuse = refuse
+        self.writes = []
+        self.closed = False
+
+    def write_register(self, address, value, slave):
+        from pymodbus.pdu import ExceptionResponse
+        from pymodbus.register_write_message import WriteSingleRegisterResponse
+
+        self.writes.append((address, value))
+        if address in self.refuse:
+            return ExceptionResponse(6, 2)
+        return WriteSingleRegisterResponse(address, value)
+
+    def close(self):
+        self.closed = True
+
+
+@needs_pymodbus
+def test_set_mode_writes_mode_and_power(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(setmode, "_client", client)
+    setmode.set_mode(2, 1500)
+    assert client.writes == [(setmode.REG_MODE, 2), (setmode.REG_POWER, 1500)]
+    assert not client.closed
+
+
+@needs_pymodbus
+@pytest.mark.parametrize("refused", ("REG_MODE", "REG_POWER"))
+def test_refused_write_raises(monkeypatch, refused):
+    from pymodbus.exceptions import ModbusException
+
+    client = FakeClient(refuse=(getattr(setmode, refused),))
+    monkeypatch.setattr(setmode, "_client", client)
+    with pytest.raises(ModbusException):
+        setmode.set_mode(3, 2000)
+    assert client.closed
+    assert setmode._client is None